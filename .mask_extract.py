@@ -1,52 +1,32 @@
-import os
-import json
-import numpy as np
-import cv2
-import yaml
-
-def create_mask_from_labelme(config):
-    """
-    根据 json标注 的多边形标注生成对应的 mask 图像。
-    
-    :param label_dir: 包含 json 标注文件和对应图像的目录
-    """
-    # 遍历文件夹中的所有文件
-    label_dir = config["ori_img_path"]
-    
-    for filename in os.listdir(label_dir):
-        if filename.endswith('.json'):
-            json_path = os.path.join(label_dir, filename)
+"""
+根据 Labelme 标注中的 '__mask__' 多边形批量生成区域掩码图（多进程并行，图像尺寸取自标注文件，无需读取图像）。
 
-            # 读取标注文件内容
-            with open(json_path, 'r', encoding='utf-8') as f:
-                label_data = json.load(f)
+生成的掩码图可通过 config.yml 中的 mask_dir 供融合流程直接使用，默认读取 config.yml 中的原图路径与 mask_dir、mask_format：
+python .mask_extract.py
+python .mask_extract.py --input ./images --output ./masks --format npz --workers 8
+"""
+import argparse
 
-            # 获取图像的宽和高
-            image_path = os.path.join(label_dir, label_data['imagePath'])
-            image = cv2.imread(image_path)
-            height, width = image.shape[:2]
+import yaml
 
-            # 创建空白的 mask 图像
-            mask = np.zeros((height, width), dtype=np.uint8)
+from utils.mask_extract import MASK_FORMATS, extract_masks
 
-            # 遍历标注中的每个形状
-            for shape in label_data['shapes']:
-                if shape['label'] == '__mask__' and shape['shape_type'] == 'polygon':
-                    points = np.array(shape['points'], dtype=np.int32)
-                    # 在 mask 图像上绘制多边形区域，设置值为 255
-                    cv2.fillPoly(mask, [points], 255)
 
-            # 生成 mask 图像的保存路径
-            mask_image_name = os.path.splitext(label_data['imagePath'])[0] + '_mask' + os.path.splitext(label_data['imagePath'])[1]
-            mask_image_path = os.path.join(label_dir, mask_image_name)
+def parse_opt(config):
+    parser = argparse.ArgumentParser(description='extract __mask__ region masks from Labelme annotations')
+    parser.add_argument('--input', type=str, default=config["ori_img_path"], help='dir of Labelme json files')
+    parser.add_argument('--output', type=str, default=config["mask_dir"] or "masks", help='output dir of masks')
+    parser.add_argument('--format', type=str, default=config["mask_format"], choices=MASK_FORMATS, help='mask file format')
+    parser.add_argument('--workers', type=int, default=config["workers"], help='number of processes, 0 runs in the current process')
+    parser.add_argument('--overwrite', action='store_true', help='regenerate masks that are already up to date')
+    return parser.parse_args()
 
-            # 保存生成的 mask 图像
-            cv2.imwrite(mask_image_path, mask)
-            print(f"Mask image saved at: {mask_image_path}")
 
 if __name__ == "__main__":
     
     with open('config/config.yml', 'r', encoding="utf-8") as file:
             user_config = yaml.safe_load(file)
-            
-    create_mask_from_labelme(user_config)
+
+    opt = parse_opt(user_config)
+    counts = extract_masks(opt.input, opt.output, opt.format, workers=opt.workers, overwrite=opt.overwrite)
+    print("Masks saved in {}: {} written, {} up to date, {} failed.".format(opt.output, counts["written"], counts["skipped"], counts["failed"]))
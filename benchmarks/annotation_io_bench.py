@@ -0,0 +1,87 @@
+"""
+标注 json 读写耗时基准：对各可用的 json 后端统计单个 Labelme 标注文件的读取、写出（缩进与紧凑格式）平均耗时与文件大小。
+
+用法：
+python benchmarks/annotation_io_bench.py --input ./data/ori_img
+python benchmarks/annotation_io_bench.py --synthetic 500 --shapes 50
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from format_trans.annotation_io import JSON_BACKENDS, dump_annotation, dumps, load_annotation
+
+
+def synthetic_annotation(rng, shapes, points):
+    """
+    :return: 返回随机生成的 Labelme 标注内容，包含 shapes 个 points 个顶点的多边形
+    """
+    return {
+        "version": "4.5.6",
+        "flags": {},
+        "shapes": [{"label": rng.choice(["异常堆载", "PoSun", "__mask__"]),
+                    "points": [[rng.uniform(0, 4000), rng.uniform(0, 3000)] for _ in range(points)],
+                    "group_id": None, "shape_type": "polygon", "flags": {}} for _ in range(shapes)],
+        "imagePath": "image_{}.jpg".format(rng.randrange(10 ** 6)),
+        "imageData": None,
+        "imageHeight": 3000,
+        "imageWidth": 4000,
+    }
+
+
+def _per_file_us(fn, items, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            fn(item)
+        best = min(best, time.perf_counter() - start)
+    return best / len(items) * 1e6
+
+
+def run(json_paths, repeat):
+    data = [load_annotation(path, "json") for path in json_paths]
+    backends = [name for name, available in JSON_BACKENDS.items() if available]
+
+    print("{} files, best of {} runs, microseconds per file".format(len(json_paths), repeat))
+    print("{:<8} {:>10} {:>12} {:>12} {:>12} {:>12}".format("backend", "load", "dump", "dump compact", "size", "size compact"))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        out_paths = [os.path.join(tmp_dir, "{}.json".format(i)) for i in range(len(data))]
+        for backend in backends:
+            load_us = _per_file_us(lambda path: load_annotation(path, backend), json_paths, repeat)
+            dump_us = _per_file_us(lambda i: dump_annotation(data[i], out_paths[i], backend=backend), range(len(data)), repeat)
+            compact_us = _per_file_us(lambda i: dump_annotation(data[i], out_paths[i], compact=True, backend=backend), range(len(data)), repeat)
+            size = sum(len(dumps(item, backend=backend)) for item in data) / len(data)
+            compact_size = sum(len(dumps(item, compact=True, backend=backend)) for item in data) / len(data)
+            print("{:<8} {:>10.1f} {:>12.1f} {:>12.1f} {:>11.1f}K {:>11.1f}K".format(
+                backend, load_us, dump_us, compact_us, size / 1024, compact_size / 1024))
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser(description='annotation json I/O benchmark')
+    parser.add_argument('--input', type=str, default=None, help='dir of Labelme json files')
+    parser.add_argument('--synthetic', type=int, default=200, help='number of synthetic files when --input is not given')
+    parser.add_argument('--shapes', type=int, default=30, help='shapes per synthetic file')
+    parser.add_argument('--points', type=int, default=20, help='points per synthetic shape')
+    parser.add_argument('--repeat', type=int, default=5, help='number of runs, the best is reported')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    opt = parse_opt()
+    if opt.input:
+        run([os.path.join(opt.input, name) for name in sorted(os.listdir(opt.input)) if name.endswith('.json')], opt.repeat)
+    else:
+        rng = random.Random(0)
+        with tempfile.TemporaryDirectory() as data_dir:
+            paths = list()
+            for i in range(opt.synthetic):
+                paths.append(os.path.join(data_dir, "{}.json".format(i)))
+                dump_annotation(synthetic_annotation(rng, opt.shapes, opt.points), paths[-1], backend="json")
+            run(paths, opt.repeat)
@@ -0,0 +1,359 @@
+"""
+融合流程热点基准：合成指定规模的 Labelme 原始图像数据集与 AugSamples 抠图样本，分阶段统计单张融合图像的耗时
+（解码、标注读取、掩码生成、放置、合成、编码、写出），以及端到端融合、样本对选择与格式转换的吞吐量和进程峰值内存。
+
+结果可保存为基线，之后与基线对比，任一指标变差超过容差时以非 0 状态退出，便于发现性能回退：
+python benchmarks/fusion_bench.py --width 4000 --height 3000 --save-baseline benchmarks/baseline.json
+python benchmarks/fusion_bench.py --width 4000 --height 3000 --compare benchmarks/baseline.json --tolerance 0.2
+"""
+import os
+import sys
+import time
+import json
+import random
+import shutil
+import argparse
+import tempfile
+from multiprocessing import Process
+
+import numpy as np
+import cv2
+import yaml
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from format_trans.annotation_io import dump_annotation, load_annotation
+from format_trans.engine import convert
+from utils.catalog import build_sample_catalog
+from utils.composite import composite_sample, load_sample_image
+from utils.fusion import iter_images_match_samples, paste_samples_on_image
+from utils.placement import FreeSpace, build_free_space_mask
+from utils.utils import peak_rss_mb
+from utils.writer import encode_image
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 分阶段计时的阶段名称，按融合流程的顺序排列
+STAGES = ("decode", "load_samples", "annotation", "mask_build", "placement", "composite", "encode", "write")
+
+# 抠图样本的增强版本后缀，命名规则见 utils.catalog.parse_sample_file_name
+SAMPLE_VARIANTS = ("none", "r90", "u1.2", "d0.8", "l1.5")
+
+# 合成数据的参数，相同参数的数据可通过 --data-dir 复用
+DATA_PARAMS = ("frames", "width", "height", "mask_coverage", "objects", "classes", "samples_per_class", "sample_min", "sample_max", "seed")
+
+
+def _synthetic_frame(rng: np.random.Generator, height: int, width: int) -> np.ndarray:
+    # 低频纹理加少量噪声，编码耗时接近真实航拍图像而不是纯噪声
+    small = rng.integers(0, 256, (max(height // 64, 2), max(width // 64, 2), 3), dtype=np.uint8)
+    frame = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+    frame = cv2.add(frame, rng.integers(0, 16, (height, width, 3), dtype=np.uint8))
+    return frame
+
+
+def _mask_polygon(rng: np.random.Generator, height: int, width: int, coverage: float):
+    # 面积约为 coverage 的居中四边形，四个顶点随机抖动
+    scale = np.sqrt(coverage)
+    half_w, half_h = width * scale / 2, height * scale / 2
+    cx, cy = width / 2, height / 2
+    jitter = 0.05 * min(width, height)
+    corners = [(-half_w, -half_h), (half_w, -half_h), (half_w, half_h), (-half_w, half_h)]
+    return [[float(np.clip(cx + dx + rng.uniform(-jitter, jitter), 0, width - 1)),
+             float(np.clip(cy + dy + rng.uniform(-jitter, jitter), 0, height - 1))] for dx, dy in corners]
+
+
+def synthesize_dataset(data_dir: str, params: dict):
+    """
+    在 data_dir 下合成 images（原始图像与 Labelme 标注）与 AugSamples（抠图样本）。
+
+    :param data_dir: 输出文件夹
+    :param params: 合成参数，见 DATA_PARAMS
+    """
+    rng = np.random.default_rng(params["seed"])
+    image_dir = os.path.join(data_dir, "images")
+    os.makedirs(image_dir, exist_ok=True)
+
+    width, height = params["width"], params["height"]
+    for i in range(params["frames"]):
+        name = "frame{}.jpg".format(i)
+        encode_image(_synthetic_frame(rng, height, width), "jpg").tofile(os.path.join(image_dir, name))
+
+        shapes = list()
+        if params["mask_coverage"] < 1:
+            shapes.append({"label": "__mask__", "points": _mask_polygon(rng, height, width, params["mask_coverage"]),
+                           "group_id": None, "shape_type": "polygon", "flags": {}})
+        for _ in range(params["objects"]):
+            w, h = int(rng.integers(20, max(21, width // 20))), int(rng.integers(20, max(21, height // 20)))
+            x, y = int(rng.integers(0, width - w)), int(rng.integers(0, height - h))
+            shapes.append({"label": "object", "points": [[x, y], [x + w, y + h]], "group_id": None, "shape_type": "rectangle", "flags": {}})
+        dump_annotation({"version": "5.0", "flags": {}, "shapes": shapes, "imagePath": name, "imageData": None,
+                         "imageHeight": height, "imageWidth": width}, os.path.join(image_dir, "frame{}.json".format(i)))
+
+    for c in range(params["classes"]):
+        class_name = "class{}".format(c)
+        class_dir = os.path.join(data_dir, "AugSamples", class_name)
+        os.makedirs(class_dir, exist_ok=True)
+        for s in range(1, params["samples_per_class"] + 1):
+            for variant in SAMPLE_VARIANTS:
+                h, w = (int(v) for v in rng.integers(params["sample_min"], params["sample_max"] + 1, 2))
+                sample = np.zeros((h, w, 4), dtype=np.uint8)
+                sample[:, :, :3] = rng.integers(1, 256, (h, w, 3), dtype=np.uint8)
+                # 椭圆只画在 alpha 通道上，保留椭圆内的随机纹理
+                alpha = np.zeros((h, w), dtype=np.uint8)
+                cv2.ellipse(alpha, (w // 2, h // 2), (max(w // 2 - 1, 1), max(h // 2 - 1, 1)), 0, 0, 360, 255, -1)
+                sample[:, :, 3] = alpha
+                sample[:, :, :3][sample[:, :, 3] == 0] = 0
+                cv2.imencode(".png", sample)[1].tofile(os.path.join(class_dir, "{}_{}_{}.png".format(class_name, s, variant)))
+
+    with open(os.path.join(data_dir, "params.json"), "w", encoding="utf-8") as f:
+        json.dump({key: params[key] for key in DATA_PARAMS}, f)
+
+
+def prepare_data(data_dir: str, params: dict):
+    """
+    准备合成数据：data_dir 中已有相同参数的数据时直接复用，否则重新合成。
+    合成在子进程中进行，不计入基准进程的峰值内存。
+    """
+    params_path = os.path.join(data_dir, "params.json")
+    if os.path.isfile(params_path):
+        with open(params_path, "r", encoding="utf-8") as f:
+            if json.load(f) == {key: params[key] for key in DATA_PARAMS}:
+                return
+        shutil.rmtree(os.path.join(data_dir, "images"), ignore_errors=True)
+        shutil.rmtree(os.path.join(data_dir, "AugSamples"), ignore_errors=True)
+
+    process = Process(target=synthesize_dataset, args=(data_dir, params))
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise RuntimeError("Failed to synthesize benchmark data in {}".format(data_dir))
+
+
+def load_config(params: dict, data_dir: str) -> dict:
+    """
+    读取仓库的 config/config.yml，并将路径与样本数量替换为基准参数。
+    """
+    with open(os.path.join(REPO_ROOT, "config", "config.yml"), "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    config.update({"samples_path": os.path.join(data_dir, "AugSamples"), "ori_img_path": os.path.join(data_dir, "images"),
+                   "sample_min_nums_at_one_image": params["samples_per_image"], "without_need_aug_sample_class": [],
+                   "blend_mode": params["blend_mode"], "placement_mode": params["placement_mode"]})
+    return config
+
+
+def _pairs(config, count, seed):
+    image_files = sorted(name for name in os.listdir(config["ori_img_path"]) if name.endswith(".jpg"))
+    catalog = build_sample_catalog(config["samples_path"])
+    samples = sorted(sample_id for samples in catalog.values() for sample_id in samples)
+    return list(iter_images_match_samples(image_files, samples, config, catalog=catalog, count=count, rng=random.Random(seed)))
+
+
+def _sample_paths(config, sample_files):
+    return [os.path.join(config["samples_path"], sample_file.split("_")[0], sample_file) for sample_file in sample_files]
+
+
+def bench_stages(config, pairs, output_dir, rng: np.random.Generator) -> dict:
+    """
+    按 paste_samples_on_image 的处理顺序分阶段计时。
+
+    :return: 返回各阶段每张图像的平均耗时（毫秒）、放置成功率
+    """
+    totals = dict.fromkeys(STAGES, 0.0)
+    placed = attempted = 0
+
+    for i, pair in enumerate(pairs):
+        image_file, sample_files = next(iter(pair.items()))
+        image_path = os.path.join(config["ori_img_path"], image_file)
+
+        start = time.perf_counter()
+        image = cv2.imdecode(np.fromfile(image_path, dtype=np.uint8), -1)
+        totals["decode"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        samples = [load_sample_image(path) for path in _sample_paths(config, sample_files)]
+        totals["load_samples"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        annotation = load_annotation(os.path.splitext(image_path)[0] + ".json")
+        totals["annotation"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        free_space = FreeSpace(build_free_space_mask(annotation, image.shape[0], image.shape[1]), config["placement_grid"])
+        totals["mask_build"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        if config["placement_mode"] == "packed":
+            positions = free_space.plan([sample_image.shape[:2] for sample_image, _ in samples], rng)
+        else:
+            positions = [free_space.place(sample_image.shape[0], sample_image.shape[1], rng) for sample_image, _ in samples]
+        totals["placement"] += time.perf_counter() - start
+
+        for (sample_image, sample_alpha), position in zip(samples, positions):
+            attempted += 1
+            if position is None:
+                continue
+            placed += 1
+
+            start = time.perf_counter()
+            composite_sample(image, sample_image, sample_alpha, position[0], position[1], config["blend_mode"], config["feather_radius"])
+            totals["composite"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        buffer = encode_image(image, config["image_format"], config["image_quality"], config["png_compression"])
+        totals["encode"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        buffer.tofile(os.path.join(output_dir, "stage{}.jpg".format(i)))
+        dump_annotation(annotation, os.path.join(output_dir, "stage{}.json".format(i)), compact=config["compact_json"])
+        totals["write"] += time.perf_counter() - start
+
+    metrics = {"{}_ms".format(stage): total / len(pairs) * 1000 for stage, total in totals.items()}
+    metrics["placement_success_rate"] = placed / attempted if attempted else 1.0
+    return metrics
+
+
+def bench_end_to_end(config, pairs, output_dir, rng: np.random.Generator) -> float:
+    """
+    :return: 返回端到端融合（paste_samples_on_image、编码与写出）的吞吐量（张/秒）
+    """
+    start = time.perf_counter()
+    for i, pair in enumerate(pairs):
+        image_file, sample_files = next(iter(pair.items()))
+        image, annotation = paste_samples_on_image(os.path.join(config["ori_img_path"], image_file), _sample_paths(config, sample_files),
+                                                   blend_mode=config["blend_mode"], feather_radius=config["feather_radius"],
+                                                   rng=rng, placement_grid=config["placement_grid"], placement_mode=config["placement_mode"])
+        encode_image(image, config["image_format"], config["image_quality"], config["png_compression"]).tofile(
+            os.path.join(output_dir, "fused{}.jpg".format(i)))
+        dump_annotation(annotation, os.path.join(output_dir, "fused{}.json".format(i)), compact=config["compact_json"])
+    return len(pairs) / (time.perf_counter() - start)
+
+
+def bench_pairing(config, count, seed) -> float:
+    """
+    :return: 返回原始图像与抠图样本对的选择吞吐量（对/秒），包括建立样本索引
+    """
+    start = time.perf_counter()
+    _pairs(config, count, seed)
+    return count / (time.perf_counter() - start)
+
+
+def bench_convert(config, output_dir) -> dict:
+    """
+    :return: 返回 labelme 转 yolo、labelme 转 coco 的吞吐量（文件/秒），在当前进程中串行转换
+    """
+    metrics = dict()
+    frames = len([name for name in os.listdir(config["ori_img_path"]) if name.endswith(".json")])
+    for dst, output in (("yolo", os.path.join(output_dir, "yolo")), ("coco", os.path.join(output_dir, "coco.json"))):
+        start = time.perf_counter()
+        convert("labelme", dst, config["ori_img_path"], output, classes=["object"], workers=0)
+        metrics["convert_{}_files_per_sec".format(dst)] = frames / (time.perf_counter() - start)
+    return metrics
+
+
+def compare_metrics(metrics: dict, baseline: dict, tolerance: float) -> list:
+    """
+    与基线对比：*_ms 越小越好，*_per_sec 与 *_rate 越大越好，peak_rss_mb 越小越好。
+
+    :return: 返回变差超过容差的 (指标名称, 基线值, 当前值) 列表
+    """
+    regressions = list()
+    for name, base in baseline.items():
+        value = metrics.get(name)
+        if value is None or not base:
+            continue
+        if name.endswith("_per_sec") or name.endswith("_rate"):
+            worse = value < base * (1 - tolerance)
+        else:
+            worse = value > base * (1 + tolerance)
+        if worse:
+            regressions.append((name, base, value))
+    return regressions
+
+
+def run(opt) -> dict:
+    params = vars(opt)
+    data_dir = opt.data_dir or tempfile.mkdtemp(prefix="fusion_bench_")
+    output_dir = tempfile.mkdtemp(prefix="fusion_bench_out_")
+    try:
+        prepare_data(data_dir, params)
+        config = load_config(params, data_dir)
+        pairs = _pairs(config, opt.iterations, opt.seed)
+
+        # 预热：首次调用的库初始化与文件系统缓存不计入结果
+        bench_stages(config, pairs[:1], output_dir, np.random.default_rng(opt.seed))
+
+        metrics = bench_stages(config, pairs, output_dir, np.random.default_rng(opt.seed))
+        metrics["fusion_images_per_sec"] = bench_end_to_end(config, pairs, output_dir, np.random.default_rng(opt.seed))
+        metrics["pairing_pairs_per_sec"] = bench_pairing(config, opt.pairs, opt.seed)
+        metrics.update(bench_convert(config, output_dir))
+        metrics["peak_rss_mb"] = peak_rss_mb()
+        return {"params": {key: value for key, value in params.items() if key not in ("data_dir", "save_baseline", "compare", "tolerance")},
+                "metrics": metrics}
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        if not opt.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def print_report(result: dict, baseline: dict = None):
+    params = result["params"]
+    print("{frames} frames {width}x{height}, mask coverage {mask_coverage}, {samples_per_image} samples/image "
+          "({sample_min}-{sample_max} px), blend {blend_mode}, placement {placement_mode}, {iterations} iterations".format(**params))
+    print("{:<32} {:>14} {:>14}".format("metric", "value", "baseline" if baseline else ""))
+    for name, value in result["metrics"].items():
+        base = baseline.get(name) if baseline else None
+        print("{:<32} {:>14.3f} {:>14}".format(name, value if value is not None else float("nan"),
+                                               "{:.3f}".format(base) if base is not None else ""))
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser(description='fusion hot path benchmark')
+    parser.add_argument('--frames', type=int, default=10, help='number of synthetic frames')
+    parser.add_argument('--width', type=int, default=1920, help='frame width')
+    parser.add_argument('--height', type=int, default=1080, help='frame height')
+    parser.add_argument('--mask-coverage', type=float, default=0.6, help='fraction of the frame covered by __mask__, 1 means no __mask__')
+    parser.add_argument('--objects', type=int, default=5, help='existing objects per frame')
+    parser.add_argument('--classes', type=int, default=3, help='number of sample classes')
+    parser.add_argument('--samples-per-class', type=int, default=10, help='samples per class, each with all variants')
+    parser.add_argument('--sample-min', type=int, default=40, help='minimum sample side length')
+    parser.add_argument('--sample-max', type=int, default=160, help='maximum sample side length')
+    parser.add_argument('--samples-per-image', type=int, default=2, help='samples pasted on each frame')
+    parser.add_argument('--blend-mode', type=str, default='mask', help='blend mode, see utils.composite.BLEND_MODES')
+    parser.add_argument('--placement-mode', type=str, default='greedy', help='placement mode, see utils.placement.PLACEMENT_MODES')
+    parser.add_argument('--iterations', type=int, default=30, help='number of fused images timed')
+    parser.add_argument('--pairs', type=int, default=10000, help='number of pairs timed for pairing')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of data synthesis and fusion')
+    parser.add_argument('--data-dir', type=str, default=None, help='keep synthetic data here and reuse it across runs')
+    parser.add_argument('--save-baseline', type=str, default=None, help='save the results as a baseline json')
+    parser.add_argument('--compare', type=str, default=None, help='baseline json to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression when comparing')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    opt = parse_opt()
+    result = run(opt)
+
+    baseline = None
+    if opt.compare:
+        with open(opt.compare, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+        if stored["params"] != result["params"]:
+            print("Warning: baseline was recorded with different parameters: {}".format(stored["params"]))
+        baseline = stored["metrics"]
+
+    print_report(result, baseline)
+
+    if opt.save_baseline:
+        with open(opt.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=4)
+        print("Baseline saved to {}".format(opt.save_baseline))
+
+    if baseline is not None:
+        regressions = compare_metrics(result["metrics"], baseline, opt.tolerance)
+        for name, base, value in regressions:
+            print("Regression: {} {:.3f} -> {:.3f}".format(name, base, value))
+        if regressions:
+            sys.exit(1)
+        print("No regressions beyond {:.0%}.".format(opt.tolerance))
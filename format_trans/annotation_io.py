@@ -0,0 +1,104 @@
+"""
+Labelme 等标注 json 文件的读写：安装了 orjson 或 ujson 时使用其解析与序列化，否则使用标准库 json。
+"""
+import json
+import codecs
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+# json 后端名称 -> 是否可用，按优先顺序排列
+JSON_BACKENDS = {"orjson": orjson is not None, "ujson": ujson is not None, "json": True}
+
+# 默认使用的 json 后端
+JSON_BACKEND = next(name for name, available in JSON_BACKENDS.items() if available)
+
+
+def _to_builtin(obj):
+    # numpy 数组与标量等类型转换为 json 可序列化的内置类型
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError("Object of type {} is not JSON serializable".format(type(obj).__name__))
+
+
+def _backend(backend):
+    backend = backend or JSON_BACKEND
+    if not JSON_BACKENDS.get(backend):
+        raise ValueError("JSON backend {} is not available, expected one of {}".format(
+            backend, ", ".join(name for name, available in JSON_BACKENDS.items() if available)))
+    return backend
+
+
+def loads(data, backend=None):
+    """
+    解析 json 内容。
+
+    :param data: json 字符串或 utf-8 字节串
+    :param backend: json 后端（可选），默认为 JSON_BACKEND
+    """
+    backend = _backend(backend)
+    if backend == "orjson":
+        return orjson.loads(data)
+    if backend == "ujson":
+        return ujson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj, compact=False, indent=4, backend=None) -> bytes:
+    """
+    序列化为 utf-8 编码的 json 字节串，非 ASCII 字符（如中文类别名称）不转义。
+
+    :param obj: 待序列化的对象，可包含 numpy 数组与标量
+    :param compact: 是否输出紧凑格式（无缩进与多余空格），文件更小、写出更快
+    :param indent: 非紧凑格式的缩进空格数；orjson 只支持 2 个空格缩进，其他缩进改用标准库 json，保证输出与安装的后端无关
+    :param backend: json 后端（可选），默认为 JSON_BACKEND
+    """
+    backend = _backend(backend)
+    if backend == "orjson" and (compact or indent == 2):
+        # numpy 类型同样经 _to_builtin 转换（不使用 OPT_SERIALIZE_NUMPY），float32 的输出与标准库 json 一致
+        option = 0 if compact else orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=_to_builtin, option=option)
+    if backend == "ujson":
+        return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False, indent=0 if compact else indent,
+                           default=_to_builtin).encode("utf-8")
+    if compact:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_to_builtin).encode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, indent=indent, default=_to_builtin).encode("utf-8")
+
+
+def load_annotation(json_path, backend=None):
+    """
+    读取标注 json 文件。
+
+    :param json_path: 标注文件路径
+    :param backend: json 后端（可选），默认为 JSON_BACKEND
+    :return: 返回标注内容
+    """
+    with open(json_path, 'rb') as f:
+        data = f.read()
+    # 去掉 Windows 下部分工具写出的 BOM
+    if data.startswith(codecs.BOM_UTF8):
+        data = data[len(codecs.BOM_UTF8):]
+    return loads(data, backend)
+
+
+def dump_annotation(data, json_path, compact=False, indent=4, backend=None):
+    """
+    写出标注 json 文件（utf-8 编码）。
+
+    :param data: 标注内容
+    :param json_path: 输出文件路径
+    :param compact: 是否输出紧凑格式，见 dumps
+    :param indent: 非紧凑格式的缩进空格数，见 dumps
+    :param backend: json 后端（可选），默认为 JSON_BACKEND
+    """
+    with open(json_path, 'wb') as f:
+        f.write(dumps(data, compact, indent, backend))
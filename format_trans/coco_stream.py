@@ -0,0 +1,291 @@
+import os
+import json
+import shutil
+import tempfile
+
+
+def coco_categories(classlist, supercategory='beverage'):
+    """
+    建立类别标签和数字id的对应关系，id 从1开始（与 voc2coco.py 相同）。
+    """
+    return [{'id': i, 'name': cls, 'supercategory': supercategory} for i, cls in enumerate(classlist, 1)]
+
+
+def _polygon_area(points):
+    # 鞋带公式计算多边形面积
+    area = 0.0
+    for (x1, y1), (x2, y2) in zip(points, points[1:] + points[:1]):
+        area += x1 * y2 - x2 * y1
+    return abs(area) / 2.0
+
+
+def labelme_to_coco_objects(data, classlist):
+    """
+    将 LabelMe 标注内容中的目标转换为 COCO 标注（不含 id 与 image_id）。
+
+    矩形的 segmentation 为从左上角点按顺时针的四个顶点（与 voc2coco.py 相同），多边形为其全部顶点。
+
+    :param data: LabelMe 标注内容
+    :param classlist: 类别名称列表，类别 id 按列表顺序从1开始，不在列表中的目标不输出
+    :return: 返回 COCO 标注字典列表，包含 area、bbox、category_id、iscrowd、segmentation
+    """
+    objects = list()
+    for shape in data['shapes']:
+        if shape['label'] not in classlist:
+            continue
+
+        points = [[float(x), float(y)] for x, y in shape['points']]
+        x1 = min(x for x, _ in points)
+        y1 = min(y for _, y in points)
+        x2 = max(x for x, _ in points)
+        y2 = max(y for _, y in points)
+        width = max(0.0, x2 - x1)
+        height = max(0.0, y2 - y1)
+
+        if shape.get('shape_type', 'polygon') == 'polygon' and len(points) > 2:
+            segmentation = [[coord for point in points for coord in point]]
+            area = _polygon_area(points)
+        else:
+            segmentation = [[x1, y1, x2, y1, x2, y2, x1, y2]]
+            area = width * height
+
+        objects.append({
+            'area': area,
+            'bbox': [x1, y1, width, height],
+            'category_id': classlist.index(shape['label']) + 1,
+            'iscrowd': 0,
+            'segmentation': segmentation,
+        })
+
+    return objects
+
+
+class CocoStreamWriter:
+    """
+    流式写出 COCO 标注文件：images 逐条写入目标文件，annotations 逐条写入临时文件，close 时拼接为一个 json 文件，
+    内存占用与图像数量无关。写出过程中的文件为 json_path + '.tmp'，完成后才替换为 json_path；
+    with 语句块因异常退出时调用 abort，不会留下看似完整的截断文件。
+    """
+
+    def __init__(self, json_path, categories, first_annotation_id=1):
+        """
+        :param json_path: 输出的 COCO json 文件路径
+        :param categories: 类别列表，见 coco_categories
+        :param first_annotation_id: 第一条标注的 id
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(json_path)), exist_ok=True)
+        self.json_path = json_path
+        self.file = open(json_path + '.tmp', 'w', encoding='utf-8')
+        self.annotations_file = tempfile.TemporaryFile('w+', encoding='utf-8', dir=os.path.dirname(os.path.abspath(json_path)))
+        self.image_count = 0
+        self.annotation_count = 0
+        self.next_annotation_id = first_annotation_id
+
+        self.file.write('{"categories": ' + json.dumps(categories, ensure_ascii=False) + ', "images": [')
+
+    def add_image(self, file_name, width, height, image_id=None):
+        """
+        写入一张图像的信息。
+
+        :param image_id: 图像 id（可选），默认按写入顺序从0开始编号（与 voc2coco.py 相同）
+        :return: 返回图像 id
+        """
+        if image_id is None:
+            image_id = self.image_count
+        self.file.write((', ' if self.image_count else '') + json.dumps({'file_name': file_name, 'id': image_id, 'width': width, 'height': height}, ensure_ascii=False))
+        self.image_count += 1
+        return image_id
+
+    def add_annotation(self, image_id, annotation):
+        """
+        写入一条标注，标注 id 从 first_annotation_id 开始自动编号（默认从1开始，与 voc2coco.py 相同）。
+
+        :param image_id: add_image 返回的图像 id
+        :param annotation: COCO 标注字典，包含 area、bbox、category_id、iscrowd、segmentation
+        :return: 返回标注 id
+        """
+        annotation_id = self.next_annotation_id
+        record = dict(annotation, id=annotation_id, image_id=image_id)
+        self.annotations_file.write((', ' if self.annotation_count else '') + json.dumps(record, ensure_ascii=False))
+        self.annotation_count += 1
+        self.next_annotation_id += 1
+        return annotation_id
+
+    def add_labelme(self, file_name, data, classlist):
+        """
+        写入一张图像及其 LabelMe 标注中的目标。
+
+        :param file_name: 图像文件名
+        :param data: LabelMe 标注内容，需包含 imageWidth、imageHeight、shapes
+        :param classlist: 类别名称列表，见 labelme_to_coco_objects
+        :return: 返回图像 id
+        """
+        image_id = self.add_image(file_name, data['imageWidth'], data['imageHeight'])
+        for annotation in labelme_to_coco_objects(data, classlist):
+            self.add_annotation(image_id, annotation)
+        return image_id
+
+    def close(self):
+        self.file.write('], "annotations": [')
+        self.annotations_file.seek(0)
+        shutil.copyfileobj(self.annotations_file, self.file)
+        self.annotations_file.close()
+        self.file.write(']}')
+        self.file.close()
+        os.replace(self.json_path + '.tmp', self.json_path)
+
+    def abort(self):
+        """
+        放弃写出：关闭临时文件并删除未完成的输出，json_path 保持不变。
+        """
+        self.annotations_file.close()
+        self.file.close()
+        if os.path.exists(self.json_path + '.tmp'):
+            os.remove(self.json_path + '.tmp')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+class _JsonStream:
+    """
+    按块读取 json 文件的游标，逐个解析值，缓冲区只保留尚未解析的内容。
+    """
+
+    def __init__(self, file, chunk_size):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        # 跳过空白字符，返回下一个字符，文件结束时返回空字符串
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self._fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError("Malformed COCO json: expected {!r} at {!r}".format(char, self.buffer[self.pos:self.pos + 20]))
+        self.pos += 1
+
+    def value(self):
+        # 解析一个完整的值；值到达缓冲区末尾时（可能是被截断的数字）读取更多内容后重新解析
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def items(self):
+        # 逐个生成数组中的元素
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ',':
+                self.pos += 1
+            else:
+                self.expect(']')
+                return
+
+
+def iter_coco_array(json_path, key, chunk_size=1 << 20):
+    """
+    流式读取 COCO json 文件中的顶层数组（如 images、annotations），逐个生成元素，内存占用与数组长度无关。
+
+    :param json_path: COCO json 文件路径
+    :param key: 顶层数组的键名
+    :param chunk_size: 每次读取的字符数
+    """
+    with open(json_path, 'r', encoding='utf-8') as f:
+        stream = _JsonStream(f, chunk_size)
+        stream.expect('{')
+        while stream.peek() != '}':
+            name = stream.value()
+            stream.expect(':')
+            if name == key:
+                yield from stream.items()
+                return
+            # 跳过其他键的值，数组逐个元素解析后丢弃
+            if stream.peek() == '[':
+                for _ in stream.items():
+                    pass
+            else:
+                stream.value()
+            if stream.peek() == ',':
+                stream.pos += 1
+
+
+def read_coco_categories(json_path):
+    """
+    :return: 返回 COCO json 文件中的类别列表
+    """
+    return list(iter_coco_array(json_path, 'categories'))
+
+
+def iter_coco_images(json_path, chunk_size=1 << 20):
+    """
+    流式读取 COCO json 文件，按 images 的顺序逐张生成 (图像信息, 该图像的标注列表)。
+
+    annotations 与 images 顺序一致时（CocoStreamWriter、voc2coco.py 等按图像依次写出的文件）两个数组同时流式读取，
+    只需保存图像 id 的顺序；否则（包括标注引用了不存在的图像 id）需要按图像 id 汇总全部标注，不存在的图像的标注被忽略。
+
+    :param json_path: COCO json 文件路径
+    :param chunk_size: 每次读取的字符数
+    """
+    # 第一遍只读取图像 id 检查标注的顺序
+    image_order = {image['id']: i for i, image in enumerate(iter_coco_array(json_path, 'images', chunk_size))}
+    last = -1
+    ordered = True
+    for annotation in iter_coco_array(json_path, 'annotations', chunk_size):
+        order = image_order.get(annotation['image_id'])
+        if order is None or order < last:
+            ordered = False
+            break
+        last = order
+    del image_order
+
+    annotations = iter_coco_array(json_path, 'annotations', chunk_size)
+    if not ordered:
+        grouped = dict()
+        for annotation in annotations:
+            grouped.setdefault(annotation['image_id'], []).append(annotation)
+        for image in iter_coco_array(json_path, 'images', chunk_size):
+            yield image, grouped.pop(image['id'], [])
+        return
+
+    pending = next(annotations, None)
+    for image in iter_coco_array(json_path, 'images', chunk_size):
+        image_annotations = list()
+        while pending is not None and pending['image_id'] == image['id']:
+            image_annotations.append(pending)
+            pending = next(annotations, None)
+        yield image, image_annotations
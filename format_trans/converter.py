@@ -1,10 +1,14 @@
 import os
-import json
 
-def convert_labelme_to_custom(labelme_file, output_folder):
-    with open(labelme_file, 'r') as f:
-        labelme_data = json.load(f)
+try:
+    from format_trans.annotation_io import load_annotation, dump_annotation
+except ImportError:  # 在 format_trans 文件夹中直接运行脚本
+    from annotation_io import load_annotation, dump_annotation
 
+def labelme_to_custom(labelme_data):
+    """
+    将 LabelMe 标注内容转换为数据堂平台格式。
+    """
     custom_data = {
         "qualityResult": {"features": [], "type": "FeatureCollection"},
         "workload": {"tagCount1": len(labelme_data['shapes']), "qualifiedCount": 0,
@@ -29,7 +33,7 @@ def convert_labelme_to_custom(labelme_file, output_folder):
                     "id": idx+1,
                     "objectId": idx+1,
                     "content": {"label": [shape['label']]},
-                    "labelColor": shape['fill_color'],
+                    "labelColor": shape.get('fill_color'),
                     "quality": {}
                 }
             }
@@ -48,20 +52,26 @@ def convert_labelme_to_custom(labelme_file, output_folder):
                     "id": idx+1,
                     "objectId": idx+1,
                     "content": {"label": [shape['label']]},
-                    "labelColor": shape['fill_color'],
+                    "labelColor": shape.get('fill_color'),
                     "quality": {}
                 }
             }
         custom_data['markResult']['features'].append(feature)
 
-    output_file = os.path.join(output_folder, os.path.basename(labelme_file))
-    with open(output_file, 'w') as f:
-        json.dump(custom_data, f, indent=2)
+    return custom_data
 
-def convert_custom_to_labelme(custom_file, output_folder):
-    with open(custom_file, 'r') as f:
-        custom_data = json.load(f)
+def convert_labelme_to_custom(labelme_file, output_folder):
+    labelme_data = load_annotation(labelme_file)
+
+    custom_data = labelme_to_custom(labelme_data)
 
+    output_file = os.path.join(output_folder, os.path.basename(labelme_file))
+    dump_annotation(custom_data, output_file, indent=2)
+
+def custom_to_labelme(custom_data):
+    """
+    将数据堂平台格式转换为 LabelMe 标注内容。
+    """
     labelme_data = {
         "version": "3.14.2",
         "flags": {},
@@ -103,9 +113,15 @@ def convert_custom_to_labelme(custom_file, output_folder):
             }
             labelme_data['shapes'].append(shape)
 
+    return labelme_data
+
+def convert_custom_to_labelme(custom_file, output_folder):
+    custom_data = load_annotation(custom_file)
+
+    labelme_data = custom_to_labelme(custom_data)
+
     output_file = os.path.join(output_folder, os.path.basename(custom_file))
-    with open(output_file, 'w') as f:
-        json.dump(labelme_data, f, indent=2)
+    dump_annotation(labelme_data, output_file, indent=2)
   
         
 if __name__ == "__main__":
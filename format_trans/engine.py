@@ -0,0 +1,328 @@
+"""
+标注格式转换引擎：各格式的读取器将标注文件读取为统一的内存标注模型（LabelMe 标注字典，包含 imagePath、imageWidth、
+imageHeight、shapes），写出器再将其写出为目标格式，任意两种格式之间均可转换。逐文件的转换由进程池并行执行。
+
+命令行用法示例：
+python format_trans/engine.py --src voc --dst yolo --input ./xml --output ./txt --classes PoSun,DiaoKuai --workers 8
+python format_trans/engine.py --src labelme --dst coco --input ./json --output ./instances_train.json --classes PoSun,DiaoKuai
+python format_trans/engine.py --src yolo --dst labelme --input ./txt --images ./images --output ./json --classes PoSun,DiaoKuai
+"""
+import os
+import sys
+import argparse
+from collections import Counter
+from multiprocessing import Pool
+
+from tqdm import tqdm
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from json2xml import labelme_to_voc
+from xml2json import voc_to_labelme
+from json2txt_bbox import labelme_to_yolo_lines
+from json2txt_seg import labelme_to_yolo_seg_lines
+from converter import labelme_to_custom, custom_to_labelme
+from coco_stream import CocoStreamWriter, coco_categories, iter_coco_images, read_coco_categories
+from image_size import image_size
+from annotation_io import load_annotation, dump_annotation
+
+
+# 按文件名查找图像时尝试的扩展名
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp", ".JPG", ".JPEG", ".PNG")
+
+
+def find_image(image_dir, stem):
+    """
+    :return: 返回 image_dir 中文件名为 stem 的图像路径，找不到时抛出 FileNotFoundError
+    """
+    for extension in IMAGE_EXTENSIONS:
+        image_path = os.path.join(image_dir, stem + extension)
+        if os.path.isfile(image_path):
+            return image_path
+    raise FileNotFoundError("No image named {} in {}".format(stem, image_dir))
+
+
+def _shape(label, points, shape_type):
+    return {"label": label, "points": points, "group_id": None, "shape_type": shape_type, "flags": {}}
+
+
+def _labelme(image_path, width, height, shapes):
+    return {"version": "4.5.6", "flags": {}, "shapes": shapes, "imagePath": image_path, "imageData": None,
+            "imageHeight": height, "imageWidth": width}
+
+
+def _class_name(classes, index):
+    # 未提供类别名称列表或序号超出列表时以序号作为类别名称
+    return classes[index] if classes and 0 <= index < len(classes) else str(index)
+
+
+def _require_classes(options, fmt):
+    if not options["classes"]:
+        raise ValueError("--classes is required for {} format".format(fmt))
+    return options["classes"]
+
+
+# ---------------- 读取器：标注文件 -> LabelMe 标注字典 ----------------
+
+def read_labelme(path, options):
+    return load_annotation(path)
+
+
+def read_voc(path, options):
+    return voc_to_labelme(path)
+
+
+def read_custom(path, options):
+    custom_data = load_annotation(path)
+    # 数据堂平台格式的 info 中可能没有图像文件名，此时按标注文件名推断
+    custom_data['info'].setdefault('imagePath', os.path.splitext(os.path.basename(path))[0] + options["image_ext"])
+    return custom_to_labelme(custom_data)
+
+
+def read_yolo(path, options):
+    """
+    读取 YOLO 目标检测（类别序号 xc yc w h）或分割（类别序号 x1 y1 x2 y2 ...）格式的 txt 文件，
+    归一化坐标需要图像尺寸，图像按 txt 文件名在 --images 文件夹中查找。
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    image_path = find_image(options["image_dir"] or os.path.dirname(path), stem)
+    width, height = image_size(image_path)
+
+    shapes = list()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            values = line.split()
+            if not values:
+                continue
+            label = _class_name(options["classes"], int(values[0]))
+            coords = [float(value) for value in values[1:]]
+            if len(coords) == 4:
+                xc, yc, w, h = coords
+                shapes.append(_shape(label, [[(xc - w / 2) * width, (yc - h / 2) * height],
+                                             [(xc + w / 2) * width, (yc + h / 2) * height]], "rectangle"))
+            else:
+                shapes.append(_shape(label, [[x * width, y * height] for x, y in zip(coords[0::2], coords[1::2])], "polygon"))
+
+    return _labelme(os.path.basename(image_path), width, height, shapes)
+
+
+def _is_bbox_segmentation(polygon, bbox) -> bool:
+    # 四个顶点与 bbox 的四个角点一一对应（矩形写出为 COCO 时的 segmentation），而不是任意四边形
+    x, y, w, h = bbox
+    corners = {(round(float(px), 2), round(float(py), 2)) for px, py in zip(polygon[0::2], polygon[1::2])}
+    return len(polygon) == 8 and corners == {(round(float(cx), 2), round(float(cy), 2)) for cx in (x, x + w) for cy in (y, y + h)}
+
+
+def iter_coco(path, options):
+    """
+    流式读取 COCO 标注文件，逐张图像生成 LabelMe 标注字典；有多边形 segmentation 的目标为多边形，
+    segmentation 只是 bbox 的四个角点或没有多边形 segmentation 时为 bbox 矩形。
+    """
+    categories = {category['id']: category['name'] for category in read_coco_categories(path)}
+
+    for image, annotations in iter_coco_images(path):
+        shapes = list()
+        for annotation in annotations:
+            label = categories.get(annotation['category_id'], str(annotation['category_id']))
+            segmentation = annotation.get('segmentation')
+            if isinstance(segmentation, list) and segmentation and len(segmentation[0]) >= 6 \
+                    and not _is_bbox_segmentation(segmentation[0], annotation['bbox']):
+                polygon = segmentation[0]
+                shapes.append(_shape(label, [[x, y] for x, y in zip(polygon[0::2], polygon[1::2])], "polygon"))
+            else:
+                x, y, w, h = annotation['bbox']
+                shapes.append(_shape(label, [[x, y], [x + w, y + h]], "rectangle"))
+        yield _labelme(image['file_name'], image['width'], image['height'], shapes)
+
+
+# ---------------- 写出器：LabelMe 标注字典 -> 标注文件 ----------------
+
+def write_labelme(data, path, options):
+    dump_annotation(data, path, compact=options["compact"])
+
+
+def write_voc(data, path, options):
+    labelme_to_voc(data).write(path)
+
+
+def write_custom(data, path, options):
+    custom_data = labelme_to_custom(data)
+    custom_data['info']['imagePath'] = data['imagePath']
+    dump_annotation(custom_data, path, compact=options["compact"], indent=2)
+
+
+def write_yolo(data, path, options):
+    classes = _require_classes(options, "yolo")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(labelme_to_yolo_lines(data, {name: i for i, name in enumerate(classes)}))
+
+
+def write_yolo_seg(data, path, options):
+    classes = _require_classes(options, "yolo-seg")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(labelme_to_yolo_seg_lines(data, classes))
+
+
+# 逐文件读取的格式 -> (标注文件扩展名, 读取器)
+READERS = {
+    "labelme": (".json", read_labelme),
+    "voc": (".xml", read_voc),
+    "yolo": (".txt", read_yolo),
+    "custom": (".json", read_custom),
+}
+
+# 逐文件写出的格式 -> (标注文件扩展名, 写出器)
+WRITERS = {
+    "labelme": (".json", write_labelme),
+    "voc": (".xml", write_voc),
+    "yolo": (".txt", write_yolo),
+    "yolo-seg": (".txt", write_yolo_seg),
+    "custom": (".json", write_custom),
+}
+
+# coco 为整个数据集一个标注文件，读取时在主进程中逐张图像生成，写出时在主进程中流式写出
+SOURCE_FORMATS = tuple(READERS) + ("coco",)
+TARGET_FORMATS = tuple(WRITERS) + ("coco",)
+
+
+# ---------------- 并行转换 ----------------
+
+_worker_options = None
+
+
+def _init_worker(options):
+    global _worker_options
+    _worker_options = options
+
+
+def _output_path(data, input_path, options):
+    # 输出文件与输入文件同名（coco 输入时与图像同名），扩展名换为目标格式的扩展名
+    stem = os.path.splitext(os.path.basename(input_path or data['imagePath']))[0]
+    return os.path.join(options["output"], stem + WRITERS[options["dst"]][0])
+
+
+def _convert_file(input_path):
+    # 逐文件转换：读取并写出
+    try:
+        data = READERS[_worker_options["src"]][1](input_path, _worker_options)
+        WRITERS[_worker_options["dst"]][1](data, _output_path(data, input_path, _worker_options), _worker_options)
+        return input_path, None
+    except Exception as e:
+        return input_path, "{}: {}".format(type(e).__name__, e)
+
+
+def _read_file(input_path):
+    # 转换为 coco：只读取，由主进程按输入顺序写出
+    try:
+        return input_path, READERS[_worker_options["src"]][1](input_path, _worker_options), None
+    except Exception as e:
+        return input_path, None, "{}: {}".format(type(e).__name__, e)
+
+
+def _write_data(data):
+    # 由 coco 转换：主进程读取，只写出
+    try:
+        WRITERS[_worker_options["dst"]][1](data, _output_path(data, None, _worker_options), _worker_options)
+        return data['imagePath'], None
+    except Exception as e:
+        return data['imagePath'], "{}: {}".format(type(e).__name__, e)
+
+
+def _map(options, fn, items, workers, chunksize):
+    # workers 为 0 时在当前进程中逐个执行，便于调试
+    if workers == 0:
+        _init_worker(options)
+        yield from map(fn, items)
+        return
+    with Pool(workers, initializer=_init_worker, initargs=(options,)) as pool:
+        yield from pool.imap(fn, items, chunksize)
+
+
+def list_inputs(input_dir, extension):
+    """
+    :return: 返回文件夹中指定扩展名的文件路径列表（按文件名排序）
+    """
+    return [os.path.join(input_dir, name) for name in sorted(os.listdir(input_dir)) if name.lower().endswith(extension)]
+
+
+def convert(src, dst, input, output, classes=None, image_dir=None, image_ext=".jpg", compact=False, workers=None, chunksize=16):
+    """
+    批量转换标注格式。
+
+    :param src: 源格式，见 SOURCE_FORMATS
+    :param dst: 目标格式，见 TARGET_FORMATS
+    :param input: 源标注文件夹，源格式为 coco 时为 COCO json 文件路径
+    :param output: 输出文件夹，目标格式为 coco 时为 COCO json 文件路径
+    :param classes: 类别名称列表，yolo、yolo-seg、coco 格式按列表顺序确定类别序号
+    :param image_dir: 图像文件夹，读取 yolo 格式时用于获取图像尺寸，默认与标注文件相同
+    :param image_ext: 图像扩展名，数据堂平台格式没有记录图像文件名时使用
+    :param compact: labelme、custom 格式是否写出紧凑的 json
+    :param workers: 进程数量，默认为 CPU 核数，为 0 时在当前进程中执行
+    :param chunksize: 每次分发给进程的文件数量
+    :return: 返回 {"converted": 成功数量, "failed": 失败数量}
+    """
+    if src not in SOURCE_FORMATS:
+        raise ValueError("Unknown source format: {}, expected one of {}".format(src, ", ".join(SOURCE_FORMATS)))
+    if dst not in TARGET_FORMATS:
+        raise ValueError("Unknown target format: {}, expected one of {}".format(dst, ", ".join(TARGET_FORMATS)))
+
+    options = {"src": src, "dst": dst, "output": output, "classes": classes, "image_dir": image_dir, "image_ext": image_ext,
+               "compact": compact}
+    workers = os.cpu_count() if workers is None else workers
+    counts = Counter()
+
+    def report(path, error):
+        if error is None:
+            counts["converted"] += 1
+        else:
+            counts["failed"] += 1
+            tqdm.write("Failed to convert {}: {}".format(path, error))
+
+    if dst == "coco":
+        with CocoStreamWriter(output, coco_categories(_require_classes(options, "coco"))) as coco:
+            if src == "coco":
+                items = ((None, data, None) for data in iter_coco(input, options))
+                total = None
+            else:
+                inputs = list_inputs(input, READERS[src][0])
+                items = _map(options, _read_file, inputs, workers, chunksize)
+                total = len(inputs)
+            for path, data, error in tqdm(items, total=total, desc="Converting"):
+                if error is None:
+                    coco.add_labelme(data['imagePath'], data, classes)
+                report(path, error)
+    else:
+        os.makedirs(output, exist_ok=True)
+        if src == "coco":
+            results = _map(options, _write_data, iter_coco(input, options), workers, chunksize)
+            total = None
+        else:
+            inputs = list_inputs(input, READERS[src][0])
+            results = _map(options, _convert_file, inputs, workers, chunksize)
+            total = len(inputs)
+        for path, error in tqdm(results, total=total, desc="Converting"):
+            report(path, error)
+
+    return {"converted": counts["converted"], "failed": counts["failed"]}
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser(description='annotation format conversion')
+    parser.add_argument('--src', type=str, required=True, choices=SOURCE_FORMATS, help='source format')
+    parser.add_argument('--dst', type=str, required=True, choices=TARGET_FORMATS, help='target format')
+    parser.add_argument('--input', type=str, required=True, help='source annotation dir, or COCO json path')
+    parser.add_argument('--output', type=str, required=True, help='output dir, or COCO json path')
+    parser.add_argument('--classes', type=str, default=None, help='comma separated class names, e.g. PoSun,DiaoKuai')
+    parser.add_argument('--images', type=str, default=None, help='image dir, needed to read yolo txt files')
+    parser.add_argument('--image-ext', type=str, default='.jpg', help='image extension used when a label file has no image name')
+    parser.add_argument('--compact', action='store_true', help='write compact json for labelme/custom output')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes, 0 converts in the current process')
+    parser.add_argument('--chunksize', type=int, default=16, help='number of files sent to a process at a time')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    opt = parse_opt()
+    counts = convert(opt.src, opt.dst, opt.input, opt.output, classes=opt.classes.split(',') if opt.classes else None,
+                     image_dir=opt.images, image_ext=opt.image_ext, compact=opt.compact, workers=opt.workers, chunksize=opt.chunksize)
+    print("Converted {converted} files, {failed} failed.".format(**counts))
@@ -0,0 +1,128 @@
+"""
+只读取文件头获取图像宽高，无需解码整张图像：JPEG 读取 SOF 段，PNG 读取 IHDR 块，另支持 BMP、GIF、WebP。
+其他格式或文件头无法解析时退回 OpenCV 解码。
+"""
+import struct
+
+
+# JPEG 中携带图像尺寸的 SOF 段标记（排除 DHT 0xC4、JPG 0xC8、DAC 0xCC）
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# 没有负载的 JPEG 段标记（TEM、RST0-7）
+_JPEG_STANDALONE_MARKERS = {0x01} | set(range(0xD0, 0xD8))
+
+
+def _exif_orientation(data):
+    # 解析 APP1 段中的 EXIF 数据，返回方向标记（1-8），没有方向标记时返回 1
+    if data[:6] != b'Exif\x00\x00':
+        return 1
+    tiff = data[6:]
+    if tiff[:2] == b'II':
+        endian = '<'
+    elif tiff[:2] == b'MM':
+        endian = '>'
+    else:
+        return 1
+    offset = struct.unpack(endian + 'I', tiff[4:8])[0]
+    count = struct.unpack(endian + 'H', tiff[offset:offset + 2])[0]
+    for i in range(count):
+        entry = tiff[offset + 2 + 12 * i:offset + 14 + 12 * i]
+        if len(entry) < 12:
+            break
+        tag, _, _ = struct.unpack(endian + 'HHI', entry[:8])
+        if tag == 0x0112:
+            return struct.unpack(endian + 'H', entry[8:10])[0]
+    return 1
+
+
+def _jpeg_size(f, exif_orientation):
+    f.seek(2)
+    orientation = 1
+    while True:
+        byte = f.read(1)
+        # 跳过段之间的填充字节，找到下一个段标记
+        while byte and byte != b'\xff':
+            byte = f.read(1)
+        while byte == b'\xff':
+            byte = f.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker in _JPEG_STANDALONE_MARKERS:
+            continue
+        if marker in (0xD9, 0xDA):
+            # 图像结束或扫描数据开始之前仍未找到 SOF 段
+            return None
+        length = struct.unpack('>H', f.read(2))[0]
+        if marker in _JPEG_SOF_MARKERS:
+            height, width = struct.unpack('>xHH', f.read(5))
+            if orientation in (5, 6, 7, 8):
+                width, height = height, width
+            return width, height
+        if marker == 0xE1 and exif_orientation:
+            orientation = _exif_orientation(f.read(length - 2))
+        else:
+            f.seek(length - 2, 1)
+
+
+def _webp_size(header):
+    chunk = header[12:16]
+    if chunk == b'VP8 ' and header[23:26] == b'\x9d\x01\x2a':
+        width, height = struct.unpack('<HH', header[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L' and header[20:21] == b'\x2f':
+        bits = struct.unpack('<I', header[21:25])[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X':
+        return int.from_bytes(header[24:27], 'little') + 1, int.from_bytes(header[27:30], 'little') + 1
+    return None
+
+
+def read_image_size(image_path, exif_orientation=False):
+    """
+    只读取文件头获取图像的宽和高。
+
+    :param image_path: 图像路径
+    :param exif_orientation: 是否按 JPEG 的 EXIF 方向标记交换宽高（与 cv2.imread 默认读取得到的尺寸一致），
+                             为 False 时与 cv2.IMREAD_UNCHANGED 读取得到的尺寸一致
+    :return: 返回 (宽, 高)，不支持的格式或文件头无法解析时返回 None
+    """
+    with open(image_path, 'rb') as f:
+        header = f.read(32)
+        try:
+            if header[:8] == b'\x89PNG\r\n\x1a\n' and header[12:16] == b'IHDR':
+                return struct.unpack('>II', header[16:24])
+            if header[:2] == b'\xff\xd8':
+                return _jpeg_size(f, exif_orientation)
+            if header[:2] == b'BM':
+                width, height = struct.unpack('<ii', header[18:26])
+                return width, abs(height)
+            if header[:6] in (b'GIF87a', b'GIF89a'):
+                return struct.unpack('<HH', header[6:10])
+            if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+                return _webp_size(header)
+        except struct.error:
+            # 文件被截断
+            return None
+    return None
+
+
+def image_size(image_path, exif_orientation=False):
+    """
+    获取图像的宽和高，优先只读取文件头，无法解析时退回 OpenCV 解码整张图像。
+
+    :param image_path: 图像路径
+    :param exif_orientation: 见 read_image_size
+    :return: 返回 (宽, 高)，图像无法读取时抛出 ValueError
+    """
+    size = read_image_size(image_path, exif_orientation)
+    if size is not None:
+        return size
+
+    import cv2
+    import numpy as np
+    flags = cv2.IMREAD_COLOR if exif_orientation else cv2.IMREAD_UNCHANGED
+    image = cv2.imdecode(np.fromfile(image_path, dtype=np.uint8), flags)
+    if image is None:
+        raise ValueError("Failed to read image {}".format(image_path))
+    return image.shape[1], image.shape[0]
@@ -1,6 +1,10 @@
-import json
 import os
 
+try:
+    from format_trans.annotation_io import load_annotation
+except ImportError:  # 在 format_trans 文件夹中直接运行脚本
+    from annotation_io import load_annotation
+
 # 输入LabelMe标注生成的JSON文件夹路径
 json_folder = './20230825_json'
 
@@ -16,38 +20,48 @@ class_mapping = {
     # 添加更多类别映射
 }
 
-def convert_labelme_to_yolo(json_file_path, output_txt_path):
-    with open(json_file_path, 'r') as json_file:
-        data = json.load(json_file)
+def labelme_to_yolo_lines(data, class_mapping=class_mapping):
+    """
+    将 LabelMe 标注内容转换为 YOLO 目标检测格式的文本行（类别序号 xc yc w h，归一化坐标）。
+
+    :param data: LabelMe 标注内容（json 文件读取得到的字典）
+    :param class_mapping: 类别名称到序号的映射，不在映射中的目标不输出
+    :return: 返回 YOLO 格式的文本行列表
+    """
+    lines = list()
+    image_width = data['imageWidth']
+    image_height = data['imageHeight']
+
+    for item in data['shapes']:
+        label = item['label']
+        if label not in class_mapping:
+            continue
+        class_idx = class_mapping[label]
+
+        points = item['points']
+
+        # 获取边界框的坐标（矩形为两个角点，多边形取外接矩形）
+        x_min = min(point[0] for point in points)
+        y_min = min(point[1] for point in points)
+        x_max = max(point[0] for point in points)
+        y_max = max(point[1] for point in points)
+
+        # 计算归一化坐标
+        x_center = (x_min + x_max) / (2.0 * image_width)
+        y_center = (y_min + y_max) / (2.0 * image_height)
+        width = (x_max - x_min) / image_width
+        height = (y_max - y_min) / image_height
+
+        # YOLO格式的行
+        lines.append(f"{class_idx} {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f}\n")
+
+    return lines
+
+def convert_labelme_to_yolo(json_file_path, output_txt_path, class_mapping=class_mapping):
+    data = load_annotation(json_file_path)
 
     with open(output_txt_path, 'w') as output_file:
-        for item in data['shapes']:
-            label = item['label']
-            if label in class_mapping:
-                class_idx = class_mapping[label]
-            # else:
-                # # 如果标签名称不在映射中，将其默认为未知类别（可以根据需要调整）
-                # class_idx = len(class_mapping)
-
-            points = item['points']
-
-            # 获取边界框的坐标
-            x_min = min(points[0][0], points[1][0])
-            y_min = min(points[0][1], points[1][1])
-            x_max = max(points[0][0], points[1][0])
-            y_max = max(points[0][1], points[1][1])
-
-            # 计算归一化坐标
-            image_width = data['imageWidth']
-            image_height = data['imageHeight']
-            x_center = (x_min + x_max) / (2.0 * image_width)
-            y_center = (y_min + y_max) / (2.0 * image_height)
-            width = (x_max - x_min) / image_width
-            height = (y_max - y_min) / image_height
-
-            # 写入YOLO格式的行
-            output_line = f"{class_idx} {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f}\n"
-            output_file.write(output_line)
+        output_file.writelines(labelme_to_yolo_lines(data, class_mapping))
 
 def batch_convert(json_folder, output_folder):
     os.makedirs(output_folder, exist_ok=True)
@@ -61,5 +75,6 @@ def batch_convert(json_folder, output_folder):
     
     print("Batch conversion completed!")
 
-# 执行批量转换
-batch_convert(json_folder, output_folder)
+if __name__ == "__main__":
+    # 执行批量转换
+    batch_convert(json_folder, output_folder)
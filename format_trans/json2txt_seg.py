@@ -1,8 +1,44 @@
 # -*- coding: utf-8 -*-
-import json
 import os
 import argparse
 from tqdm import tqdm
+
+try:
+    from format_trans.annotation_io import load_annotation
+except ImportError:  # 在 format_trans 文件夹中直接运行脚本
+    from annotation_io import load_annotation
+ 
+ 
+def labelme_to_yolo_seg_lines(json_dict, classes):
+    """
+    将 LabelMe 标注内容转换为 YOLO 分割格式的文本行（类别序号 x1 y1 x2 y2 ...，归一化坐标）。
+
+    :param json_dict: LabelMe 标注内容
+    :param classes: 类别名称列表，类别序号按列表顺序从0开始，不在列表中的目标不输出
+    :return: 返回 YOLO 分割格式的文本行列表
+    """
+    h, w = json_dict['imageHeight'], json_dict['imageWidth']
+    lines = []
+
+    for shape_dict in json_dict['shapes']:
+        label = shape_dict['label']
+        if label not in classes:
+            continue
+        label_index = classes.index(label)
+        points = shape_dict['points']
+
+        points_nor_list = []
+
+        for point in points:
+            points_nor_list.append(point[0] / w)
+            points_nor_list.append(point[1] / h)
+
+        points_nor_list = list(map(lambda x: str(x), points_nor_list))
+        points_nor_str = ' '.join(points_nor_list)
+
+        lines.append(str(label_index) + ' ' + points_nor_str + '\n')
+
+    return lines
  
  
 def convert_label_json(json_dir, save_dir, classes):
@@ -12,30 +48,12 @@ def convert_label_json(json_dir, save_dir, classes):
     for json_path in tqdm(json_paths):
         # for json_path in json_paths:
         path = os.path.join(json_dir, json_path)
-        with open(path, 'r') as load_f:
-            json_dict = json.load(load_f)
-        h, w = json_dict['imageHeight'], json_dict['imageWidth']
+        json_dict = load_annotation(path)
  
         # save txt path
         txt_path = os.path.join(save_dir, json_path.replace('json', 'txt'))
-        txt_file = open(txt_path, 'w')
- 
-        for shape_dict in json_dict['shapes']:
-            label = shape_dict['label']
-            label_index = classes.index(label)
-            points = shape_dict['points']
- 
-            points_nor_list = []
- 
-            for point in points:
-                points_nor_list.append(point[0] / w)
-                points_nor_list.append(point[1] / h)
- 
-            points_nor_list = list(map(lambda x: str(x), points_nor_list))
-            points_nor_str = ' '.join(points_nor_list)
- 
-            label_str = str(label_index) + ' ' + points_nor_str + '\n'
-            txt_file.writelines(label_str)
+        with open(txt_path, 'w') as txt_file:
+            txt_file.writelines(labelme_to_yolo_seg_lines(json_dict, classes))
  
  
 if __name__ == "__main__":
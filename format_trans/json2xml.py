@@ -1,16 +1,16 @@
 import os
-import json
 import xml.etree.ElementTree as ET
 import numpy as np
 
+try:
+    from format_trans.annotation_io import load_annotation
+except ImportError:  # 在 format_trans 文件夹中直接运行脚本
+    from annotation_io import load_annotation
+
 # 根据需要修改输入和输出文件夹的路径
 input_folder = "./20230905_source_json"
 output_folder = "./20230905_source_xml"
 
-# 检查输出文件夹是否存在，如果不存在则创建
-if not os.path.exists(output_folder):
-    os.makedirs(output_folder)
-
 def get_box(points):
         min_x = min_y = np.inf
         max_x = max_y = 0
@@ -21,50 +21,62 @@ def get_box(points):
             max_y = max(max_y, y)
         return [min_x, min_y, max_x, max_y]
 
-# 遍历输入文件夹中的所有JSON文件
-for filename in os.listdir(input_folder):
-    if filename.endswith(".json"):
-        json_path = os.path.join(input_folder, filename)
-        with open(json_path, 'r') as json_file:
-            data = json.load(json_file)
-            
-            # 创建XML根元素
-            root = ET.Element("annotation")
-            
-            # 创建子元素并设置图像文件名
-            filename_elem = ET.SubElement(root, "filename")
-            filename_elem.text = data["imagePath"]
-            
-            # 创建文件尺寸元素
-            size_elem = ET.SubElement(root, "size")
-            width_elem = ET.SubElement(size_elem, "width")
-            width_elem.text = str(data["imageWidth"])
-            height_elem = ET.SubElement(size_elem, "height")
-            height_elem.text = str(data["imageHeight"])
-            
-            # 创建对象元素（每个标注框）
-            for shape in data["shapes"]:
-                object_elem = ET.SubElement(root, "object")
-                name_elem = ET.SubElement(object_elem, "name")
-                name_elem.text = shape["label"]
-                
-                min_x, min_y, max_x, max_y = get_box(shape["points"])
-                
-                # 创建边界框元素
-                bndbox_elem = ET.SubElement(object_elem, "bndbox")
-                xmin_elem = ET.SubElement(bndbox_elem, "xmin")
-                xmin_elem.text = str(min_x)
-                ymin_elem = ET.SubElement(bndbox_elem, "ymin")
-                ymin_elem.text = str(min_y)
-                xmax_elem = ET.SubElement(bndbox_elem, "xmax")
-                xmax_elem.text = str(max_x)
-                ymax_elem = ET.SubElement(bndbox_elem, "ymax")
-                ymax_elem.text = str(max_y)
+def labelme_to_voc(data):
+    """
+    将 LabelMe 标注内容转换为 labelimg 标注的 xml（VOC）格式，每个目标取外接矩形。
+
+    :param data: LabelMe 标注内容
+    :return: 返回 xml 的 ElementTree
+    """
+    # 创建XML根元素
+    root = ET.Element("annotation")
+    
+    # 创建子元素并设置图像文件名
+    filename_elem = ET.SubElement(root, "filename")
+    filename_elem.text = data["imagePath"]
+    
+    # 创建文件尺寸元素
+    size_elem = ET.SubElement(root, "size")
+    width_elem = ET.SubElement(size_elem, "width")
+    width_elem.text = str(data["imageWidth"])
+    height_elem = ET.SubElement(size_elem, "height")
+    height_elem.text = str(data["imageHeight"])
+    
+    # 创建对象元素（每个标注框）
+    for shape in data["shapes"]:
+        object_elem = ET.SubElement(root, "object")
+        name_elem = ET.SubElement(object_elem, "name")
+        name_elem.text = shape["label"]
+        
+        min_x, min_y, max_x, max_y = get_box(shape["points"])
+        
+        # 创建边界框元素
+        bndbox_elem = ET.SubElement(object_elem, "bndbox")
+        xmin_elem = ET.SubElement(bndbox_elem, "xmin")
+        xmin_elem.text = str(min_x)
+        ymin_elem = ET.SubElement(bndbox_elem, "ymin")
+        ymin_elem.text = str(min_y)
+        xmax_elem = ET.SubElement(bndbox_elem, "xmax")
+        xmax_elem.text = str(max_x)
+        ymax_elem = ET.SubElement(bndbox_elem, "ymax")
+        ymax_elem.text = str(max_y)
+    
+    return ET.ElementTree(root)
+
+if __name__ == "__main__":
+    # 检查输出文件夹是否存在，如果不存在则创建
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    # 遍历输入文件夹中的所有JSON文件
+    for filename in os.listdir(input_folder):
+        if filename.endswith(".json"):
+            json_path = os.path.join(input_folder, filename)
+            data = load_annotation(json_path)
             
             # 将XML写入文件
             xml_filename = os.path.splitext(filename)[0] + ".xml"
             xml_path = os.path.join(output_folder, xml_filename)
-            tree = ET.ElementTree(root)
-            tree.write(xml_path)
+            labelme_to_voc(data).write(xml_path)
 
-print("Conversion completed.")
+    print("Conversion completed.")
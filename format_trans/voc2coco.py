@@ -1,15 +1,17 @@
-import json
 import os
 from pathlib import Path
-import cv2
 import xml.etree.ElementTree as ET
 import shutil
 
-
-
-
 from tqdm import tqdm
 
+try:
+    from format_trans.image_size import image_size
+    from format_trans.coco_stream import CocoStreamWriter
+except ImportError:  # 在 format_trans 文件夹中直接运行脚本
+    from image_size import image_size
+    from coco_stream import CocoStreamWriter
+
 # 从xml文件中提取bounding box信息, 格式为[[x_min, y_min, x_max, y_max, name]]
 def parse_xml(xml_path):
     tree = ET.parse(xml_path)
@@ -28,8 +30,6 @@ def parse_xml(xml_path):
 
 def write_coco_and_copy_img(pics, json_name, root_path, dataset, classes, t_path, setType, shutil_copy=True):
     
-    bnd_id = 1  #初始为1
-
     img_dirs = os.path.join(root_path, str(t_path) + '/{}2017'.format(setType))
     if not os.path.exists(img_dirs):
         os.makedirs(img_dirs)
@@ -41,63 +41,51 @@ def write_coco_and_copy_img(pics, json_name, root_path, dataset, classes, t_path
         else:
             os.remove(path)
 
-    for i, pic in tqdm(enumerate(pics)):
-        # print('pic  '+str(i+1)+'/'+str(len(pics)))
-        xml_path = os.path.join(root_path, 'Annotations/', pic[:-4] + '.xml')
-        pic_path = os.path.join(root_path, 'training_data/' + pic)
-        img_path = os.path.join(img_dirs, pic)
-        if shutil_copy:
-            shutil.copy(pic_path, img_path)
-        # 用opencv读取图片，得到图像的宽和高
-        im = cv2.imread(pic_path)
-        height, width, _ = im.shape
-        # 添加图像的信息到dataset中
-        dataset['images'].append({
-            'file_name': pic,
-            'id': i,
-            'width': width,
-            'height': height
-        })
-        coords = parse_xml(xml_path)
-        for coord in coords:
-            # x_min
-            x1 = int(coord[0]) - 1
-            x1 = max(x1, 0)
-            # y_min
-            y1 = int(coord[1]) - 1
-            y1 = max(y1, 0)
-            # x_max
-            x2 = int(coord[2])
-            # y_max
-            y2 = int(coord[3])
-            assert x1 < x2
-            assert y1 < y2
-            # name
-            name = coord[4]
-            cls_id = classes.index(name) + 1  #从1开始
-            width = max(0, x2 - x1)
-            height = max(0, y2 - y1)
-            dataset['annotations'].append({
-                'area':
-                width * height,
-                'bbox': [x1, y1, width, height],
-                'category_id':
-                int(cls_id),
-                'id':
-                bnd_id,
-                'image_id':
-                i,
-                'iscrowd':
-                0,
-                # mask, 矩形是从左上角点按顺时针的四个顶点
-                'segmentation': [[x1, y1, x2, y1, x2, y2, x1, y2]]
-            })
-            bnd_id += 1
-            # print(pic)
-    # 保存结果的文件夹
-    with open(json_name, 'w') as f:
-        json.dump(dataset, f)
-    pass 
+    # images 与 annotations 边转换边写出到 json 文件，不在 dataset 中累积（dataset 只提供 categories）
+    with CocoStreamWriter(json_name, dataset['categories']) as writer:
+        for i, pic in tqdm(enumerate(pics)):
+            # print('pic  '+str(i+1)+'/'+str(len(pics)))
+            xml_path = os.path.join(root_path, 'Annotations/', pic[:-4] + '.xml')
+            pic_path = os.path.join(root_path, 'training_data/' + pic)
+            img_path = os.path.join(img_dirs, pic)
+            if shutil_copy:
+                shutil.copy(pic_path, img_path)
+            # 只读取文件头得到图像的宽和高（按 EXIF 方向，与 cv2.imread 一致）
+            width, height = image_size(pic_path, exif_orientation=True)
+            # 添加图像的信息
+            image_id = writer.add_image(pic, width, height)
+            coords = parse_xml(xml_path)
+            for coord in coords:
+                # x_min
+                x1 = int(coord[0]) - 1
+                x1 = max(x1, 0)
+                # y_min
+                y1 = int(coord[1]) - 1
+                y1 = max(y1, 0)
+                # x_max
+                x2 = int(coord[2])
+                # y_max
+                y2 = int(coord[3])
+                assert x1 < x2
+                assert y1 < y2
+                # name
+                name = coord[4]
+                cls_id = classes.index(name) + 1  #从1开始
+                width = max(0, x2 - x1)
+                height = max(0, y2 - y1)
+                # 标注 id 由 writer 从1开始编号
+                writer.add_annotation(image_id, {
+                    'area':
+                    width * height,
+                    'bbox': [x1, y1, width, height],
+                    'category_id':
+                    int(cls_id),
+                    'iscrowd':
+                    0,
+                    # mask, 矩形是从左上角点按顺时针的四个顶点
+                    'segmentation': [[x1, y1, x2, y1, x2, y2, x1, y2]]
+                })
+                # print(pic)
 
 def convert(root_path, classlist, t_path, setType='train', split=0.7):
     '''
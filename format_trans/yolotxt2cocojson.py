@@ -1,76 +1,54 @@
-import json
 import os
-import imagesize
-import copy
 
+try:
+    from format_trans.image_size import image_size
+    from format_trans.coco_stream import CocoStreamWriter
+except ImportError:  # 在 format_trans 文件夹中直接运行脚本
+    from image_size import image_size
+    from coco_stream import CocoStreamWriter
 
-def txt_to_json(img_dir,annotation_dir,json_path,img_format='.jpg',annotation_format='.txt'):
-    # json 文件主要两项内容
-    json_dict = dict()
-    annotations = list()
-    images = list()
-    categories = list()
-    # 一个标签和一张图
-    one_annotation = dict()
-    one_image = dict()
-    annotation_bbox_id = 0
-    for file in os.listdir(annotation_dir):
-        if file.endswith(annotation_format):
-            # 读取图片信息：长宽，整合到one_image当中
-            one_image['file_name'] = file.split('.')[0]+img_format
-            one_image['id'] = file.split('.')[0]
-            one_image['width'],one_image['height'] = imagesize.get(os.path.join(img_dir,one_image['file_name']))
-            # 读取txt文件的内容，for循环整合到one_annotation当中
-            with open(os.path.join(annotation_dir,file), 'r') as f:
-                for line in f.readlines():
-                    line = line.strip('\n')  # 去掉每一行中的换行符
-                    [categories_id,x,y,w,h] = line.split(' ')
-                    w = one_image['width']*float(w)
-                    h = one_image['height']*float(h)
-                    x_min = one_image['width']*float(x) - w/2.0
-                    y_min = one_image['height']*float(y) - h/2.0
-                    x_max = x_min + w
-                    y_max = y_min + h
-
-                    if x_min < 0:
-                        x_min = 0.0
-                    elif x_min > one_image['width']:
-                        x_min = one_image['width']
-                    if y_min < 0:
-                        y_min = 0.0
-                    elif y_min > one_image['height']:
-                        y_min = one_image['height']
-
-                    if x_max < 0:
-                        x_max = 0.0
-                    elif x_max > one_image['width']:
-                        x_max = one_image['width']
-                    if y_max < 0:
-                        y_max = 0.0
-                    elif y_max > one_image['height']:
-                        y_max = one_image['height']
 
-                    one_annotation['segmentation'] = []
-                    one_annotation['area'] = w*h
-                    one_annotation['iscrowd'] = 0
-                    one_annotation['image_id'] = one_image['id']
-                    one_annotation["bbox"] = [x_min,y_min,x_max,y_max]
-                    one_annotation["category_id"] = categories_id
-                    one_annotation["id"] = annotation_bbox_id                   # 这里的id就是一个编号，每一个人的编号都不相同
-                    annotation_bbox_id = annotation_bbox_id + 1
-                    annotations.append(copy.deepcopy(one_annotation))
-            images.append(copy.deepcopy(one_image))
+def txt_to_json(img_dir,annotation_dir,json_path,img_format='.jpg',annotation_format='.txt'):
+    # 类别信息
     category = dict()
     category['supercategory'] = 'RailwayArea'
     category['RailwayArea'] = 'RailwayArea'
     category['id'] = 0
-    categories.append(category)
-    json_dict['annotations'] = annotations
-    json_dict['images'] = images
-    json_dict['categories'] = categories
-    # 将获取的xml内容写入到json文件中
-    with open(json_path, 'w') as f:
-        f.write(json.dumps(json_dict, indent=1, separators=(',', ':')))
+    # images 与 annotations 逐条流式写出到 json 文件，标注 id 从0开始编号
+    with CocoStreamWriter(json_path, [category], first_annotation_id=0) as writer:
+        for file in os.listdir(annotation_dir):
+            if file.endswith(annotation_format):
+                # 读取图片信息：长宽
+                file_name = file.split('.')[0]+img_format
+                image_id = file.split('.')[0]
+                width, height = image_size(os.path.join(img_dir,file_name))
+                writer.add_image(file_name, width, height, image_id=image_id)
+                # 读取txt文件的内容，逐行写出标注
+                with open(os.path.join(annotation_dir,file), 'r') as f:
+                    for line in f:
+                        line = line.strip('\n')  # 去掉每一行中的换行符
+                        [categories_id,x,y,w,h] = line.split(' ')
+                        w = width*float(w)
+                        h = height*float(h)
+                        x_min = width*float(x) - w/2.0
+                        y_min = height*float(y) - h/2.0
+                        x_max = x_min + w
+                        y_max = y_min + h
+
+                        x_min = min(max(x_min, 0.0), width)
+                        y_min = min(max(y_min, 0.0), height)
+                        x_max = min(max(x_max, 0.0), width)
+                        y_max = min(max(y_max, 0.0), height)
+
+                        one_annotation = dict()
+                        one_annotation['segmentation'] = []
+                        # COCO 的 bbox 为 [x, y, 宽, 高]，面积按裁剪到图像范围内的框计算
+                        one_annotation['area'] = (x_max - x_min)*(y_max - y_min)
+                        one_annotation['iscrowd'] = 0
+                        one_annotation["bbox"] = [x_min,y_min,x_max - x_min,y_max - y_min]
+                        one_annotation["category_id"] = int(categories_id)
+                        # id 由 writer 编号，每一条标注的编号都不相同
+                        writer.add_annotation(image_id, one_annotation)
 
 
 if __name__ == '__main__':
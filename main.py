@@ -1,19 +1,91 @@
-import cv2
-import json
 import yaml
 import os
-import shutil
+import itertools
+import contextlib
 
-from tqdm import tqdm
-from time import time
+from utils.utils import OutputNamer, TaskResultsCSV, remove_mask_annotations
+from utils.fusion import iter_images_match_samples, fusion_image_nums, pair_random
+from utils.executor import iter_fusion_tasks, output_name_suffix, restore_fusion_task, run_fusion_tasks
+from utils.dataset import IMAGE_EXTENSIONS, TILED_IMAGE_EXTENSIONS, split_raw_image_dataset, extract_unique_samples
+from utils.catalog import build_sample_catalog
+from utils.export import export_files
+from utils.manifest import FileManifest
+from utils.journal import RunJournal
+from utils.labels import check_label_formats, label_file_name, open_coco_writer, write_yolo_labels
+from utils.metrics import RunLog, profile_session
+from utils.chips import check_chip_options
+from utils.tiling import check_tile_options
 
-from utils.utils import count_images_with_substring, write_image_info_to_csv, remove_mask_annotations
-from utils.fusion import choose_images_match_samples, paste_samples_on_image
-from utils.dataset import split_raw_image_dataset, extract_unique_samples
+
+def fuse_split(config, journal, run_log, split, image_files, samples, sample_catalog, target, output_dir, output_csv):
+    """
+    生成一个数据集划分的融合图像，跳过运行日志中已完成的任务。
+
+    :param journal: 运行日志
+    :param run_log: 运行记录，记录本次运行中各任务的分阶段耗时与计数，结束时输出汇总表
+    :param split: "train" 或 "val"
+    :param target: 要生成的融合图像数量，为 None 时持续生成直到按下 Ctrl+C
+    :return: 返回成功生成的融合图像数量（包括之前运行中已完成的）
+    """
+    namer = OutputNamer(output_dir, output_name_suffix(config))
+    for fused_image_name in journal.fused_image_names(split):
+        namer.reserve(fused_image_name)
+    
+    # 已派发但未完成的任务按原有文件名重新执行，之后的任务由固定种子的生成器跳过已派发的部分继续生成
+    completed = journal.completed_results(split)
+    completed_ok = sum(result["status"] == "ok" for result in completed)
+    unfinished = [restore_fusion_task(record, config, output_dir) for record in journal.unfinished_tasks(split)]
+    planned = journal.planned_count(split)
+    pairs = itertools.islice(iter_images_match_samples(image_files, samples, config, catalog=sample_catalog, rng=pair_random(config, split)), planned, None)
+    tasks = itertools.chain(unfinished, iter_fusion_tasks(pairs, split, config, output_dir, namer=namer, start=planned))
+    
+    # labelme、yolo 标注由工作进程随图像写出，coco 标注由主进程按任务顺序写入 {Augmented}/annotations/instances_{split}.json；
+    # 异常退出时放弃写出，续跑时按运行日志中已完成任务的结果重新写出
+    coco_writer = open_coco_writer(os.path.dirname(output_dir), split, config)
+    
+    def write_result(result):
+        csv_writer.write(result)
+        if coco_writer is not None and result["status"] == "ok":
+            # 分块处理与切片输出模式下每个任务输出多个图像（没有粘贴样本时可能为空）
+            outputs = result["output_annotations"] if "output_annotations" in result else [(result["fused_image_name"], result["annotation"])]
+            for image_name, annotation in outputs:
+                coco_writer.add_labelme(image_name, annotation, config["label_classes"])
+    
+    with contextlib.ExitStack() as stack:
+        if coco_writer is not None:
+            stack.enter_context(coco_writer)
+        csv_writer = stack.enter_context(TaskResultsCSV(output_csv))
+        for result in completed:
+            write_result(result)
+        
+        def on_result(result):
+            write_result(result)
+            journal.record_result(split, result)
+            run_log.add(split, result)
+        
+        summary = run_fusion_tasks(tasks, config, desc="{} fusion processing".format(split), image_files=image_files, namer=namer,
+                                   target=None if target is None else max(target - completed_ok, 0),
+                                   on_result=on_result, on_dispatch=journal.record_task)
+    
+    run_log.write_summary(split)
+    print(run_log.summary_table(split, desc="{} fusion processing".format(split)))
+    
+    return completed_ok + summary["ok"]
 
 
 def process(config):
     
+    check_label_formats(config["label_formats"])
+    check_tile_options(config)
+    check_chip_options(config)
+    
+    # 按 profiler 配置对主进程进行性能分析（多进程融合时工作进程各自输出分析结果）
+    with profile_session(config["profiler"], os.path.join(config["output_path"], config["profile_dir"], "main")):
+        run_process(config)
+
+
+def run_process(config):
+    
     FilteredLabeled_path = os.path.join(config["output_path"], "FilteredLabeled")
     Augmented_path = os.path.join(config["output_path"], "Augmented")
     CuttedObject_path = os.path.join(config["output_path"], "CuttedObject")
@@ -24,107 +96,85 @@ def process(config):
     os.makedirs(os.path.join(Augmented_path, "val"), exist_ok=True)
     os.makedirs(CuttedObject_path, exist_ok=True)
     
-    train_files, val_files = split_raw_image_dataset(config["ori_img_path"], config["train_ratio"], seed=config["seed"])
+    # 文件清单记录原始图像与抠图样本的文件信息，重复运行时只重新读取发生变化的文件
+    manifest = FileManifest(os.path.join(config["output_path"], config["manifest_name"]), trust_dir_mtime=config["manifest_trust_dir_mtime"]) if config["use_manifest"] else None
     
-    train_samples, val_samples = extract_unique_samples(config["samples_path"], config["train_ratio"], seed=config["seed"])
+    # 运行日志记录数据集划分、已派发的任务与执行结果，中断后重新运行时跳过已完成的任务
+    journal = RunJournal(os.path.join(config["output_path"], config["journal_name"]), config, resume=config["resume"])
     
-    # 选择训练集中要融合的原始图像与批量抠图样本对
+    # 运行记录逐行记录本次运行中各任务的分阶段耗时、放置尝试、缓存命中与写出字节数，run_log_name 为空时只输出汇总表
+    run_log = RunLog(os.path.join(config["output_path"], config["run_log_name"]) if config["run_log_name"] else None)
     
-    train_aug_pairs = choose_images_match_samples(train_files, train_samples, config, mode="train")
-    write_image_info_to_csv(image_info_list=train_aug_pairs, output_csv=os.path.join(Augmented_path, config["train_aug_pairs_name"]))
+    if journal.split is not None:
+        print("Resuming from {}...".format(journal.path))
+        train_files, val_files, train_samples, val_samples = journal.split
+    else:
+        train_files, val_files = split_raw_image_dataset(config["ori_img_path"], config["train_ratio"], seed=config["seed"], manifest=manifest,
+                                                         image_extensions=TILED_IMAGE_EXTENSIONS if config["tile_size"] else IMAGE_EXTENSIONS)
+        
+        train_samples, val_samples = extract_unique_samples(config["samples_path"], config["train_ratio"], seed=config["seed"], manifest=manifest)
+        
+        journal.record_split(train_files, val_files, train_samples, val_samples)
     
-    # 选择验证集中要融合的原始图像与批量抠图样本对
+    # 一次性建立抠图样本索引，供训练集与验证集选择抠图样本使用
+    sample_catalog = build_sample_catalog(config["samples_path"], list(manifest.scan(config["samples_path"], recursive=True)) if manifest is not None else None)
     
-    val_aug_pairs = choose_images_match_samples(val_files, val_samples, config, mode="val")
-    write_image_info_to_csv(image_info_list=val_aug_pairs, output_csv=os.path.join(Augmented_path, config["val_aug_pairs_name"]))
+    if manifest is not None:
+        manifest.close()
+    
+    # 融合任务以生成器方式逐个产生：选择原始图像与抠图样本对 -> 分配文件名与随机种子 -> 工作进程融合并写出，
+    # 执行结果按任务顺序逐条写入CSV；train_fusion_image_nums 为空时持续生成，直到按下 Ctrl+C
     
     print("Start to fuse train images...")
     
-    for match_pair in tqdm(train_aug_pairs, desc="train fusion processing", unit="task"):
-        
-        train_image_file, sample_files = match_pair.popitem()
-
-        idx = count_images_with_substring(os.path.join(Augmented_path, "train"), "_"+train_image_file)
-
-        fused_image_name = "X{}".format(idx+1) + "_" + train_image_file
-        fused_label_name = fused_image_name.split(".")[0]+".json"
-        
-        train_image_path = os.path.join(config["ori_img_path"], train_image_file)
-        sample_images_path = [os.path.join(config["samples_path"], sample_file.split("_")[0], sample_file) for sample_file in sample_files]
-        start_time = time()
-        fused_image, fused_label = paste_samples_on_image(image_path=train_image_path, sample_images_path=sample_images_path)
-        if time() - start_time > config["time_limit"]:
-            print("Time limit exceeded, skipping this image.")
-            continue
-        
-        fused_label["imagePath"] = fused_image_name
-        
-        # 过滤掉类别为__mask__的目标
-        fused_label["shapes"] = [shape for shape in fused_label['shapes'] if shape['label'] != '__mask__']
-        
-        cv2.imencode('.jpg', fused_image)[1].tofile(os.path.join(Augmented_path, "train", fused_image_name))
-        # print(f"Train File: Saved {fused_image_name} to {Augmented_path}")
-        
-        with open(os.path.join(Augmented_path, "train", fused_label_name), 'w', encoding="utf-8") as json_file:
-            json.dump(fused_label, json_file, indent=4)  # 直接写入数据
-            json_file.close()
-        # print(f"Train File: Saved {fused_label_name} to {Augmented_path}")
+    train_target = fusion_image_nums(config, "train")
+    train_ok = fuse_split(config, journal, run_log, "train", train_files, train_samples, sample_catalog, train_target,
+                          os.path.join(Augmented_path, "train"), os.path.join(Augmented_path, config["train_aug_pairs_name"]))
     
     print("Start to fuse val images...")
     
-    for match_pair in tqdm(val_aug_pairs, desc="val fusion processing", unit="task"):
-
-        val_image_file, sample_files = match_pair.popitem()
-
-        idx = count_images_with_substring(os.path.join(Augmented_path, "val"), "_"+val_image_file)
-
-        fused_image_name = "X{}".format(idx+1) + "_" + val_image_file
-        fused_label_name = fused_image_name.split(".")[0]+".json"
-
-        val_image_path = os.path.join(config["ori_img_path"], val_image_file)
-        sample_images_path = [os.path.join(config["samples_path"], sample_file.split("_")[0], sample_file) for sample_file in sample_files]
-        start_time = time()
-        fused_image, fused_label = paste_samples_on_image(image_path=val_image_path,sample_images_path=sample_images_path)
-        if time() - start_time > config["time_limit"]:
-            print("Time limit exceeded, skipping this image.")
-            continue
-        
-        fused_label["imagePath"] = fused_image_name
-        
-        # 过滤掉类别为__mask__的目标
-        fused_label["shapes"] = [shape for shape in fused_label['shapes'] if shape['label'] != '__mask__']
-        
-        cv2.imencode('.jpg', fused_image)[1].tofile(os.path.join(Augmented_path, "val", fused_image_name))
-        # print(f"Val File: Saved {fused_image_name} to {Augmented_path}")
-        
-        with open(os.path.join(Augmented_path, "val", fused_label_name), 'w', encoding="utf-8") as json_file:
-            json.dump(fused_label, json_file, indent=4)
-            json_file.close()
-        # print(f"Val File: Saved {fused_label_name} to {Augmented_path}")
-    
-    #将划分出的原始图像的训练集移动到FilteredLabeled_path/train
-    for train_file in train_files:
-        shutil.copy(os.path.join(config["ori_img_path"], train_file), os.path.join(FilteredLabeled_path, "train", train_file))
-        remove_mask_annotations(os.path.join(config["ori_img_path"], train_file.split(".")[0]+".json"), os.path.join(FilteredLabeled_path, "train", train_file.split(".")[0]+".json"))
-    
-    #将划分出的原始图像的验证集移动到FilteredLabeled_path/val
-    for val_file in val_files:
-        shutil.copy(os.path.join(config["ori_img_path"], val_file), os.path.join(FilteredLabeled_path, "val", val_file))
-        remove_mask_annotations(os.path.join(config["ori_img_path"], val_file.split(".")[0]+".json"), os.path.join(FilteredLabeled_path, "val", val_file.split(".")[0]+".json"))
-    
-    #将划分出的抠图样本的训练集移动到CuttedObject_path/{抠图类别}/train  
-    for train_sample in train_samples:
-        dst_dir = os.path.join(CuttedObject_path, train_sample.split("_")[0], "train")
-        src_dir = os.path.join(config["samples_path"], train_sample.split("_")[0])
-        os.makedirs(dst_dir, exist_ok=True)
-        [shutil.copy(os.path.join(src_dir, file), dst_dir) for file in os.listdir(src_dir) if train_sample in file]
-     
-    #将划分出的抠图样本的验证集移动到CuttedObject_path/{抠图类别}/val  
-    for val_sample in val_samples:
-        dst_dir = os.path.join(CuttedObject_path, val_sample.split("_")[0], "val")
-        src_dir = os.path.join(config["samples_path"], val_sample.split("_")[0])
-        os.makedirs(dst_dir, exist_ok=True)
-        [shutil.copy(os.path.join(src_dir, file), dst_dir) for file in os.listdir(src_dir) if val_sample in file]
+    # 验证集数量按训练集数量换算，持续生成时以实际生成的训练集数量为准
+    val_target = fusion_image_nums(config, "val", train_target if train_target is not None else train_ok)
+    fuse_split(config, journal, run_log, "val", val_files, val_samples, sample_catalog, val_target,
+               os.path.join(Augmented_path, "val"), os.path.join(Augmented_path, config["val_aug_pairs_name"]))
+    
+    journal.close()
+    run_log.close()
+    
+    # 按 export_mode 导出划分后的原始图像与抠图样本，链接或克隆失败时退回复制
+    export_jobs = list()
+    
+    #将划分出的原始图像的训练集、验证集导出到FilteredLabeled_path/{train,val}
+    for split, image_files in (("train", train_files), ("val", val_files)):
+        for image_file in image_files:
+            export_jobs.append((os.path.join(config["ori_img_path"], image_file), os.path.join(FilteredLabeled_path, split, image_file)))
+    
+    #将划分出的抠图样本的训练集、验证集导出到CuttedObject_path/{抠图类别}/{train,val}，样本文件直接由抠图样本索引分组
+    for split, samples in (("train", train_samples), ("val", val_samples)):
+        for sample in samples:
+            class_name = sample.split("_")[0]
+            dst_dir = os.path.join(CuttedObject_path, class_name, split)
+            src_dir = os.path.join(config["samples_path"], class_name)
+            os.makedirs(dst_dir, exist_ok=True)
+            export_jobs.extend((os.path.join(src_dir, file), os.path.join(dst_dir, file))
+                               for files in sample_catalog.get(class_name, {}).get(sample, {}).values() for file in files)
+    
+    export_counts = export_files(export_jobs, config["export_mode"], config["export_workers"])
+    print("Exported {} files ({}).".format(sum(export_counts.values()), ", ".join("{}: {}".format(mode, count) for mode, count in sorted(export_counts.items()))))
+    
+    # 标注文件需要去掉 '__mask__' 区域，按 label_formats 逐个重新写出
+    for split, image_files in (("train", train_files), ("val", val_files)):
+        with contextlib.ExitStack() as stack:
+            coco_writer = open_coco_writer(FilteredLabeled_path, split, config)
+            if coco_writer is not None:
+                stack.enter_context(coco_writer)
+            for image_file in image_files:
+                labelme_path = os.path.join(FilteredLabeled_path, split, image_file.split(".")[0]+".json") if "labelme" in config["label_formats"] else None
+                annotation = remove_mask_annotations(os.path.join(config["ori_img_path"], image_file.split(".")[0]+".json"), labelme_path, config["compact_json"])
+                if "yolo" in config["label_formats"]:
+                    write_yolo_labels(os.path.join(FilteredLabeled_path, split, label_file_name(image_file, "yolo")), annotation, config["label_classes"])
+                if coco_writer is not None:
+                    coco_writer.add_labelme(image_file, annotation, config["label_classes"])
 
 if __name__ == "__main__":
     
@@ -0,0 +1,57 @@
+import os
+import sys
+import codecs
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from format_trans.annotation_io import JSON_BACKENDS, dump_annotation, dumps, load_annotation, loads
+
+
+AVAILABLE_BACKENDS = [name for name, available in JSON_BACKENDS.items() if available]
+
+ANNOTATION = {"version": "5.0", "flags": {}, "imagePath": "路面/X1_frame1.jpg", "imageData": None, "imageHeight": 48, "imageWidth": 64,
+              "shapes": [{"label": "裂缝", "shape_type": "rectangle", "points": np.array([[1, 2.5], [30, 40]], dtype=np.float32),
+                          "group_id": None, "flags": {}, "score": np.float32(0.1), "index": np.int64(3), "visible": np.bool_(True)}]}
+
+
+def _builtin(annotation):
+    return loads(dumps(annotation, backend="json"), backend="json")
+
+
+@pytest.mark.parametrize("backend", AVAILABLE_BACKENDS)
+@pytest.mark.parametrize("compact, indent", [(True, 4), (False, 4), (False, 2)])
+def test_output_does_not_depend_on_backend(backend, compact, indent):
+    assert dumps(ANNOTATION, compact, indent, backend) == dumps(ANNOTATION, compact, indent, "json")
+
+
+@pytest.mark.parametrize("backend", AVAILABLE_BACKENDS)
+def test_round_trip(tmp_path, backend):
+    json_path = str(tmp_path / "frame1.json")
+    dump_annotation(ANNOTATION, json_path, backend=backend)
+    data = load_annotation(json_path, backend=backend)
+
+    assert data == _builtin(ANNOTATION)
+    assert data["shapes"][0]["points"] == [[1.0, 2.5], [30.0, 40.0]]
+    assert data["shapes"][0]["label"] == "裂缝"
+    with open(json_path, 'rb') as f:
+        assert "裂缝".encode("utf-8") in f.read()
+
+
+@pytest.mark.parametrize("backend", AVAILABLE_BACKENDS)
+def test_load_strips_bom(tmp_path, backend):
+    json_path = str(tmp_path / "frame1.json")
+    with open(json_path, 'wb') as f:
+        f.write(codecs.BOM_UTF8 + dumps(ANNOTATION, backend="json"))
+    assert load_annotation(json_path, backend=backend) == _builtin(ANNOTATION)
+
+
+def test_unavailable_backend_is_rejected():
+    with pytest.raises(ValueError):
+        dumps({}, backend="simplejson")
+    for name, available in JSON_BACKENDS.items():
+        if not available:
+            with pytest.raises(ValueError):
+                loads("{}", backend=name)
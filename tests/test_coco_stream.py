@@ -0,0 +1,95 @@
+import os
+import sys
+import json
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from format_trans.coco_stream import CocoStreamWriter, coco_categories, iter_coco_images, read_coco_categories
+from format_trans.yolotxt2cocojson import txt_to_json
+
+
+CLASSES = ["car", "bus"]
+
+
+def _labelme(width, height, *shapes):
+    return {"imageWidth": width, "imageHeight": height,
+            "shapes": [{"label": label, "shape_type": shape_type, "points": points} for label, shape_type, points in shapes]}
+
+
+def _write_dataset(json_path):
+    with CocoStreamWriter(json_path, coco_categories(CLASSES)) as writer:
+        writer.add_labelme("a.jpg", _labelme(64, 48, ("car", "rectangle", [[10, 20], [4, 8]]),
+                                             ("tree", "rectangle", [[0, 0], [1, 1]])), CLASSES)
+        writer.add_labelme("b.jpg", _labelme(32, 32), CLASSES)
+        writer.add_labelme("c.jpg", _labelme(32, 16, ("bus", "polygon", [[0, 0], [4, 0], [4, 3]]),
+                                             ("car", "rectangle", [[1, 1], [2, 2]])), CLASSES)
+
+
+def test_stream_writer_round_trip(tmp_path):
+    json_path = str(tmp_path / "annotations" / "instances_train.json")
+    _write_dataset(json_path)
+
+    with open(json_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    assert data["categories"] == coco_categories(CLASSES)
+    assert data["images"] == [{"file_name": "a.jpg", "id": 0, "width": 64, "height": 48},
+                              {"file_name": "b.jpg", "id": 1, "width": 32, "height": 32},
+                              {"file_name": "c.jpg", "id": 2, "width": 32, "height": 16}]
+    assert [(a["id"], a["image_id"], a["category_id"]) for a in data["annotations"]] == [(1, 0, 1), (2, 2, 2), (3, 2, 1)]
+    assert data["annotations"][0]["bbox"] == [4.0, 8.0, 6.0, 12.0]
+    assert data["annotations"][1]["area"] == 6.0
+    assert not os.path.exists(json_path + '.tmp')
+
+    # 流式读取（很小的读取块）得到与整体读取相同的内容
+    assert read_coco_categories(json_path) == data["categories"]
+    images = list(iter_coco_images(json_path, chunk_size=7))
+    assert [image for image, _ in images] == data["images"]
+    assert [[a["id"] for a in annotations] for _, annotations in images] == [[1], [], [2, 3]]
+
+
+def test_iter_coco_images_groups_unordered_annotations(tmp_path):
+    json_path = str(tmp_path / "unordered.json")
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump({"images": [{"id": 5}, {"id": 3}], "categories": [],
+                   "annotations": [{"id": 1, "image_id": 3}, {"id": 2, "image_id": 5}, {"id": 3, "image_id": 9}, {"id": 4, "image_id": 3}]}, f)
+
+    assert [(image["id"], [a["id"] for a in annotations]) for image, annotations in iter_coco_images(json_path, chunk_size=5)] == \
+           [(5, [2]), (3, [1, 4])]
+
+
+def test_stream_writer_aborts_on_exception(tmp_path):
+    json_path = str(tmp_path / "instances_train.json")
+    _write_dataset(json_path)
+    with open(json_path, 'rb') as f:
+        previous = f.read()
+
+    with pytest.raises(RuntimeError):
+        with CocoStreamWriter(json_path, coco_categories(CLASSES)) as writer:
+            writer.add_labelme("d.jpg", _labelme(8, 8, ("car", "rectangle", [[0, 0], [1, 1]])), CLASSES)
+            raise RuntimeError("interrupted")
+
+    # 原有的完整文件保持不变，不留下临时文件
+    with open(json_path, 'rb') as f:
+        assert f.read() == previous
+    assert sorted(os.listdir(tmp_path)) == ["instances_train.json"]
+
+
+def test_yolo_txt_to_coco_bbox(tmp_path):
+    cv2.imwrite(str(tmp_path / "frame1.jpg"), np.zeros((100, 200, 3), dtype=np.uint8))
+    with open(tmp_path / "frame1.txt", 'w') as f:
+        # 第二个目标超出图像右下角，按图像范围裁剪
+        f.write("0 0.5 0.5 0.2 0.4\n1 0.95 0.9 0.2 0.4\n")
+    json_path = str(tmp_path / "predict.json")
+    txt_to_json(str(tmp_path), str(tmp_path), json_path)
+
+    with open(json_path, 'r', encoding='utf-8') as f:
+        annotations = json.load(f)["annotations"]
+    assert [a["category_id"] for a in annotations] == [0, 1]
+    assert annotations[0]["bbox"] == pytest.approx([80, 30, 40, 40])
+    assert annotations[0]["area"] == pytest.approx(1600)
+    assert annotations[1]["bbox"] == pytest.approx([170, 70, 30, 30])
+    assert annotations[1]["area"] == pytest.approx(900)
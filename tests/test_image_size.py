@@ -0,0 +1,67 @@
+import os
+import sys
+import struct
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from format_trans.image_size import image_size, read_image_size
+
+
+def _write_image(path, height=37, width=53, params=()):
+    image = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    success, buffer = cv2.imencode(os.path.splitext(path)[1], image, list(params))
+    assert success
+    buffer.tofile(path)
+    return path
+
+
+def _cv2_size(path, flags):
+    image = cv2.imread(path, flags)
+    return image.shape[1], image.shape[0]
+
+
+def _exif_app1(orientation):
+    # 只包含方向标记的小端 EXIF 段
+    tiff = b'II*\x00' + struct.pack('<I', 8) + struct.pack('<H', 1) + struct.pack('<HHIHH', 0x0112, 3, 1, orientation, 0) + b'\x00' * 4
+    data = b'Exif\x00\x00' + tiff
+    return b'\xff\xe1' + struct.pack('>H', len(data) + 2) + data
+
+
+@pytest.mark.parametrize("file_name, params", [("a.jpg", ()), ("progressive.jpg", (cv2.IMWRITE_JPEG_PROGRESSIVE, 1)),
+                                               ("a.png", ()), ("a.bmp", ()), ("a.webp", ()), ("lossless.webp", (cv2.IMWRITE_WEBP_QUALITY, 101))])
+def test_header_size_matches_cv2(tmp_path, file_name, params):
+    path = _write_image(str(tmp_path / file_name), params=params)
+    assert read_image_size(path) == _cv2_size(path, cv2.IMREAD_UNCHANGED) == (53, 37)
+    assert image_size(path) == (53, 37)
+
+
+@pytest.mark.parametrize("orientation, expected", [(1, (53, 37)), (3, (53, 37)), (6, (37, 53)), (8, (37, 53))])
+def test_jpeg_exif_orientation_matches_cv2(tmp_path, orientation, expected):
+    path = _write_image(str(tmp_path / "a.jpg"))
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data[:2] + _exif_app1(orientation) + data[2:])
+
+    assert read_image_size(path) == _cv2_size(path, cv2.IMREAD_UNCHANGED) == (53, 37)
+    assert read_image_size(path, exif_orientation=True) == _cv2_size(path, cv2.IMREAD_COLOR) == expected
+    assert image_size(path, exif_orientation=True) == expected
+
+
+def test_unsupported_or_truncated_header_falls_back_to_cv2(tmp_path):
+    tiff_path = _write_image(str(tmp_path / "a.tif"))
+    assert read_image_size(tiff_path) is None
+    assert image_size(tiff_path) == _cv2_size(tiff_path, cv2.IMREAD_UNCHANGED)
+
+    truncated_path = str(tmp_path / "truncated.jpg")
+    with open(_write_image(str(tmp_path / "full.jpg")), 'rb') as f:
+        data = f.read(8)
+    with open(truncated_path, 'wb') as f:
+        f.write(data)
+    assert read_image_size(truncated_path) is None
+    with pytest.raises(ValueError):
+        image_size(truncated_path)
@@ -0,0 +1,68 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.journal import RunJournal
+
+
+CONFIG = {"seed": 1, "blend_mode": "alpha", "workers": 4, "image_format": "jpg"}
+
+
+def _task(index, attempt=0):
+    return {"split": "train", "index": index, "attempt": attempt, "image_file": "frame{}.jpg".format(index),
+            "sample_files": ["class0_1_none.png"], "fused_image_name": "X{}_frame{}.jpg".format(attempt + 1, index)}
+
+
+def _write_interrupted_run(path):
+    with RunJournal(path, CONFIG) as journal:
+        journal.record_split(["frame0.jpg", "frame1.jpg", "frame2.jpg"], ["frame3.jpg"], ["class0"], ["class1"])
+        for index in range(3):
+            journal.record_task(_task(index))
+        journal.record_result("train", {"index": 0, "attempt": 0, "status": "ok", "metrics": {"decode": 0.1}})
+        journal.record_result("train", {"index": 1, "attempt": 0, "status": "timeout"})
+        journal.record_task(_task(1, attempt=1))
+    # 中断时最后一行只写出了一部分
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"type": "result", "split": "tra')
+
+
+def test_resume_restores_plan_and_unfinished_tasks(tmp_path):
+    path = str(tmp_path / "run_journal.jsonl")
+    _write_interrupted_run(path)
+
+    # workers 不影响融合计划，修改后仍可续跑
+    with RunJournal(path, dict(CONFIG, workers=8)) as journal:
+        assert journal.split == (["frame0.jpg", "frame1.jpg", "frame2.jpg"], ["frame3.jpg"], ["class0"], ["class1"])
+        assert journal.planned_count("train") == 3
+        assert journal.planned_count("val") == 0
+        assert [(task["index"], task["attempt"]) for task in journal.unfinished_tasks("train")] == [(1, 1), (2, 0)]
+        assert [result["status"] for result in journal.completed_results("train")] == ["ok", "timeout"]
+        assert "metrics" not in journal.completed_results("train")[0]
+        assert sorted(journal.fused_image_names("train")) == ["X1_frame0.jpg", "X1_frame1.jpg", "X1_frame2.jpg", "X2_frame1.jpg"]
+
+        # 续跑时追加的记录在下一次续跑时同样可见
+        journal.record_result("train", {"index": 2, "attempt": 0, "status": "ok"})
+    with RunJournal(path, CONFIG) as journal:
+        assert [(task["index"], task["attempt"]) for task in journal.unfinished_tasks("train")] == [(1, 1)]
+
+
+def test_resume_rejects_changed_plan_config(tmp_path):
+    path = str(tmp_path / "run_journal.jsonl")
+    _write_interrupted_run(path)
+
+    with pytest.raises(ValueError):
+        RunJournal(path, dict(CONFIG, seed=2))
+
+
+def test_no_resume_starts_a_new_journal(tmp_path):
+    path = str(tmp_path / "run_journal.jsonl")
+    _write_interrupted_run(path)
+
+    with RunJournal(path, dict(CONFIG, seed=2), resume=False) as journal:
+        assert journal.split is None
+        assert journal.planned_count("train") == 0
+    with RunJournal(path, dict(CONFIG, seed=2)) as journal:
+        assert journal.split is None
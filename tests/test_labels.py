@@ -0,0 +1,47 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.labels import clip_annotation
+
+
+def _annotation(*shapes):
+    return {"version": "5.0", "flags": {}, "shapes": list(shapes), "imagePath": "frame1.jpg", "imageData": "abc",
+            "imageHeight": 200, "imageWidth": 300}
+
+
+def _shape(label, shape_type, points):
+    return {"label": label, "shape_type": shape_type, "points": points, "group_id": None, "flags": {}}
+
+
+def test_clip_rectangle_to_window_coordinates():
+    annotation = _annotation(_shape("car", "rectangle", [[120, 90], [80, 40]]))
+    clipped = clip_annotation(annotation, 100, 50, 64, 32, "frame1_0_1.jpg")
+
+    assert clipped["shapes"] == [_shape("car", "rectangle", [[0, 0], [20, 32]])]
+    assert (clipped["imagePath"], clipped["imageData"], clipped["imageHeight"], clipped["imageWidth"]) == ("frame1_0_1.jpg", None, 32, 64)
+    # 原标注不被修改
+    assert annotation["shapes"][0]["points"] == [[120, 90], [80, 40]]
+    assert annotation["imagePath"] == "frame1.jpg"
+
+
+def test_clip_polygon_and_drop_shapes_outside():
+    annotation = _annotation(_shape("roof", "polygon", [[0, 0], [20, 0], [20, 20], [0, 20]]),
+                             _shape("tree", "polygon", [[50, 50], [60, 50], [60, 60]]),
+                             _shape("pole", "point", [[5, 5]]),
+                             _shape("wire", "line", [[5, 5], [15, 25]]))
+    clipped = clip_annotation(annotation, 10, 0, 20, 10)
+
+    assert [shape["label"] for shape in clipped["shapes"]] == ["roof"]
+    points = clipped["shapes"][0]["points"]
+    assert sorted(map(tuple, points)) == [(0, 0), (0, 10), (10, 0), (10, 10)]
+    assert clipped["imagePath"] == "frame1.jpg"
+
+
+def test_clip_drops_shapes_below_min_visible():
+    annotation = _annotation(_shape("car", "rectangle", [[0, 0], [10, 10]]), _shape("bus", "rectangle", [[0, 0], [40, 10]]))
+    clipped = clip_annotation(annotation, 5, 0, 100, 100, min_visible=0.6)
+
+    # car 只有一半可见被丢弃，bus 可见 7/8 被保留
+    assert clipped["shapes"] == [_shape("bus", "rectangle", [[0, 0], [35, 10]])]
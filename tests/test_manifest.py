@@ -0,0 +1,46 @@
+import os
+import sys
+import shutil
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.manifest import FileManifest
+
+
+def _write(path, content=b"x"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def _dirs_in_db(db_path, root):
+    with FileManifest(db_path) as manifest:
+        return sorted(row[0] for row in manifest.connection.execute("SELECT dir FROM files WHERE root = ?", (os.path.abspath(root),)))
+
+
+def test_removed_dir_keeps_sibling_rows(tmp_path):
+    # 文件夹名称中的 _ 不能被当作通配符，删除 train_aug 时不影响 trainXaug
+    root, db_path = str(tmp_path / "data"), str(tmp_path / "manifest.sqlite")
+    _write(os.path.join(root, "train_aug", "sub", "a.txt"))
+    _write(os.path.join(root, "trainXaug", "sub", "b.txt"))
+    with FileManifest(db_path) as manifest:
+        manifest.scan(root, recursive=True)
+
+    shutil.rmtree(os.path.join(root, "train_aug"))
+    # 只重新扫描根目录：删除的文件夹按前缀清理，不会重新写入兄弟文件夹的记录
+    with FileManifest(db_path) as manifest:
+        manifest.scan(root)
+
+    assert _dirs_in_db(db_path, root) == [os.path.join("trainXaug", "sub")]
+
+
+def test_rescan_detects_changed_files(tmp_path):
+    root, db_path = str(tmp_path / "data"), str(tmp_path / "manifest.sqlite")
+    _write(os.path.join(root, "a.txt"))
+    with FileManifest(db_path) as manifest:
+        assert set(manifest.scan(root)) == {"a.txt"}
+
+    _write(os.path.join(root, "b.txt"))
+    os.remove(os.path.join(root, "a.txt"))
+    with FileManifest(db_path) as manifest:
+        assert set(manifest.scan(root)) == {"b.txt"}
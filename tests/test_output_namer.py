@@ -0,0 +1,46 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.utils import OutputNamer
+from utils.chips import CHIP_NAME_SUFFIX
+from utils.tiling import TILE_NAME_SUFFIX
+
+
+def _touch(directory, *file_names):
+    for file_name in file_names:
+        open(os.path.join(directory, file_name), 'w').close()
+
+
+def test_reserve_whole_images(tmp_path):
+    _touch(tmp_path, "X1_frame1.jpg", "X1_frame1.json", "X2_frame1.jpg")
+    namer = OutputNamer(str(tmp_path))
+    assert namer.next("frame1.jpg") == "X3_frame1.jpg"
+    assert namer.next("frame2.jpg") == "X1_frame2.jpg"
+
+
+def test_reserve_tiles(tmp_path):
+    _touch(tmp_path, "X2_frame1_0_1.jpg", "X2_frame1_0_1.json", "X1_frame1_3_0.jpg")
+    namer = OutputNamer(str(tmp_path), TILE_NAME_SUFFIX)
+    assert namer.next("frame1.jpg") == "X3_frame1.jpg"
+
+
+def test_reserve_keeps_names_that_look_like_suffixes(tmp_path):
+    # 原始图像名称本身以 "_{数字}_{数字}" 结尾时同样不会重名
+    namer = OutputNamer(str(tmp_path), TILE_NAME_SUFFIX)
+    namer.reserve("X4_frame_2_3.jpg")
+    assert namer.next("frame_2_3.jpg") == "X5_frame_2_3.jpg"
+    assert namer.next("frame.jpg") == "X5_frame.jpg"
+
+
+def test_reserve_chips(tmp_path):
+    _touch(tmp_path, "X1_frame1_c0.jpg", "X1_frame1_c0.json", "X1_frame1_b1.jpg")
+    namer = OutputNamer(str(tmp_path), CHIP_NAME_SUFFIX)
+    assert namer.next("frame1.jpg") == "X2_frame1.jpg"
+
+
+def test_reserve_chip_after_next(tmp_path):
+    namer = OutputNamer(str(tmp_path), CHIP_NAME_SUFFIX)
+    namer.reserve("X1_frame1_c0.jpg")
+    assert namer.next("frame1.jpg") == "X2_frame1.jpg"
@@ -0,0 +1,131 @@
+import os
+import sys
+import json
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.mask_extract import mask_file_path, save_region_mask
+from utils.placement import FreeSpace, FreeSpaceMaskCache
+
+
+HEIGHT, WIDTH = 32, 48
+
+
+def _irregular_mask(height: int = 120, width: int = 160) -> np.ndarray:
+    # 椭圆形可粘贴区域，中间有一个既有目标占用的矩形
+    yy, xx = np.mgrid[:height, :width]
+    mask_region = ((((yy - height / 2) / (height / 2)) ** 2 + ((xx - width / 2) / (width / 2)) ** 2) <= 1).astype(np.uint8) * 255
+    mask_region[50:70, 70:95] = 0
+    return mask_region
+
+
+def _assert_valid(original: np.ndarray, positions, sample_sizes):
+    # 每个样本完整位于原始可粘贴区域内，且样本之间互不重叠
+    used = np.zeros(original.shape, dtype=bool)
+    for position, (height, width) in zip(positions, sample_sizes):
+        if position is None:
+            continue
+        y, x = position
+        assert 0 <= y and 0 <= x and y + height <= original.shape[0] and x + width <= original.shape[1]
+        assert original[y:y + height, x:x + width].all()
+        assert not used[y:y + height, x:x + width].any()
+        used[y:y + height, x:x + width] = True
+
+
+def _write_labelme(path):
+    # 整幅图像为 '__mask__' 区域，实际可粘贴区域由预先生成的掩码图决定
+    shape = {"label": "__mask__", "shape_type": "polygon", "points": [[0, 0], [WIDTH - 1, 0], [WIDTH - 1, HEIGHT - 1], [0, HEIGHT - 1]]}
+    with open(path, 'w') as f:
+        json.dump({"shapes": [shape], "imageHeight": HEIGHT, "imageWidth": WIDTH}, f)
+
+
+def _half_mask(left: bool) -> np.ndarray:
+    mask_region = np.zeros((HEIGHT, WIDTH), dtype=np.uint8)
+    if left:
+        mask_region[:, :WIDTH // 2] = 255
+    else:
+        mask_region[:, WIDTH // 2:] = 255
+    return mask_region
+
+
+def test_mask_cache_separates_mask_dirs(tmp_path):
+    labelme_path, cache_dir = str(tmp_path / "img1.json"), str(tmp_path / "mask_cache")
+    _write_labelme(labelme_path)
+    for name, left in (("left", True), ("right", False)):
+        os.makedirs(tmp_path / name)
+        save_region_mask(_half_mask(left), mask_file_path(str(tmp_path / name), labelme_path))
+
+    for name, left in (("left", True), ("right", False), ("left", True)):
+        _, free_space = FreeSpaceMaskCache(1 << 20, cache_dir, mask_dir=str(tmp_path / name)).get(labelme_path, HEIGHT, WIDTH)
+        assert np.array_equal(free_space.mask_region, _half_mask(left))
+
+
+def test_mask_cache_reloads_regenerated_mask(tmp_path):
+    labelme_path, cache_dir, mask_dir = str(tmp_path / "img1.json"), str(tmp_path / "mask_cache"), str(tmp_path / "masks")
+    _write_labelme(labelme_path)
+    os.makedirs(mask_dir)
+    mask_path = mask_file_path(mask_dir, labelme_path)
+    save_region_mask(_half_mask(True), mask_path)
+    cache = FreeSpaceMaskCache(1 << 20, cache_dir, mask_dir=mask_dir)
+    assert np.array_equal(cache.get(labelme_path, HEIGHT, WIDTH)[1].mask_region, _half_mask(True))
+
+    # 重新生成掩码图后，内存缓存与磁盘缓存都不再使用旧的掩码图
+    save_region_mask(_half_mask(False), mask_path)
+    stat = os.stat(mask_path)
+    os.utime(mask_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert np.array_equal(cache.get(labelme_path, HEIGHT, WIDTH)[1].mask_region, _half_mask(False))
+    fresh = FreeSpaceMaskCache(1 << 20, cache_dir, mask_dir=mask_dir)
+    assert np.array_equal(fresh.get(labelme_path, HEIGHT, WIDTH)[1].mask_region, _half_mask(False))
+    assert fresh.disk_hits == 1
+
+
+@pytest.mark.parametrize("cell", [0, 8])
+def test_place_stays_inside_mask_without_overlap(cell):
+    rng = np.random.default_rng(0)
+    original = _irregular_mask()
+    free_space = FreeSpace(original.copy(), cell)
+    sample_sizes = [tuple(int(v) for v in rng.integers(5, 30, 2)) for _ in range(40)]
+    positions = [free_space.place(height, width, rng) for height, width in sample_sizes]
+
+    assert any(position is not None for position in positions)
+    _assert_valid(original, positions, sample_sizes)
+    # 已放置的区域在掩码图中被标记为已占用
+    for position, (height, width) in zip(positions, sample_sizes):
+        if position is not None:
+            assert not free_space.mask_region[position[0]:position[0] + height, position[1]:position[1] + width].any()
+
+
+def test_place_returns_none_when_sample_does_not_fit():
+    free_space = FreeSpace(_irregular_mask(), 8)
+    assert free_space.place(200, 10) is None
+    assert free_space.place(10, 10) is not None
+
+
+@pytest.mark.parametrize("cell", [0, 8])
+def test_plan_stays_inside_mask_without_overlap(cell):
+    rng = np.random.default_rng(1)
+    original = _irregular_mask()
+    free_space = FreeSpace(original.copy(), cell)
+    sample_sizes = [tuple(int(v) for v in rng.integers(5, 30, 2)) for _ in range(40)]
+    positions = free_space.plan(sample_sizes, rng)
+
+    assert len(positions) == len(sample_sizes)
+    assert any(position is not None for position in positions)
+    _assert_valid(original, positions, sample_sizes)
+    # 规划结束后所有选中区域被标记为已占用，后续 place 不会与之重叠
+    positions.append(free_space.place(5, 5, rng))
+    _assert_valid(original, positions, sample_sizes + [(5, 5)])
+
+
+def test_plan_packs_samples_that_exactly_fill_the_mask():
+    # 4 个 16x16 样本恰好填满 32x32 的区域，逐个随机放置通常放不下，角点规划必须全部放下
+    original = np.zeros((48, 48), dtype=np.uint8)
+    original[8:40, 8:40] = 255
+    sample_sizes = [(16, 16)] * 4
+    positions = FreeSpace(original.copy(), 8).plan(sample_sizes, np.random.default_rng(2))
+
+    assert None not in positions
+    _assert_valid(original, positions, sample_sizes)
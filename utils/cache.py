@@ -0,0 +1,204 @@
+import os
+from collections import OrderedDict
+from multiprocessing import shared_memory
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+import numpy as np
+
+if os.name == "posix":
+    from multiprocessing import resource_tracker
+
+from utils.composite import load_sample_image
+
+
+class ByteLRUCache:
+    """
+    按字节预算淘汰的 LRU 缓存：总占用超过 max_bytes 时，从最久未使用的条目开始淘汰。
+    """
+
+    def __init__(self, max_bytes: int, sizeof: Callable[[Any], int], on_evict: Optional[Callable[[Any], None]] = None):
+        """
+        :param max_bytes: 缓存的字节预算，小于等于 0 时不缓存任何条目
+        :param sizeof: 计算单个缓存值占用字节数的函数
+        :param on_evict: 条目被淘汰或清空时对缓存值调用的函数（可选），用于释放缓存值持有的资源
+        """
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.on_evict = on_evict
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable):
+        return key in self._entries
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        查询缓存，命中时将条目移动到最近使用的位置。
+
+        :return: 返回缓存值，未命中时返回 None
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: Hashable, value: Any):
+        """
+        写入缓存；单个值超过字节预算时不缓存。
+        """
+        if key in self._entries:
+            self._evict(self._entries.pop(key))
+
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+
+        self._entries[key] = (value, size)
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes:
+            self._evict(self._entries.popitem(last=False)[1])
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self.current_bytes -= entry[1]
+        return entry[0]
+
+    def clear(self):
+        while self._entries:
+            self._evict(self._entries.popitem(last=False)[1])
+
+    def _evict(self, entry):
+        self.current_bytes -= entry[1]
+        if self.on_evict is not None:
+            self.on_evict(entry[0])
+
+
+def _sample_nbytes(sample: Tuple[np.ndarray, Optional[np.ndarray]]) -> int:
+    sample_image, sample_alpha = sample
+    return sample_image.nbytes + (sample_alpha.nbytes if sample_alpha is not None else 0)
+
+
+class SampleImageCache:
+    """
+    单个进程内已解码抠图样本的 LRU 缓存，按字节预算淘汰。
+    """
+
+    def __init__(self, max_bytes: int):
+        self.memory = ByteLRUCache(max_bytes, sizeof=_sample_nbytes)
+
+    def load(self, sample_path: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        读取抠图样本，已解码过的样本直接从缓存返回（调用方不得修改返回的数组）。
+
+        :param sample_path: 抠图样本路径
+        :return: 返回 (BGR 样本图像, alpha 通道)
+        """
+        sample = self.memory.get(sample_path)
+        if sample is None:
+            sample = load_sample_image(sample_path)
+            self.memory.put(sample_path, sample)
+        return sample
+
+
+class SharedSampleStore:
+    """
+    主进程中已解码抠图样本的共享内存存储，按字节预算进行 LRU 淘汰。
+
+    主进程在派发任务前解码任务用到的抠图样本并写入共享内存，任务中只携带共享内存描述
+    (名称, 高, 宽, 是否有 alpha 通道)，工作进程按描述直接映射，无需重复解码；每个样本在一次运行中只解码一次
+    （被淘汰后再次使用时才会重新解码）。
+    """
+
+    def __init__(self, max_bytes: int):
+        """
+        :param max_bytes: 共享内存的字节预算；需在启动工作进程之前创建，使工作进程共用主进程的 resource_tracker，
+                          否则工作进程退出时其各自的 resource_tracker 会提前释放共享内存
+        """
+        self.memory = ByteLRUCache(max_bytes, sizeof=lambda entry: entry[0].size, on_evict=self._release)
+        if os.name == "posix":
+            resource_tracker.ensure_running()
+
+    def ensure(self, sample_path: str) -> Optional[Tuple[str, int, int, bool]]:
+        """
+        确保抠图样本已解码并位于共享内存中。
+
+        :param sample_path: 抠图样本路径
+        :return: 返回共享内存描述，样本超过字节预算时返回 None
+        """
+        entry = self.memory.get(sample_path)
+        if entry is not None:
+            return entry[1]
+
+        sample_image, sample_alpha = load_sample_image(sample_path)
+        nbytes = _sample_nbytes((sample_image, sample_alpha))
+        if nbytes > self.memory.max_bytes:
+            return None
+
+        shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+        sample_height, sample_width = sample_image.shape[:2]
+        descriptor = (shm.name, sample_height, sample_width, sample_alpha is not None)
+        shared_image, shared_alpha = _sample_views(shm, descriptor)
+        shared_image[...] = sample_image
+        if shared_alpha is not None:
+            shared_alpha[...] = sample_alpha
+        del shared_image, shared_alpha
+
+        self.memory.put(sample_path, (shm, descriptor))
+
+        return descriptor
+
+    def close(self):
+        self.memory.clear()
+
+    @staticmethod
+    def _release(entry):
+        shm = entry[0]
+        shm.close()
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _sample_views(shm: shared_memory.SharedMemory, descriptor: Tuple[str, int, int, bool]) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    _, sample_height, sample_width, has_alpha = descriptor
+    sample_image = np.ndarray((sample_height, sample_width, 3), dtype=np.uint8, buffer=shm.buf)
+    sample_alpha = None
+    if has_alpha:
+        sample_alpha = np.ndarray((sample_height, sample_width), dtype=np.uint8, buffer=shm.buf, offset=sample_image.nbytes)
+    return sample_image, sample_alpha
+
+
+def attach_shared_sample(descriptor: Tuple[str, int, int, bool]) -> Optional[Tuple[shared_memory.SharedMemory, np.ndarray, Optional[np.ndarray]]]:
+    """
+    在工作进程中按描述映射主进程写入共享内存的抠图样本。
+
+    :param descriptor: SharedSampleStore.ensure 返回的共享内存描述
+    :return: 返回 (共享内存对象, BGR 样本图像, alpha 通道)，共享内存已被主进程释放时返回 None；
+             使用完毕后需先释放数组再调用共享内存对象的 close()
+    """
+    try:
+        try:
+            # Python 3.13 起可以不向 resource_tracker 登记，共享内存统一由主进程释放
+            shm = shared_memory.SharedMemory(name=descriptor[0], track=False)
+        except TypeError:
+            shm = shared_memory.SharedMemory(name=descriptor[0])
+    except FileNotFoundError:
+        return None
+
+    sample_image, sample_alpha = _sample_views(shm, descriptor)
+    sample_image.flags.writeable = False
+    if sample_alpha is not None:
+        sample_alpha.flags.writeable = False
+
+    return shm, sample_image, sample_alpha
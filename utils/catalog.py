@@ -0,0 +1,73 @@
+import os
+from typing import Dict, List, Optional, Tuple
+
+
+# 抠图样本支持的图片文件扩展名
+SAMPLE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif')
+
+# 增强方式标记与对应的配置概率：r 旋转、u 放大、d 缩小、l 亮度
+VARIANT_PROBS = (("r", "rotation_prob"), ("u", "up_prob"), ("d", "down_prob"), ("l", "light_prob"))
+
+
+def parse_sample_file_name(file_name: str) -> Optional[Tuple[str, str, str]]:
+    """
+    按 "类别名称_序号_增强方式.png" 的命名规则解析抠图样本文件名。
+
+    :param file_name: 抠图样本文件名，例如 "异常堆载_3_r90.png"
+    :return: 返回 (类别名称, 样本编号, 增强方式标记)，例如 ("异常堆载", "异常堆载_3", "r")；不符合命名规则时返回 None
+    """
+    base_name, extension = os.path.splitext(file_name)
+    if extension.lower() not in SAMPLE_EXTENSIONS:
+        return None
+
+    parts = base_name.split("_")
+    if len(parts) < 2:
+        return None
+
+    variant = "_".join(parts[2:])
+    tag = variant[:1].lower() if variant and variant != "none" else "none"
+
+    return parts[0], "_".join(parts[:2]), tag
+
+
+def build_sample_catalog(samples_path: str, sample_files: List[str] = None) -> Dict[str, Dict[str, Dict[str, List[str]]]]:
+    """
+    一次性建立抠图样本索引：类别名称 -> 样本编号 -> 增强方式标记 -> 文件名列表。
+
+    :param samples_path: 抠图样本根目录，其下每个类别一个子文件夹
+    :param sample_files: 抠图样本相对 samples_path 的文件路径列表（可选），为空时扫描 samples_path
+    :return: 返回抠图样本索引，文件名列表已排序
+    """
+    catalog = {}
+
+    if sample_files is None:
+        sample_files = list()
+        for class_entry in os.scandir(samples_path):
+            if class_entry.is_dir():
+                sample_files.extend(os.path.join(class_entry.name, entry.name) for entry in os.scandir(class_entry.path) if entry.is_file())
+
+    for sample_file in sample_files:
+        file_name = os.path.basename(sample_file)
+        parsed = parse_sample_file_name(file_name)
+        if parsed is None:
+            continue
+        class_name, sample_id, tag = parsed
+        catalog.setdefault(class_name, {}).setdefault(sample_id, {}).setdefault(tag, []).append(file_name)
+
+    for samples in catalog.values():
+        for variants in samples.values():
+            for files in variants.values():
+                files.sort()
+
+    return catalog
+
+
+def sample_variants(catalog: Dict[str, Dict[str, Dict[str, List[str]]]], sample_id: str) -> Dict[str, List[str]]:
+    """
+    查询某个样本编号的全部增强版本。
+
+    :param catalog: build_sample_catalog 得到的抠图样本索引
+    :param sample_id: 样本编号，例如 "异常堆载_3"
+    :return: 返回 增强方式标记 -> 文件名列表 的字典
+    """
+    return catalog[sample_id.split("_")[0]][sample_id]
@@ -0,0 +1,150 @@
+import os
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+
+from utils.labels import clip_annotation, write_image_labels
+from utils.metrics import TaskMetrics
+from utils.tiling import TiledCanvas
+from utils.writer import encode_image
+
+
+# 切片图像文件名附加在融合图像名称后的 "_c{序号}"、"_b{序号}" 后缀（正则表达式），见 chip_file_name 与 utils.utils.OutputNamer
+CHIP_NAME_SUFFIX = r"_[cb]\d+"
+
+# 随机背景切片避开粘贴样本的最大尝试次数（每个切片）
+_BACKGROUND_ATTEMPTS = 20
+
+
+def check_chip_options(config):
+    """
+    检查切片输出模式的配置，不支持时抛出 ValueError。
+    """
+    if config["chip_size"] < 0 or config["background_chips"] < 0:
+        raise ValueError("chip_size and background_chips must not be negative")
+
+
+def _sample_boxes(annotation: Dict) -> List[Tuple[int, int, int, int]]:
+    # 粘贴样本的 (y, x, 高度, 宽度)，即 utils.fusion.place_samples 添加的 AugSample 矩形框
+    boxes = list()
+    for shape in annotation["shapes"]:
+        if shape["label"] == "AugSample" and shape["shape_type"] == "rectangle":
+            (x0, y0), (x1, y1) = shape["points"]
+            boxes.append((min(y0, y1), min(x0, x1), abs(y1 - y0), abs(x1 - x0)))
+    return boxes
+
+
+def _chip_origin(start: int, length: int, chip_length: int, image_length: int, rng: np.random.Generator) -> int:
+    # 切片在一个方向上的起点：样本能完整放入切片时在可行范围内随机选择，避免样本总是位于切片中心；否则切片以样本为中心
+    low, high = max(start + length - chip_length, 0), min(start, image_length - chip_length)
+    if low <= high:
+        return int(rng.integers(low, high + 1))
+    return min(max(start + length // 2 - chip_length // 2, 0), image_length - chip_length)
+
+
+def _contains(window: Tuple[int, int, int, int], box: Tuple[int, int, int, int]) -> bool:
+    y0, x0, height, width = window
+    y, x, h, w = box
+    return y0 <= y and x0 <= x and y + h <= y0 + height and x + w <= x0 + width
+
+
+def _intersects(window: Tuple[int, int, int, int], box: Tuple[int, int, int, int]) -> bool:
+    y0, x0, height, width = window
+    y, x, h, w = box
+    return y < y0 + height and y + h > y0 and x < x0 + width and x + w > x0
+
+
+def chip_windows(annotation: Dict, image_height: int, image_width: int, chip_size: int, background_chips: int = 0,
+                 rng: np.random.Generator = None, sample_count: int = None) -> Tuple[List[Tuple[int, int, int, int]], List[Tuple[int, int, int, int]]]:
+    """
+    选择融合图像的切片窗口 (y0, x0, 高度, 宽度)，图像小于 chip_size 时切片取图像尺寸。
+
+    每个粘贴样本一个切片（样本已完整包含在之前的切片中时不再单独切片），样本在切片中的位置随机；
+    背景切片随机选择，不与任何粘贴样本相交，原始图像中的既有目标按切片裁剪保留。
+
+    :param annotation: 融合图像的标注内容，粘贴样本为 AugSample 矩形框
+    :param chip_size: 切片边长
+    :param background_chips: 背景切片数量，图像中找不到不与样本相交的窗口时少于该数量
+    :param sample_count: 融合任务的样本数量（可选），只为最后 sample_count 个 AugSample 矩形框（本次粘贴的样本添加在标注末尾）切片，
+                         样本切片数量不超过该值，见 chip_output_names
+    :return: 返回 (样本切片列表, 背景切片列表)
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    chip_height, chip_width = min(chip_size, image_height), min(chip_size, image_width)
+    boxes = _sample_boxes(annotation)
+
+    pasted_boxes = boxes if sample_count is None else boxes[len(boxes) - min(sample_count, len(boxes)):]
+
+    sample_windows = list()
+    for y, x, h, w in pasted_boxes:
+        if any(_contains(window, (y, x, h, w)) for window in sample_windows):
+            continue
+        sample_windows.append((_chip_origin(y, h, chip_height, image_height, rng),
+                               _chip_origin(x, w, chip_width, image_width, rng), chip_height, chip_width))
+
+    background_windows = list()
+    for _ in range(background_chips):
+        for _ in range(_BACKGROUND_ATTEMPTS):
+            window = (int(rng.integers(0, image_height - chip_height + 1)), int(rng.integers(0, image_width - chip_width + 1)),
+                      chip_height, chip_width)
+            if not any(_intersects(window, box) for box in boxes):
+                background_windows.append(window)
+                break
+
+    return sample_windows, background_windows
+
+
+def chip_file_name(image_name: str, kind: str, index: int) -> str:
+    """
+    :param kind: "c" 为样本切片，"b" 为背景切片
+    :return: 返回切片图像的文件名，例如 ("X1_0001.jpg", "c", 2) -> "X1_0001_c2.jpg"
+    """
+    stem, extension = os.path.splitext(image_name)
+    return "{}_{}{}{}".format(stem, kind, index, extension)
+
+
+def chip_output_names(image_name: str, sample_count: int, background_chips: int) -> List[str]:
+    """
+    :param sample_count: 融合任务的样本数量，样本切片不超过该数量
+    :return: 返回融合图像所有可能写出的切片图像文件名，用于清理未完成任务的输出
+    """
+    return [chip_file_name(image_name, "c", index) for index in range(sample_count)] + \
+           [chip_file_name(image_name, "b", index) for index in range(background_chips)]
+
+
+def write_chip_outputs(fused_image: Union[np.ndarray, TiledCanvas], annotation: Dict, output_dir: str, image_name: str, config,
+                       rng: np.random.Generator = None, metrics: TaskMetrics = None, sample_count: int = None) -> List[Tuple[str, Dict]]:
+    """
+    只写出 chip_size 大小的切片（见 chip_windows），不编码整幅融合图像；标注按切片裁剪并平移到切片坐标（见 utils.labels.clip_annotation）。
+
+    :param fused_image: 融合图像，分块处理模式下为 TiledCanvas
+    :param rng: 选择切片位置的随机数生成器
+    :param metrics: 任务指标（可选），记录编码、写出耗时、切片数量与写出的字节数
+    :param sample_count: 融合任务的样本数量（可选），见 chip_windows
+    :return: 返回写出的 (切片文件名, 标注内容) 列表
+    """
+    metrics = TaskMetrics() if metrics is None else metrics
+    image_height, image_width = fused_image.shape[:2]
+    sample_windows, background_windows = chip_windows(annotation, image_height, image_width, config["chip_size"],
+                                                      config["background_chips"], rng, sample_count)
+    metrics.count("sample_chips", len(sample_windows))
+    metrics.count("background_chips", len(background_windows))
+
+    outputs = list()
+    for kind, windows in (("c", sample_windows), ("b", background_windows)):
+        for index, (y0, x0, height, width) in enumerate(windows):
+            chip_name = chip_file_name(image_name, kind, index)
+            chip_annotation = clip_annotation(annotation, x0, y0, width, height, chip_name, config["clip_min_visible"])
+            if isinstance(fused_image, TiledCanvas):
+                chip = fused_image.read(y0, x0, height, width)
+            else:
+                chip = np.ascontiguousarray(fused_image[y0:y0 + height, x0:x0 + width])
+            with metrics.stage("encode"):
+                buffer = encode_image(chip, config["image_format"], config["image_quality"], config["png_compression"])
+            with metrics.stage("write"):
+                buffer.tofile(os.path.join(output_dir, chip_name))
+                label_bytes = write_image_labels(output_dir, chip_name, chip_annotation, config)
+            metrics.count("bytes_written", buffer.nbytes + label_bytes)
+            outputs.append((chip_name, chip_annotation))
+
+    return outputs
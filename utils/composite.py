@@ -0,0 +1,125 @@
+from typing import Optional, Tuple
+
+import numpy as np
+import cv2
+
+
+# 支持的融合方式：
+#   mask    - 只替换样本的前景像素（有 alpha 通道时取 alpha > 0，否则取非 0 像素）
+#   alpha   - 使用 PNG 的 alpha 通道进行透明度混合，没有 alpha 通道时退化为 mask
+#   feather - 对前景掩码进行高斯羽化后混合，弱化粘贴边缘
+#   poisson - 使用 cv2.seamlessClone 进行泊松融合
+BLEND_MODES = ("mask", "alpha", "feather", "poisson")
+
+
+def load_sample_image(sample_path: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    读取抠图样本，保留 PNG 中的 alpha 通道。
+
+    :param sample_path: 抠图样本路径
+    :return: 返回 (BGR 样本图像, alpha 通道)，样本没有 alpha 通道时 alpha 为 None
+    """
+    sample_image = cv2.imdecode(np.fromfile(sample_path, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+
+    if sample_image.ndim == 2:
+        return cv2.cvtColor(sample_image, cv2.COLOR_GRAY2BGR), None
+    if sample_image.shape[2] == 4:
+        return np.ascontiguousarray(sample_image[:, :, :3]), np.ascontiguousarray(sample_image[:, :, 3])
+    return sample_image[:, :, :3], None
+
+
+def sample_foreground(sample_image: np.ndarray, sample_alpha: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    计算样本的前景布尔掩码：有 alpha 通道时取 alpha > 0，否则取任一通道非 0 的像素。
+
+    :param sample_image: BGR 样本图像
+    :param sample_alpha: alpha 通道（可选）
+    :return: 返回与样本同尺寸的布尔掩码
+    """
+    if sample_alpha is not None:
+        return sample_alpha > 0
+    return np.any(sample_image != 0, axis=2)
+
+
+def composite_sample(image: np.ndarray, sample_image: np.ndarray, sample_alpha: Optional[np.ndarray],
+                     y_offset: int, x_offset: int, blend_mode: str = "mask", feather_radius: int = 3) -> None:
+    """
+    将样本图像以指定融合方式一次性合成到原始图像的 ROI 上（原地修改）。
+
+    :param image: 原始图像
+    :param sample_image: BGR 样本图像
+    :param sample_alpha: alpha 通道（可选）
+    :param y_offset: 粘贴位置左上角 y 坐标
+    :param x_offset: 粘贴位置左上角 x 坐标
+    :param blend_mode: 融合方式，见 BLEND_MODES
+    :param feather_radius: feather 方式下的羽化半径（像素）
+    """
+    if blend_mode not in BLEND_MODES:
+        raise ValueError(f"Unknown blend mode: {blend_mode}, expected one of {BLEND_MODES}")
+
+    sample_height, sample_width = sample_image.shape[:2]
+    foreground = sample_foreground(sample_image, sample_alpha)
+
+    # 原始图像为灰度图或带 alpha 通道时，只在对应的颜色通道上进行合成
+    if image.ndim == 2:
+        sample_image = cv2.cvtColor(sample_image, cv2.COLOR_BGR2GRAY)
+        roi = image[y_offset:y_offset + sample_height, x_offset:x_offset + sample_width]
+    else:
+        roi = image[y_offset:y_offset + sample_height, x_offset:x_offset + sample_width, :3]
+
+    if blend_mode == "poisson":
+        if _seamless_clone(image, sample_image, foreground, y_offset, x_offset):
+            return
+        blend_mode = "mask"
+
+    if blend_mode == "alpha" and sample_alpha is None:
+        blend_mode = "mask"
+
+    if blend_mode == "mask":
+        np.copyto(roi, sample_image, where=foreground[..., None] if roi.ndim == 3 else foreground)
+        return
+
+    if blend_mode == "alpha":
+        weights = sample_alpha.astype(np.float32) / 255.0
+    else:
+        kernel_size = 2 * max(int(feather_radius), 1) + 1
+        weights = cv2.GaussianBlur(foreground.astype(np.float32), (kernel_size, kernel_size), 0)
+        # 羽化只向前景内部收缩，不让背景像素（通常为黑色）渗入原始图像
+        weights *= foreground
+
+    blended = cv2.blendLinear(sample_image, np.ascontiguousarray(roi), weights, 1.0 - weights)
+    roi[...] = blended
+
+
+def _seamless_clone(image: np.ndarray, sample_image: np.ndarray, foreground: np.ndarray, y_offset: int, x_offset: int) -> bool:
+    """
+    在粘贴位置附近的 ROI 上执行泊松融合，避免对整幅图像求解。
+
+    :return: 融合成功返回 True；前景为空、图像非三通道或 ROI 过小无法融合时返回 False
+    """
+    if image.ndim != 3 or not foreground.any():
+        return False
+
+    sample_height, sample_width = sample_image.shape[:2]
+    image_height, image_width = image.shape[:2]
+
+    # seamlessClone 要求前景外接矩形距离目标图像边界至少 1 个像素，因此在 ROI 四周留出边距
+    pad = 2
+    y0, x0 = max(y_offset - pad, 0), max(x_offset - pad, 0)
+    y1, x1 = min(y_offset + sample_height + pad, image_height), min(x_offset + sample_width + pad, image_width)
+
+    dst = np.ascontiguousarray(image[y0:y1, x0:x1, :3])
+    src = np.zeros_like(dst)
+    mask = np.zeros(dst.shape[:2], dtype=np.uint8)
+    src[y_offset - y0:y_offset - y0 + sample_height, x_offset - x0:x_offset - x0 + sample_width] = sample_image
+    mask[y_offset - y0:y_offset - y0 + sample_height, x_offset - x0:x_offset - x0 + sample_width][foreground] = 255
+
+    # 贴边时去掉掩码最外圈像素，满足 seamlessClone 的边界要求
+    mask[0, :] = mask[-1, :] = 0
+    mask[:, 0] = mask[:, -1] = 0
+    if not mask.any():
+        return False
+
+    x, y, w, h = cv2.boundingRect(mask)
+    image[y0:y1, x0:x1, :3] = cv2.seamlessClone(src, dst, mask, (x + w // 2, y + h // 2), cv2.NORMAL_CLONE)
+    return True
@@ -0,0 +1,711 @@
+import os
+import random
+import queue
+import signal
+import threading
+import traceback
+from collections import Counter, deque
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import wait
+from time import monotonic
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from tqdm import tqdm
+
+from format_trans.image_size import image_size
+from utils.utils import OutputNamer, peak_rss_mb
+from utils.fusion import paste_samples_on_image, FusionTimeoutError
+from utils.placement import FreeSpaceMaskCache
+from utils.cache import SampleImageCache, SharedSampleStore, attach_shared_sample
+from utils.writer import AsyncWriter, encode_image, IMAGE_FORMATS
+from utils.labels import LABEL_FILE_EXTENSIONS, coco_annotation, label_file_name, write_image_labels
+from utils.metrics import TaskMetrics, profile_session
+from utils.chips import CHIP_NAME_SUFFIX, chip_output_names, write_chip_outputs
+from utils.tiling import TILE_NAME_SUFFIX, TiledFreeSpaceCache, paste_samples_on_tiled_image, tile_output_names, write_tiled_outputs
+
+
+# 工作进程中使用的配置、可粘贴区域掩码图缓存（分块处理模式下为粗网格占用图缓存）与抠图样本缓存，由 _init_worker 设置
+_worker_config = None
+_worker_mask_cache = None
+_worker_sample_cache = None
+
+# 训练集、验证集在随机种子序列中的编号，保证两者的任务随机数互不相同
+SPLIT_IDS = {"train": 0, "val": 1}
+
+# 工作进程超过 time_limit 后仍未返回时，再等待该秒数后强制结束进程
+KILL_GRACE_SECONDS = 5
+
+# 主进程轮询工作进程状态的时间间隔（秒）
+POLL_INTERVAL_SECONDS = 0.5
+
+
+def _init_worker(config, shared_samples: bool = False):
+    """
+    :param shared_samples: 样本由主进程的 SharedSampleStore 共享时为 True，此时本进程不再缓存已解码样本，
+                           只解码共享内存中没有的样本，避免每个工作进程各占用一份 sample_cache_mb
+    """
+    global _worker_config, _worker_mask_cache, _worker_sample_cache
+    _worker_config = config
+    if config["tile_size"]:
+        _worker_mask_cache = TiledFreeSpaceCache(config["mask_cache_mb"] * 1024 * 1024, config["placement_grid"], config["tile_size"])
+    else:
+        cache_dir = os.path.join(config["output_path"], config["mask_cache_dir"]) if config["mask_cache_dir"] else None
+        _worker_mask_cache = FreeSpaceMaskCache(config["mask_cache_mb"] * 1024 * 1024, cache_dir, config["placement_grid"], config["mask_dir"] or None)
+    _worker_sample_cache = SampleImageCache(0 if shared_samples else config["sample_cache_mb"] * 1024 * 1024)
+
+
+def _sample_paths(config, sample_files: List[str]) -> List[str]:
+    return [os.path.join(config["samples_path"], sample_file.split("_")[0], sample_file) for sample_file in sample_files]
+
+
+def _image_extension(config) -> str:
+    """
+    融合图像文件扩展名：jpg 格式沿用原始图像文件名（与既有输出一致），其他格式替换为对应扩展名；
+    分块处理模式以 memmap 方式输出时为 .npy（切片输出模式除外）。
+    """
+    if config["tile_size"] and config["tile_output"] == "memmap" and not config["chip_size"]:
+        return ".npy"
+    return None if config["image_format"] == "jpg" else IMAGE_FORMATS[config["image_format"]]
+
+
+def output_name_suffix(config) -> Optional[str]:
+    """
+    一个融合任务输出多个图像时附加在融合图像名称后的后缀（正则表达式），输出整幅融合图像时为 None，见 utils.utils.OutputNamer。
+    """
+    if config["chip_size"]:
+        return CHIP_NAME_SUFFIX
+    if config["tile_size"] and config["tile_output"] == "tiles":
+        return TILE_NAME_SUFFIX
+    return None
+
+
+def task_seed(config, split: str, index: int, attempt: int = 0) -> np.random.SeedSequence:
+    """
+    融合任务的随机种子只由全局种子、数据集划分、任务序号（与重试次数）决定，与工作进程数量和是否续跑无关。
+    """
+    spawn_key = (SPLIT_IDS[split], index) if attempt == 0 else (SPLIT_IDS[split], index, attempt)
+    return np.random.SeedSequence(config["seed"], spawn_key=spawn_key)
+
+
+def iter_fusion_tasks(aug_pairs: Iterable[Dict[str, List[str]]], split: str, config, output_dir: str,
+                      namer: OutputNamer = None, start: int = 0) -> Iterator[Dict]:
+    """
+    将原始图像与抠图样本对逐个转换为融合任务，并在主进程中分配输出文件名与随机种子。
+
+    :param aug_pairs: 原始图像与抠图样本对的可迭代对象，见 iter_images_match_samples
+    :param split: 数据集划分名称，"train" 或 "val"
+    :param config: 配置字典
+    :param output_dir: 融合图像输出文件夹
+    :param namer: 分配融合图像名称的 OutputNamer（可选），默认从 output_dir 中已有文件之后编号；
+                  与 run_fusion_tasks 共用时重试任务的文件名不会与后续任务重复
+    :param start: 第一个任务的序号，续跑时从已派发的任务之后继续
+    :return: 返回融合任务的生成器
+    """
+    namer = OutputNamer(output_dir, output_name_suffix(config)) if namer is None else namer
+
+    for index, match_pair in enumerate(aug_pairs, start):
+        image_file, sample_files = next(iter(match_pair.items()))
+
+        yield {
+            "index": index,
+            "attempt": 0,
+            "split": split,
+            "image_file": image_file,
+            "sample_files": sample_files,
+            "fused_image_name": namer.next(image_file, _image_extension(config)),
+            "output_dir": output_dir,
+            "seed": task_seed(config, split, index),
+        }
+
+
+def restore_fusion_task(record: Dict, config, output_dir: str) -> Dict:
+    """
+    根据运行日志中的任务记录恢复融合任务，沿用原有的文件名与随机种子。
+
+    :param record: RunJournal.unfinished_tasks 返回的任务记录
+    :param output_dir: 融合图像输出文件夹
+    :return: 返回融合任务
+    """
+    return {
+        "index": record["index"],
+        "attempt": record["attempt"],
+        "split": record["split"],
+        "image_file": record["image_file"],
+        "sample_files": record["sample_files"],
+        "fused_image_name": record["fused_image_name"],
+        "output_dir": output_dir,
+        "seed": task_seed(config, record["split"], record["index"], record["attempt"]),
+    }
+
+
+def _cache_counts() -> Tuple[int, int, int, int, int]:
+    # 本进程掩码图缓存与样本缓存的累计命中、未命中次数
+    return (_worker_mask_cache.memory.hits, _worker_mask_cache.memory.misses, getattr(_worker_mask_cache, "disk_hits", 0),
+            _worker_sample_cache.memory.hits, _worker_sample_cache.memory.misses)
+
+
+def compose_task(task: Dict, metrics: TaskMetrics = None) -> Tuple[np.ndarray, Dict]:
+    """
+    执行单个融合任务的计算部分：粘贴样本并生成标注内容。
+
+    :param task: iter_fusion_tasks 生成的融合任务
+    :param metrics: 任务指标（可选），记录各阶段耗时、放置尝试与缓存命中次数
+    :return: 返回融合后的图像（分块处理模式下为 utils.tiling.TiledCanvas）和标注文件内容
+    """
+    config = _worker_config
+    metrics = TaskMetrics() if metrics is None else metrics
+    rng = np.random.default_rng(task["seed"])
+    random.seed(int(task["seed"].generate_state(1)[0]))
+
+    image_path = os.path.join(config["ori_img_path"], task["image_file"])
+    sample_images_path = _sample_paths(config, task["sample_files"])
+
+    # 优先映射主进程写入共享内存的已解码样本，否则使用本进程的样本缓存
+    shared_descriptors = task.get("shared_samples", {})
+    attached = list()
+
+    def load_sample(sample_path):
+        descriptor = shared_descriptors.get(sample_path)
+        shared_sample = attach_shared_sample(descriptor) if descriptor is not None else None
+        if shared_sample is None:
+            return _worker_sample_cache.load(sample_path)
+        attached.append(shared_sample[0])
+        metrics.count("shared_sample_hits")
+        return shared_sample[1], shared_sample[2]
+
+    cache_counts = _cache_counts()
+    try:
+        if config["tile_size"]:
+            fused_image, fused_label = paste_samples_on_tiled_image(
+                image_path, sample_images_path, blend_mode=config["blend_mode"], feather_radius=config["feather_radius"], rng=rng,
+                deadline=monotonic() + config["time_limit"], free_space_cache=_worker_mask_cache,
+                image_cache_dir=os.path.join(config["output_path"], config["tile_cache_dir"]) if config["tile_cache_dir"] else None,
+                image_cache_bytes=config["tile_cache_mb"] * 1024 * 1024,
+                sample_loader=load_sample, metrics=metrics, placement_mode=config["placement_mode"])
+        else:
+            fused_image, fused_label = paste_samples_on_image(image_path=image_path, sample_images_path=sample_images_path,
+                                                              blend_mode=config["blend_mode"], feather_radius=config["feather_radius"],
+                                                              rng=rng, deadline=monotonic() + config["time_limit"], mask_cache=_worker_mask_cache,
+                                                              placement_grid=config["placement_grid"], sample_loader=load_sample, metrics=metrics,
+                                                              placement_mode=config["placement_mode"])
+    finally:
+        for name, before, after in zip(("mask_cache_hits", "mask_cache_misses", "mask_disk_hits", "sample_cache_hits", "sample_cache_misses"),
+                                       cache_counts, _cache_counts()):
+            metrics.count(name, after - before)
+        for shm in attached:
+            try:
+                shm.close()
+            except BufferError:
+                # 异常回溯仍引用样本数组时无法立即关闭，交由垃圾回收处理
+                pass
+
+    fused_label["imagePath"] = task["fused_image_name"]
+
+    # 过滤掉类别为__mask__的目标
+    fused_label["shapes"] = [shape for shape in fused_label['shapes'] if shape['label'] != '__mask__']
+
+    return fused_image, fused_label
+
+
+def write_task_outputs(task: Dict, fused_image: np.ndarray, fused_label: Dict, metrics: TaskMetrics = None) -> List[Tuple[str, Dict]]:
+    """
+    执行单个融合任务的写出部分：按 image_format 编码融合图像，并按 label_formats 写出标注文件；
+    切片输出模式下只写出切片，见 utils.chips.write_chip_outputs；分块处理模式下按 tile_output 写出，见 utils.tiling.write_tiled_outputs。
+
+    :param metrics: 任务指标（可选），记录编码、写出耗时与写出的字节数
+    :return: 返回写出的 (图像文件名, 标注内容) 列表
+    """
+    config = _worker_config
+    metrics = TaskMetrics() if metrics is None else metrics
+
+    if config["chip_size"]:
+        # 切片位置使用任务种子的第一个子种子，与融合过程的随机数相互独立；重试任务的种子为 (split, index, attempt)，不会与之重复
+        chip_seed = np.random.SeedSequence(task["seed"].entropy, spawn_key=task["seed"].spawn_key + (0,))
+        return write_chip_outputs(fused_image, fused_label, task["output_dir"], task["fused_image_name"], config,
+                                  np.random.default_rng(chip_seed), metrics, sample_count=len(task["sample_files"]))
+    if config["tile_size"]:
+        return write_tiled_outputs(fused_image, fused_label, task["output_dir"], task["fused_image_name"], config, metrics)
+
+    with metrics.stage("encode"):
+        buffer = encode_image(fused_image, config["image_format"], config["image_quality"], config["png_compression"])
+
+    with metrics.stage("write"):
+        buffer.tofile(os.path.join(task["output_dir"], task["fused_image_name"]))
+        label_bytes = write_image_labels(task["output_dir"], task["fused_image_name"], fused_label, config)
+
+    metrics.count("bytes_written", buffer.nbytes + label_bytes)
+    return [(task["fused_image_name"], fused_label)]
+
+
+def _ok_result(task: Dict, outputs: List[Tuple[str, Dict]], elapsed: float, compute_seconds: float, write_seconds: float,
+               metrics: TaskMetrics = None) -> Dict:
+    result = _task_result(task, "ok", elapsed, compute_seconds=compute_seconds, write_seconds=write_seconds, metrics=metrics)
+    # COCO 标注由主进程统一写出，随结果发回所需的标注内容；输出多个分块或切片图像时逐个发回
+    if "coco" in _worker_config["label_formats"]:
+        if len(outputs) == 1 and outputs[0][0] == task["fused_image_name"]:
+            result["annotation"] = coco_annotation(outputs[0][1])
+        else:
+            result["output_annotations"] = [(image_name, coco_annotation(annotation)) for image_name, annotation in outputs]
+    return result
+
+
+def _task_key(task: Dict) -> Tuple[int, int]:
+    return task["index"], task["attempt"]
+
+
+def _task_result(task: Dict, status: str, elapsed: float, message: str = None, compute_seconds: float = None, write_seconds: float = None,
+                 metrics: TaskMetrics = None) -> Dict:
+    return {"index": task["index"], "attempt": task["attempt"], "image_file": task["image_file"], "sample_files": task["sample_files"],
+            "fused_image_name": task["fused_image_name"], "status": status, "elapsed": elapsed, "message": message,
+            "compute_seconds": compute_seconds, "write_seconds": write_seconds, "peak_rss_mb": peak_rss_mb(),
+            "dropped_samples": metrics.dropped_samples if metrics is not None else None,
+            "metrics": metrics.to_dict() if metrics is not None else None}
+
+
+def _process_task(task: Dict, writer: AsyncWriter, send: Callable[[Tuple], None]):
+    """
+    计算融合任务并将写出交给后台写出线程，超时与异常转换为任务结果，避免单个任务中断整个融合过程。
+
+    通过 send 发送两种消息：("computed", 任务键) 表示计算完成、可以接收下一个任务；
+    ("done", 执行结果) 表示任务结束（写出完成或失败）。
+    """
+    start_time = monotonic()
+    metrics = TaskMetrics()
+    try:
+        fused_image, fused_label = compose_task(task, metrics)
+    except FusionTimeoutError:
+        send(("done", _task_result(task, "timeout", monotonic() - start_time, metrics=metrics)))
+        return
+    except Exception:
+        send(("done", _task_result(task, "error", monotonic() - start_time, traceback.format_exc(limit=3), metrics=metrics)))
+        return
+    compute_seconds = monotonic() - start_time
+
+    def write():
+        write_start = monotonic()
+        try:
+            outputs = write_task_outputs(task, fused_image, fused_label, metrics)
+        except Exception:
+            _remove_task_outputs(task, _worker_config)
+            result = _task_result(task, "error", monotonic() - start_time, traceback.format_exc(limit=3), compute_seconds=compute_seconds, metrics=metrics)
+        else:
+            result = _ok_result(task, outputs, monotonic() - start_time, compute_seconds, monotonic() - write_start, metrics)
+        send(("done", result))
+
+    writer.submit(write)
+    send(("computed", _task_key(task)))
+
+
+def _create_writer(config) -> AsyncWriter:
+    return AsyncWriter(config["writer_threads"], config["writer_queue_size"])
+
+
+def _worker_main(conn, config):
+    """
+    工作进程主循环：从管道接收任务，计算后交给后台线程写出，结果发回主进程，收到 None 时等待写出完成后退出。
+    """
+    # Ctrl+C 由主进程处理，工作进程继续完成当前任务
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _init_worker(config, shared_samples=True)
+    writer = _create_writer(config)
+    lock = threading.Lock()
+
+    def send(message):
+        # 计算线程与写出线程共用同一个管道
+        with lock:
+            conn.send(message)
+
+    # 按 profiler 配置对工作进程单独进行性能分析，分析结果以进程号区分
+    with profile_session(config["profiler"], os.path.join(config["output_path"], config["profile_dir"], "worker-{}".format(os.getpid()))):
+        while True:
+            task = conn.recv()
+            if task is None:
+                break
+            _process_task(task, writer, send)
+
+        writer.close()
+
+
+class _Worker:
+    """
+    主进程中对单个工作进程的管理：每个工作进程使用独立管道，强制结束某个进程不会影响其他进程。
+
+    task 为正在计算的任务，writing 为已计算完成、正在后台写出的任务（任务键 -> (任务, 开始时间)）。
+    """
+
+    def __init__(self, config):
+        self.conn, child_conn = Pipe()
+        self.process = Process(target=_worker_main, args=(child_conn, config), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.task = None
+        self.started = None
+        self.writing = {}
+
+    def submit(self, task: Dict):
+        self.task = task
+        self.started = monotonic()
+        self.conn.send(task)
+
+    def release(self) -> Dict:
+        task, self.task, self.started = self.task, None, None
+        return task
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join()
+        self.conn.close()
+
+
+class _InlineWorker:
+    """
+    workers 为 0 时在主进程中串行计算融合任务，写出仍交给后台写出线程，接口与 _Worker 相同。
+    """
+
+    def __init__(self, config):
+        _init_worker(config)
+        self.writer = _create_writer(config)
+        self.messages = queue.Queue()
+        self.task = None
+        self.started = None
+        self.writing = {}
+
+    def submit(self, task: Dict):
+        self.task = task
+        self.started = monotonic()
+        _process_task(task, self.writer, self.messages.put)
+
+    def release(self) -> Dict:
+        task, self.task, self.started = self.task, None, None
+        return task
+
+    def kill(self):
+        self.writer.close()
+
+    def stop(self):
+        self.writer.close()
+
+
+def _retry_task(task: Dict, config, namer: OutputNamer, image_files: List[str], tried_images: Dict[int, set]) -> Dict:
+    """
+    为超时任务更换一张尚未尝试过的原始图像，保持抠图样本不变，生成重试任务；没有可换的原始图像时返回 None。
+    """
+    tried = tried_images.setdefault(task["index"], {task["image_file"]})
+    candidates = sorted(set(image_files) - tried)
+    if not candidates:
+        return None
+
+    attempt = task["attempt"] + 1
+    seed = task_seed(config, task["split"], task["index"], attempt)
+    image_file = candidates[int(np.random.default_rng(seed).integers(len(candidates)))]
+    tried.add(image_file)
+
+    return dict(task, attempt=attempt, image_file=image_file, seed=seed,
+                fused_image_name=namer.next(image_file, _image_extension(config)))
+
+
+def _task_output_names(task: Dict, config) -> List[str]:
+    """
+    任务可能写出的全部图像文件名，只由任务与配置确定，不按通配符匹配输出文件夹，避免误删其他原始图像的输出。
+    """
+    if config["chip_size"]:
+        return chip_output_names(task["fused_image_name"], len(task["sample_files"]), config["background_chips"])
+    if config["tile_size"] and config["tile_output"] == "tiles":
+        try:
+            image_width, image_height = image_size(os.path.join(config["ori_img_path"], task["image_file"]))
+        except (OSError, ValueError):
+            # 原始图像无法读取时任务不会写出任何分块
+            return [task["fused_image_name"]]
+        return tile_output_names(task["fused_image_name"], image_height, image_width, config["tile_size"])
+    return [task["fused_image_name"]]
+
+
+def _remove_task_outputs(task: Dict, config):
+    """
+    删除被强制结束的任务可能残留的不完整输出文件。
+    """
+    for image_name in _task_output_names(task, config):
+        for file_name in [image_name] + [label_file_name(image_name, label_format) for label_format in LABEL_FILE_EXTENSIONS]:
+            path = os.path.join(task["output_dir"], file_name)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _stage_samples(sample_store: SharedSampleStore, config, task: Dict):
+    """
+    在主进程中解码任务用到的抠图样本并写入共享内存，记录共享内存描述。
+    """
+    shared_samples = {path: sample_store.ensure(path) for path in _sample_paths(config, task["sample_files"])}
+    task["shared_samples"] = {path: descriptor for path, descriptor in shared_samples.items() if descriptor is not None}
+
+
+def run_fusion_tasks(tasks: Iterable[Dict], config, desc: str, image_files: List[str] = None, namer: OutputNamer = None,
+                     target: int = None, stop: Callable[[Counter], bool] = None, on_result: Callable[[Dict], None] = None,
+                     on_dispatch: Callable[[Dict], None] = None) -> Counter:
+    """
+    使用多个工作进程并行执行融合任务，任务从 tasks 中按需取出，执行结果按任务顺序逐条交给 on_result。
+
+    主进程只预先取出 task_queue_size 个任务并提前解码其抠图样本，内存占用与任务总数无关，可用于持续生成。
+    每个任务在工作进程内受 time_limit 截止时间约束（协作式超时）；若工作进程在 time_limit 之后仍未返回，
+    主进程会强制结束该进程并重新启动一个新的工作进程。超时任务可按 timeout_retries 更换原始图像重试。
+    设置 target 时，失败的任务由后续任务补足，直到成功生成 target 张融合图像。
+    按下 Ctrl+C 后不再派发新任务，等待正在执行的任务完成后返回；再次按下 Ctrl+C 时立即中止。
+
+    :param tasks: 融合任务的可迭代对象，见 iter_fusion_tasks
+    :param config: 配置字典，workers 为进程数量（为空时使用 CPU 核数，为 0 时在主进程中串行执行，此时仅支持协作式超时）；
+                   每个进程中图像编码与文件写出由 writer_threads 个后台线程完成，计算不等待写出
+    :param desc: 进度条描述
+    :param image_files: 可用于超时重试的原始图像文件列表（可选）
+    :param namer: 与 iter_fusion_tasks 共用的 OutputNamer（可选），用于为重试任务命名，默认从输出文件夹中已有文件之后编号
+    :param target: 要成功生成的融合图像数量（可选），为 None 时执行到 tasks 耗尽、stop 返回 True 或按下 Ctrl+C
+    :param stop: 停止条件（可选），每个任务结束后以各状态的计数调用，返回 True 时不再派发新任务
+    :param on_result: 处理执行结果的函数（可选），按任务序号、重试次数的顺序调用（包括超时的尝试）
+    :param on_dispatch: 任务（包括重试任务）派发前调用的函数（可选），例如记录运行日志
+    :return: 返回各任务状态（ok、timeout、error）的计数
+    """
+    workers = os.cpu_count() if config["workers"] is None else config["workers"]
+    retries = config["timeout_retries"] if image_files else 0
+    queue_size = max(config["task_queue_size"], 1)
+    tasks = iter(tasks)
+
+    tried_images = {}
+    retry_queue = deque()
+    ready = deque()
+    pool = list()
+    sample_store = None
+
+    summary = Counter()
+    buffered = {}
+    outstanding = set()
+    state = {"started": False, "exhausted": False, "stopping": False, "failed": 0, "peak_rss_mb": None, "namer": namer,
+             "compute_seconds": 0.0, "write_seconds": 0.0}
+    progress = tqdm(total=target, desc=desc, unit="image")
+
+    def running() -> int:
+        return sum((worker.task is not None) + len(worker.writing) for worker in pool)
+
+    def fill():
+        # 按需从任务生成器中取出任务，提前解码样本，待派发任务不超过 queue_size 个
+        while len(ready) < queue_size and not state["exhausted"] and not state["stopping"]:
+            if target is not None and summary["ok"] + running() + len(ready) + len(retry_queue) >= target:
+                break
+            task = next(tasks, None)
+            if task is None:
+                state["exhausted"] = True
+                break
+            if not state["started"]:
+                state["started"] = True
+                state["namer"] = OutputNamer(task["output_dir"], output_name_suffix(config)) if namer is None else namer
+            outstanding.add(task["index"])
+            if sample_store is not None:
+                _stage_samples(sample_store, config, task)
+            ready.append(task)
+
+    def next_task() -> Dict:
+        if state["stopping"]:
+            return None
+        if retry_queue:
+            task = retry_queue.popleft()
+        else:
+            fill()
+            task = ready.popleft() if ready else None
+        if task is not None and on_dispatch is not None:
+            on_dispatch(task)
+        return task
+
+    def emit(index: int):
+        # 按任务顺序输出执行结果，先完成的任务在缓冲区中等待序号更小的未完成任务（任务按序号递增取出，序号可以不连续）
+        outstanding.discard(index)
+        lowest = min(outstanding, default=None)
+        for buffered_index in sorted(buffered):
+            if lowest is not None and buffered_index > lowest:
+                break
+            for result in buffered.pop(buffered_index):
+                if on_result is not None:
+                    on_result(result)
+
+    def halt(message: str):
+        state["stopping"] = True
+        while ready:
+            outstanding.discard(ready.popleft()["index"])
+        while retry_queue:
+            emit(retry_queue.popleft()["index"])
+        progress.write(message)
+
+    def handle(result: Dict, task: Dict):
+        summary[result["status"]] += 1
+        buffered.setdefault(result["index"], list()).append(result)
+        if result["peak_rss_mb"] is not None:
+            state["peak_rss_mb"] = max(state["peak_rss_mb"] or 0, result["peak_rss_mb"])
+
+        if result["status"] == "ok":
+            state["compute_seconds"] += result["compute_seconds"] or 0.0
+            state["write_seconds"] += result["write_seconds"] or 0.0
+            progress.update(1)
+            emit(result["index"])
+        else:
+            if result["status"] == "timeout":
+                progress.write("Time limit exceeded: {} (attempt {}).".format(result["fused_image_name"], result["attempt"] + 1))
+            else:
+                progress.write("Fusion failed: {}\n{}".format(result["fused_image_name"], result["message"]))
+
+            retry = None
+            if result["status"] == "timeout" and task["attempt"] < retries and not state["stopping"]:
+                retry = _retry_task(task, config, state["namer"], image_files, tried_images)
+            if retry is not None:
+                retry_queue.append(retry)
+            else:
+                state["failed"] += 1
+                emit(result["index"])
+                # 失败的任务过多时不再补充新任务，避免配置错误时无休止地生成失败任务
+                if target is not None and state["failed"] >= target and not state["exhausted"]:
+                    state["exhausted"] = True
+                    progress.write("Too many failed tasks, no new tasks will be generated.")
+
+        if stop is not None and not state["stopping"] and stop(summary):
+            halt("Stop condition reached, waiting for running tasks to finish...")
+
+    def interrupt():
+        if state["stopping"]:
+            raise KeyboardInterrupt
+        halt("Interrupted, waiting for running tasks to finish (press Ctrl+C again to abort)...")
+
+    def receive(worker, message):
+        # ("computed", 任务键)：任务转入后台写出，工作进程可以接收下一个任务；("done", 执行结果)：任务结束
+        if message[0] == "computed":
+            if worker.task is not None and _task_key(worker.task) == message[1]:
+                worker.writing[message[1]] = (worker.task, worker.started)
+                worker.release()
+            return
+        result = message[1]
+        key = (result["index"], result["attempt"])
+        if worker.task is not None and _task_key(worker.task) == key:
+            handle(result, worker.release())
+        else:
+            handle(result, worker.writing.pop(key)[0])
+
+    def abandon(worker, status: str, message: str):
+        # 工作进程退出或被强制结束时，正在计算与正在写出的任务均视为失败并删除不完整的输出文件
+        now = monotonic()
+        unfinished = list(worker.writing.values())
+        if worker.task is not None:
+            unfinished.append((worker.task, worker.started))
+        worker.release()
+        worker.writing.clear()
+        for task, started in unfinished:
+            _remove_task_outputs(task, config)
+            handle(_task_result(task, status, now - started, message), task)
+
+    try:
+        if workers == 0:
+            pool.append(_InlineWorker(config))
+            worker = pool[0]
+            try:
+                while True:
+                    while not worker.messages.empty():
+                        receive(worker, worker.messages.get())
+
+                    task = next_task() if worker.task is None else None
+                    if task is not None:
+                        try:
+                            worker.submit(task)
+                        except KeyboardInterrupt:
+                            interrupt()
+                            _remove_task_outputs(task, config)
+                            handle(_task_result(task, "error", monotonic() - worker.started, "interrupted"), worker.release())
+                        continue
+
+                    if worker.task is None and not worker.writing:
+                        break
+                    # 等待后台写出完成
+                    try:
+                        receive(worker, worker.messages.get(timeout=POLL_INTERVAL_SECONDS))
+                    except queue.Empty:
+                        pass
+                    except KeyboardInterrupt:
+                        interrupt()
+            finally:
+                worker.stop()
+        else:
+            sample_store = SharedSampleStore(config["sample_cache_mb"] * 1024 * 1024)
+            pool.extend(_Worker(config) for _ in range(workers if target is None else min(workers, max(target, 1))))
+            try:
+                while True:
+                    for worker in pool:
+                        if worker.task is None:
+                            task = next_task()
+                            if task is None:
+                                break
+                            # 样本可能在预取之后被淘汰，派发前再次确认
+                            _stage_samples(sample_store, config, task)
+                            worker.submit(task)
+
+                    busy = [worker for worker in pool if worker.task is not None or worker.writing]
+                    if not busy:
+                        break
+
+                    try:
+                        # 等待期间提前解码后续任务的样本
+                        fill()
+                        ready_conns = wait([worker.conn for worker in busy] + [worker.process.sentinel for worker in busy], timeout=POLL_INTERVAL_SECONDS)
+                    except KeyboardInterrupt:
+                        interrupt()
+                        continue
+
+                    for i, worker in enumerate(pool):
+                        if worker.task is None and not worker.writing:
+                            continue
+
+                        if worker.conn in ready_conns:
+                            try:
+                                message = worker.conn.recv()
+                            except EOFError:
+                                message = None
+                            if message is not None:
+                                receive(worker, message)
+                                continue
+
+                        if worker.process.sentinel in ready_conns or not worker.process.is_alive():
+                            # 工作进程意外退出（如内存不足被系统结束）
+                            worker.kill()
+                            abandon(worker, "error", "worker exited with code {}".format(worker.process.exitcode))
+                            pool[i] = _Worker(config)
+                        elif worker.task is not None and monotonic() - worker.started > config["time_limit"] + KILL_GRACE_SECONDS:
+                            # 协作式超时未能生效（如卡在单个耗时操作中），强制结束工作进程
+                            worker.kill()
+                            abandon(worker, "timeout", "worker killed")
+                            pool[i] = _Worker(config)
+            finally:
+                for worker in pool:
+                    if worker.task is None and not worker.writing:
+                        worker.stop()
+                    else:
+                        worker.kill()
+                        for task in [worker.task] + [task for task, _ in worker.writing.values()]:
+                            if task is not None:
+                                _remove_task_outputs(task, config)
+                sample_store.close()
+
+        # 输出缓冲区中剩余的执行结果
+        for index in sorted(buffered):
+            for result in buffered.pop(index):
+                if on_result is not None:
+                    on_result(result)
+    finally:
+        progress.close()
+
+    if state["peak_rss_mb"] is not None:
+        print("{}: peak memory {:.0f} MB per worker process.".format(desc, state["peak_rss_mb"]))
+    if summary["ok"]:
+        print("{}: {:.1f}s computing, {:.1f}s encoding and writing in total.".format(desc, state["compute_seconds"], state["write_seconds"]))
+
+    return summary
@@ -0,0 +1,74 @@
+import os
+import shutil
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl 模块，reflink 方式退回复制
+    fcntl = None
+
+
+# 导出方式：copy 复制；hardlink 硬链接（需位于同一文件系统）；reflink 写时复制克隆（Btrfs、XFS 等）；symlink 符号链接
+EXPORT_MODES = ("copy", "hardlink", "reflink", "symlink")
+
+# Linux FICLONE ioctl 请求码
+FICLONE = 0x40049409
+
+
+def _reflink(src: str, dst: str):
+    if fcntl is None:
+        raise OSError("reflink is not supported on this platform")
+    with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+        fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+    shutil.copymode(src, dst)
+
+
+def export_file(src: str, dst: str, mode: str = "copy") -> str:
+    """
+    按指定方式将文件导出到目标路径，目标文件已存在时覆盖；链接或克隆失败时（如跨文件系统、文件系统不支持）退回复制。
+
+    :param src: 源文件路径
+    :param dst: 目标文件路径
+    :param mode: 导出方式，见 EXPORT_MODES
+    :return: 返回实际使用的导出方式
+    """
+    if mode not in EXPORT_MODES:
+        raise ValueError("Unknown export mode: {}, expected one of {}".format(mode, ", ".join(EXPORT_MODES)))
+
+    if os.path.lexists(dst):
+        # 上次运行已链接到同一文件时无需重新导出
+        if mode == "hardlink" and not os.path.islink(dst) and os.path.samefile(src, dst):
+            return mode
+        os.remove(dst)
+
+    if mode != "copy":
+        try:
+            if mode == "hardlink":
+                os.link(src, dst)
+            elif mode == "reflink":
+                _reflink(src, dst)
+            else:
+                os.symlink(os.path.abspath(src), dst)
+            return mode
+        except OSError:
+            if os.path.lexists(dst):
+                os.remove(dst)
+
+    shutil.copy(src, dst)
+
+    return "copy"
+
+
+def export_files(jobs: Iterable[Tuple[str, str]], mode: str = "copy", workers: int = None) -> Counter:
+    """
+    使用线程池并行导出文件。
+
+    :param jobs: (源文件路径, 目标文件路径) 的可迭代对象
+    :param mode: 导出方式，见 EXPORT_MODES
+    :param workers: 线程数量（可选），默认由 ThreadPoolExecutor 决定
+    :return: 返回各导出方式实际使用的次数
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return Counter(executor.map(lambda job: export_file(job[0], job[1], mode), jobs))
@@ -1,167 +1,218 @@
 import os
 import random
-import json
-from typing import List, Tuple, Dict
+from typing import Callable, Iterator, List, Optional, Tuple, Dict
 
 import numpy as np
 import cv2
 import time
 
+from format_trans.annotation_io import load_annotation
+from utils.placement import build_free_space_mask, FreeSpace, FreeSpaceMaskCache, PLACEMENT_MODES
+from utils.mask_extract import find_region_mask
+from utils.composite import load_sample_image, composite_sample
+from utils.catalog import build_sample_catalog, sample_variants, VARIANT_PROBS
+from utils.metrics import TaskMetrics
 
-def choose_images_match_samples(images_files, samples_files, config, mode) -> List[Dict[str, List[str]]]:
+
+class FusionTimeoutError(TimeoutError):
+    """单个融合任务超过时间限制时抛出。"""
+
+
+def check_deadline(deadline: float = None):
+    """
+    检查是否已超过截止时间（time.monotonic() 时间），超过时抛出 FusionTimeoutError。
+
+    :param deadline: 截止时间，为 None 时不做限制
+    """
+    if deadline is not None and time.monotonic() > deadline:
+        raise FusionTimeoutError("Fusion task exceeded its time limit")
+
+
+def fusion_image_nums(config, mode, train_nums=None) -> Optional[int]:
+    """
+    计算要生成的融合图像数量，验证集数量按训练集数量与 train_ratio 换算。
+
+    :param mode: "train" 或 "val"
+    :param train_nums: 训练集融合图像数量（可选），默认使用 train_fusion_image_nums
+    :return: 返回融合图像数量，训练集未设置数量时返回 None（持续生成）
+    """
+    train_nums = config["train_fusion_image_nums"] if train_nums is None else train_nums
+    if mode == "train" or train_nums is None:
+        return train_nums
+    return int(train_nums * (1 - config["train_ratio"]) / config["train_ratio"])
+
+
+def pair_random(config, mode) -> random.Random:
+    """
+    创建选择原始图像与抠图样本对的随机数生成器，训练集与验证集各自独立，相同种子下融合计划完全相同。
+
+    :param mode: "train" 或 "val"
+    :return: 返回 random.Random 实例，seed 为空时使用随机初始化
+    """
+    return random.Random(None if config["seed"] is None else "{}-{}".format(config["seed"], mode))
+
+
+def _match_samples(samples_files, config, catalog, rng) -> List[str]:
+    """
+    为一张原始图像随机选择抠图样本，并按增强概率选择样本的增强版本。
+    """
+    matched_samples = list()
+    extract_rwa_samples_name = rng.sample(samples_files, config["sample_min_nums_at_one_image"])
+
+    for sample_file in extract_rwa_samples_name:
+
+        # 如果当前样本文件不在不需要融合的样本文件列表中
+        if sample_file.split("_")[0] not in config["without_need_aug_sample_class"]:
+            variants = sample_variants(catalog, sample_file)
+            chosen = False
+            for tag, prob_key in VARIANT_PROBS:
+                if rng.random() < config[prob_key] and variants.get(tag):
+                    matched_samples.append(rng.choice(variants[tag]))
+                    chosen = True
+            if not chosen:
+                matched_samples.append(rng.choice([file for files in variants.values() for file in files]))
+
+        else:
+            matched_samples.append(sample_file+"_none.png")
+
+    return matched_samples
+
+
+def iter_images_match_samples(images_files, samples_files, config, catalog=None, count=None, rng: random.Random = None) -> Iterator[Dict[str, List[str]]]:
     """
-    选择训练集中要融合的原始图像和抠图样本。
+    逐个生成要融合的原始图像与抠图样本对，只在取用时才进行选择，内存占用与生成数量无关。
 
     :param images_files: 原始图像文件列表
     :param samples_files: 抠图样本文件列表
-    :return: 返回选择的原始图像文件列表和抠图样本文件列表
+    :param catalog: build_sample_catalog 得到的抠图样本索引（可选），为空时根据 samples_path 建立
+    :param count: 生成数量（可选），为 None 时无限生成，由调用方决定何时停止
+    :param rng: 随机数生成器（可选），见 pair_random，默认使用 random 模块的全局状态
+    :return: 返回 {原始图像文件: 抠图样本文件列表} 的生成器
     """
-    
-    # # 生成随机种子
-    # if config["seed"] is not None:
-    #     random.seed(config["seed"])
+    if catalog is None:
+        catalog = build_sample_catalog(config["samples_path"])
+    rng = random if rng is None else rng
 
-    k = config["train_fusion_image_nums"] if mode=="train" else int(config["train_fusion_image_nums"] * (1 - config["train_ratio"]) / config["train_ratio"]) 
+    generated = 0
+    while count is None or generated < count:
+        image_file = rng.choice(images_files)
+        yield {image_file: _match_samples(samples_files, config, catalog, rng)}
+        generated += 1
 
-    # 打乱样本顺序
-    choose_images_files = random.choices(images_files,k=k)
-    
-    match_pairs_list = list()
-    
-    for image_file in choose_images_files:
-        
-        match_pairs = {}
-        match_pairs[image_file] = list()
-        extract_rwa_samples_name = random.sample(samples_files, config["sample_min_nums_at_one_image"])
-        
-        for sample_file in extract_rwa_samples_name:
-            
-            search_path = os.path.join(config["samples_path"], sample_file.split("_")[0])
-            
-            # 如果当前样本文件不在不需要融合的样本文件列表中
-            if os.path.basename(search_path) not in config["without_need_aug_sample_class"]:
-                all_files = os.listdir(search_path)
-                matching_images = [file for file in all_files if file.startswith(sample_file)]
-                if random.random() < config["rotation_prob"]:
-                    images_with_r = [image for image in matching_images if 'r' in image]
-                    if images_with_r:
-                        match_pairs[image_file].append(random.choice(images_with_r))
-                if random.random() < config["up_prob"]:
-                    images_with_u = [image for image in matching_images if 'u' in image]
-                    if images_with_u:
-                        match_pairs[image_file].append(random.choice(images_with_u))
-                if random.random() < config["down_prob"]:
-                    images_with_d = [image for image in matching_images if 'd' in image]
-                    if images_with_d:
-                        match_pairs[image_file].append(random.choice(images_with_d))
-                if random.random() < config["light_prob"]:
-                    images_with_l = [image for image in matching_images if 'l' in image]
-                    if images_with_l:
-                        match_pairs[image_file].append(random.choice(images_with_l))
-                found = any(sample_file in image for image in match_pairs[image_file])
-                if not found:
-                    match_pairs[image_file].append(random.choice(matching_images))
-            
-            else:
-                match_pairs[image_file].append(sample_file+"_none.png")
-        match_pairs_list.append(match_pairs)
-
-    return match_pairs_list
-
-def paste_samples_on_image(image_path: str, sample_images_path: List[str]) -> str:
+
+def place_samples(free_space, sample_images: List[Tuple[np.ndarray, Optional[np.ndarray]]], sample_images_path: List[str], annotations: Dict,
+                  composite: Callable[[np.ndarray, Optional[np.ndarray], int, int], None], rng: np.random.Generator = None,
+                  deadline: float = None, metrics: TaskMetrics = None, placement_mode: str = "greedy"):
+    """
+    在可粘贴区域中为样本选择位置，调用 composite 合成样本，并在标注中添加 AugSample 矩形框（原地修改）。
+
+    :param free_space: 可粘贴区域，提供 place、plan 方法，见 utils.placement.FreeSpace
+    :param sample_images: (BGR 样本图像, alpha 通道) 列表
+    :param sample_images_path: 样本图像的路径列表，用于记录放弃的样本
+    :param annotations: Labelme 标注内容
+    :param composite: 以 (样本图像, alpha 通道, y_offset, x_offset) 调用的合成函数
+    :param placement_mode: 多个样本的放置方式，见 utils.placement.PLACEMENT_MODES
+    """
+    if placement_mode not in PLACEMENT_MODES:
+        raise ValueError("Unknown placement mode: {}, expected one of {}".format(placement_mode, ", ".join(PLACEMENT_MODES)))
+
+    metrics = TaskMetrics() if metrics is None else metrics
+
+    # packed 方式下一次性规划所有样本的粘贴位置，大样本优先
+    if placement_mode == "packed":
+        metrics.count("placement_attempts", len(sample_images))
+        with metrics.stage("placement"):
+            positions = free_space.plan([sample_image.shape[:2] for sample_image, _ in sample_images], rng)
+
+    # 遍历每个样本图像
+    for i, (sample_image, sample_alpha) in enumerate(sample_images):
+        check_deadline(deadline)
+        sample_height, sample_width = sample_image.shape[:2]
+
+        if placement_mode == "packed":
+            position = positions[i]
+        else:
+            # 基于积分图一次性求出所有可行位置并随机选择，选中区域会被标记为已占用，避免后续样本粘贴在同一位置
+            metrics.count("placement_attempts")
+            with metrics.stage("placement"):
+                position = free_space.place(sample_height, sample_width, rng)
+        if position is None:
+            # 可粘贴区域中放不下该样本
+            metrics.count("dropped")
+            metrics.dropped_samples.append(os.path.basename(sample_images_path[i]))
+            continue
+        metrics.count("placed")
+        y_offset, x_offset = position
+
+        # 在 ROI 上一次性合成样本图像
+        with metrics.stage("composite"):
+            composite(sample_image, sample_alpha, y_offset, x_offset)
+
+        # 更新标注信息
+        annotations['shapes'].append({
+            "label": "AugSample",
+            "points": [[int(x_offset), int(y_offset)], [int(x_offset + sample_width), int(y_offset + sample_height)]],
+            "group_id": None,
+            "shape_type": "rectangle",
+            "flags": {}
+        })
+
+    metrics.count("coarse_rejections", free_space.coarse_rejections)
+    metrics.count("exact_solves", free_space.exact_solves)
+
+
+def paste_samples_on_image(image_path: str, sample_images_path: List[str], blend_mode: str = "mask", feather_radius: int = 3,
+                           rng: np.random.Generator = None, deadline: float = None, mask_cache: FreeSpaceMaskCache = None,
+                           placement_grid: int = 8, sample_loader: Callable[[str], Tuple[np.ndarray, np.ndarray]] = None,
+                           mask_dir: str = None, metrics: TaskMetrics = None, placement_mode: str = "greedy") -> str:
     """
     随机在原始图像上粘贴样本图像，并更新标注文件内容。
 
     :param image_path: 原始图像的路径
     :param sample_images_path: 待粘贴的样本图像的路径列表
+    :param blend_mode: 样本融合方式，见 utils.composite.BLEND_MODES
+    :param feather_radius: feather 融合方式下的羽化半径
+    :param rng: numpy 随机数生成器（可选），用于选择粘贴位置，默认使用 np.random 全局状态
+    :param deadline: 截止时间（time.monotonic() 时间，可选），各处理阶段之间检查，超时抛出 FusionTimeoutError
+    :param mask_cache: 可粘贴区域掩码图缓存（可选），同一原始图像重复使用时跳过标注解析与掩码绘制
+    :param placement_grid: 粗网格单元边长（像素），见 utils.placement.FreeSpace；使用 mask_cache 时以缓存的设置为准
+    :param sample_loader: 根据路径返回 (BGR 样本图像, alpha 通道) 的函数（可选），用于复用已解码的样本，默认每次重新解码
+    :param mask_dir: 预先生成的 '__mask__' 区域掩码图文件夹（可选，见 utils.mask_extract），使用 mask_cache 时以缓存的设置为准
+    :param metrics: 任务指标（可选，见 utils.metrics.TaskMetrics），记录各阶段耗时与放置尝试、放弃的样本、被拒绝的候选位置数量
+    :param placement_mode: 多个样本的放置方式，见 utils.placement.PLACEMENT_MODES
     :return: 返回融合后的图像和更新后的标注文件内容
     """
+    metrics = TaskMetrics() if metrics is None else metrics
+
     # 读取原始图像
-    original_image = cv2.imdecode(np.fromfile(image_path, dtype=np.uint8), -1)
+    with metrics.stage("decode"):
+        original_image = cv2.imdecode(np.fromfile(image_path, dtype=np.uint8), -1)
     image_height, image_width = original_image.shape[:2]
 
-    # 加载待粘贴的样本图像
-    sample_images = [cv2.imdecode(np.fromfile(sample_path, dtype=np.uint8), -1)[:, :, :3] for sample_path in sample_images_path]
+    # 加载待粘贴的样本图像，保留 alpha 通道用于合成
+    sample_loader = load_sample_image if sample_loader is None else sample_loader
+    with metrics.stage("load_samples"):
+        sample_images = [sample_loader(sample_path) for sample_path in sample_images_path]
+    check_deadline(deadline)
 
-    # 读取 Labelme 标注文件
+    # 读取 Labelme 标注文件，并根据 '__mask__' 区域与既有目标生成可粘贴区域掩码图
     labelme_file_path = image_path.replace(os.path.splitext(os.path.basename(image_path))[1], '.json')
-    with open(labelme_file_path, 'r') as f:
-        updated_annotations = json.load(f)
+    with metrics.stage("free_space"):
+        if mask_cache is not None:
+            updated_annotations, free_space = mask_cache.get(labelme_file_path, image_height, image_width)
+        else:
+            updated_annotations = load_annotation(labelme_file_path)
+            region_mask = find_region_mask(mask_dir, labelme_file_path, image_height, image_width) if mask_dir else None
+            free_space = FreeSpace(build_free_space_mask(updated_annotations, image_height, image_width, region_mask), placement_grid)
 
     updated_annotations["imageData"] = None
-
-    # 初始化掩码图像
-    has_mask = False
-    mask_region = np.ones((image_height, image_width), dtype=np.uint8) * 255  # 默认为全 255
-
-    # 检查标注文件中是否存在 '__mask__' 类别
-    for shape in updated_annotations['shapes']:
-        if shape['label'] == '__mask__':
-            has_mask = True
-            break
-
-    # 如果存在 '__mask__' 类别，则将掩码图像初始化为全 0，只将 '__mask__' 区域设置为 255
-    if has_mask:
-        mask_region = np.zeros((image_height, image_width), dtype=np.uint8)  # 初始化为全 0
-        for shape in updated_annotations['shapes']:
-            if shape['label'] == '__mask__':
-                points = np.array(shape['points'], dtype=np.int32)
-                cv2.fillPoly(mask_region, [points], 255)  # 仅将 '__mask__' 区域设为 255
-    
-    # cv2.imwrite('mask.png', mask_region)
-    
-    # 根据非 '__mask__' 类别目标的最小外接矩形框更新掩码图，将这些区域置为 0
-    for shape in updated_annotations['shapes']:
-        if shape['label'] != '__mask__':
-            # 获取每个目标的坐标，计算最小外接矩形
-            points = np.array(shape['points'], dtype=np.int32)
-            xmin, ymin = np.min(points, axis=0)
-            xmax, ymax = np.max(points, axis=0)
-            mask_region[ymin:ymax, xmin:xmax] = 0  # 将目标区域置为 0
+    check_deadline(deadline)
     
-    # cv2.imwrite('mask.png', mask_region)
+    # cv2.imwrite('mask.png', free_space.mask_region)
     
-    # 遍历每个样本图像
-    for sample_image in sample_images:
-        sample_height, sample_width = sample_image.shape[:2]
+    place_samples(free_space, sample_images, sample_images_path, updated_annotations,
+                  lambda sample_image, sample_alpha, y_offset, x_offset: composite_sample(
+                      original_image, sample_image, sample_alpha, y_offset, x_offset, blend_mode, feather_radius),
+                  rng=rng, deadline=deadline, metrics=metrics, placement_mode=placement_mode)
 
-        # 设置掩码图中无法容纳样本图像的区域为 0
-        _mask_region = mask_region.copy()
-        _mask_region[image_height - sample_height:, :] = 0  # 底部区域
-        _mask_region[:, image_width - sample_width:] = 0  # 右侧区域
-
-        # cv2.imwrite('mask.png', _mask_region)
-        
-        # 获取掩码图中所有值为 255 的位置
-        valid_positions = np.argwhere(_mask_region == 255)
-        np.random.shuffle(valid_positions)  # 打乱有效位置顺序
-
-        while valid_positions.size > 0:
-            y_offset, x_offset = valid_positions[0]  # 获取当前有效位置
-
-            # 检查粘贴图像是否完全在 mask 区域内
-            if np.all(_mask_region[y_offset:y_offset + sample_height, x_offset:x_offset + sample_width] == 255):
-                # 粘贴样本图像
-                for i in range(sample_height):
-                    for j in range(sample_width):
-                        if np.any(sample_image[i, j] != 0):  # 只替换非背景像素
-                            original_image[y_offset + i, x_offset + j] = sample_image[i, j]
-
-                # 更新标注信息
-                updated_annotations['shapes'].append({
-                    "label": "AugSample",
-                    "points": [[int(x_offset), int(y_offset)], [int(x_offset + sample_width), int(y_offset + sample_height)]],
-                    "group_id": None,
-                    "shape_type": "rectangle",
-                    "flags": {}
-                })
-
-                # 更新掩码图，将新粘贴的样本区域设置为 0，避免后续样本粘贴在同一位置
-                mask_region[y_offset:y_offset + sample_height, x_offset:x_offset + sample_width] = 0  # 同时更新全局掩码
-
-                break  # 跳出循环，继续处理下一个样本图像
-
-            # 如果当前位置不合适，移除该位置并尝试下一个位置
-            valid_positions = valid_positions[1:]
-
-    return original_image, updated_annotations
\ No newline at end of file
+    return original_image, updated_annotations
@@ -0,0 +1,144 @@
+import os
+import json
+import hashlib
+from typing import Dict, List
+
+
+# 只影响执行方式或输出文件编码、不影响融合计划与结果的配置项，续跑时允许修改。
+# image_format（决定已分配的文件扩展名）、label_formats 与 label_classes（续跑时按已完成任务的结果重写 coco 标注）仍参与比较
+RESUME_IGNORED_KEYS = {"train_fusion_image_nums", "workers", "time_limit", "timeout_retries", "task_queue_size",
+                       "writer_threads", "writer_queue_size", "mask_cache_mb", "sample_cache_mb", "mask_cache_dir",
+                       "use_manifest", "manifest_name", "manifest_trust_dir_mtime", "resume", "journal_name",
+                       "mask_dir", "mask_format", "run_log_name", "profiler", "profile_dir", "tile_cache_dir",
+                       "tile_cache_mb", "export_mode", "export_workers", "compact_json", "image_quality", "png_compression"}
+
+
+def config_fingerprint(config) -> str:
+    """
+    计算影响融合计划的配置项的摘要，用于判断运行日志能否续跑。
+    """
+    plan_config = {key: value for key, value in config.items() if key not in RESUME_IGNORED_KEYS}
+    return hashlib.sha1(json.dumps(plan_config, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+
+class RunJournal:
+    """
+    融合运行日志（JSON Lines，逐行追加）：记录数据集划分、已派发的融合任务以及任务执行结果。
+
+    中断后重新运行时，从日志中恢复数据集划分，跳过已完成的任务，并按原有文件名重新执行未完成的任务；
+    其余任务由固定随机种子的生成器继续生成，与一次性运行得到的融合计划完全相同。
+    """
+
+    def __init__(self, path: str, config, resume: bool = True):
+        """
+        :param path: 运行日志文件路径
+        :param config: 配置字典
+        :param resume: 是否从已有的运行日志续跑，为 False 时清空已有日志重新开始
+        """
+        self.path = path
+        self.fingerprint = config_fingerprint(config)
+        self.split = None
+        self.tasks = {}
+        self.results = {}
+
+        if resume and os.path.isfile(path):
+            self._load()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.file = open(path, 'a' if self.split is not None else 'w', encoding='utf-8')
+        if self.split is not None and not self._ends_with_newline:
+            # 中断时写出一半的最后一行单独成行，续跑追加的记录不会与其拼接
+            self.file.write("\n")
+
+    def _load(self):
+        self._ends_with_newline = True
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                self._ends_with_newline = line.endswith("\n")
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 中断时最后一行可能不完整
+                    continue
+
+                if record["type"] == "split":
+                    if record["fingerprint"] != self.fingerprint:
+                        raise ValueError("The run journal {} was created with a different configuration, "
+                                         "delete it or set resume to false to start a new run".format(self.path))
+                    self.split = (record["train_files"], record["val_files"], record["train_samples"], record["val_samples"])
+                elif record["type"] == "task":
+                    self.tasks.setdefault(record["split"], {}).setdefault(record["index"], {})[record["attempt"]] = record
+                elif record["type"] == "result":
+                    self.results.setdefault(record["split"], {})[(record["index"], record["attempt"])] = record
+
+    def _append(self, record: Dict):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def record_split(self, train_files: List[str], val_files: List[str], train_samples: List[str], val_samples: List[str]):
+        """
+        记录原始图像与抠图样本的训练集、验证集划分。
+        """
+        self.split = (train_files, val_files, train_samples, val_samples)
+        self._append({"type": "split", "fingerprint": self.fingerprint, "train_files": train_files, "val_files": val_files,
+                      "train_samples": train_samples, "val_samples": val_samples})
+
+    def record_task(self, task: Dict):
+        """
+        记录已派发的融合任务（原始图像、抠图样本与输出文件名）。
+        """
+        record = {"type": "task", "split": task["split"], "index": task["index"], "attempt": task["attempt"],
+                  "image_file": task["image_file"], "sample_files": task["sample_files"], "fused_image_name": task["fused_image_name"]}
+        self.tasks.setdefault(task["split"], {}).setdefault(task["index"], {})[task["attempt"]] = record
+        self._append(record)
+
+    def record_result(self, split: str, result: Dict):
+        """
+        记录融合任务的执行结果。
+        """
+        # 分阶段耗时与计数记录在运行记录中（见 utils.metrics.RunLog），不写入运行日志
+        record = dict(result, type="result", split=split)
+        record.pop("metrics", None)
+        self.results.setdefault(split, {})[(result["index"], result["attempt"])] = record
+        self._append(record)
+
+    def planned_count(self, split: str) -> int:
+        """
+        :return: 返回已派发的任务序号数量，续跑时任务生成器从该序号继续
+        """
+        return max(self.tasks.get(split, {}), default=-1) + 1
+
+    def completed_results(self, split: str) -> List[Dict]:
+        """
+        :return: 返回已记录的执行结果，按任务序号、重试次数排列
+        """
+        results = self.results.get(split, {})
+        return [results[key] for key in sorted(results)]
+
+    def unfinished_tasks(self, split: str) -> List[Dict]:
+        """
+        :return: 返回已派发但没有执行结果的任务记录（每个任务序号只取最后一次重试），按任务序号排列
+        """
+        results = self.results.get(split, {})
+        unfinished = list()
+        for index in sorted(self.tasks.get(split, {})):
+            attempts = self.tasks[split][index]
+            attempt = max(attempts)
+            if (index, attempt) not in results:
+                unfinished.append(attempts[attempt])
+        return unfinished
+
+    def fused_image_names(self, split: str) -> List[str]:
+        """
+        :return: 返回已分配的全部融合图像名称，续跑时不再分配给新任务
+        """
+        return [record["fused_image_name"] for attempts in self.tasks.get(split, {}).values() for record in attempts.values()]
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,166 @@
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from format_trans.annotation_io import dump_annotation
+from format_trans.json2txt_bbox import labelme_to_yolo_lines
+from format_trans.coco_stream import CocoStreamWriter, coco_categories
+
+
+# 融合流程支持输出的标注格式：labelme 与 yolo 每张图像一个标注文件，coco 每个数据集划分一个标注文件
+LABEL_FORMATS = ("labelme", "yolo", "coco")
+
+# 每张图像单独写出的标注格式 -> 标注文件扩展名
+LABEL_FILE_EXTENSIONS = {"labelme": ".json", "yolo": ".txt"}
+
+
+def check_label_formats(formats: List[str]):
+    """
+    检查配置的标注格式，包含不支持的格式时抛出 ValueError。
+    """
+    unknown = [label_format for label_format in formats if label_format not in LABEL_FORMATS]
+    if unknown:
+        raise ValueError("Unknown label formats: {}, expected any of {}".format(", ".join(unknown), ", ".join(LABEL_FORMATS)))
+
+
+def label_file_name(image_name: str, label_format: str) -> str:
+    """
+    :return: 返回图像对应的标注文件名，例如 "X1_0001.jpg" -> "X1_0001.txt"
+    """
+    return image_name.split(".")[0] + LABEL_FILE_EXTENSIONS[label_format]
+
+
+def write_yolo_labels(txt_path: str, annotation: Dict, classes: List[str]):
+    """
+    将 Labelme 标注内容写出为 YOLO 目标检测格式的 txt 文件，类别序号按 classes 的顺序从0开始。
+    """
+    with open(txt_path, 'w', encoding='utf-8') as txt_file:
+        txt_file.writelines(labelme_to_yolo_lines(annotation, {name: i for i, name in enumerate(classes)}))
+
+
+def write_image_labels(output_dir: str, image_name: str, annotation: Dict, config):
+    """
+    按 label_formats 写出单张图像的标注文件（labelme、yolo）。
+
+    :param output_dir: 输出文件夹
+    :param image_name: 图像文件名
+    :param annotation: Labelme 标注内容
+    :param config: 配置字典
+    :return: 返回写出的标注文件的总字节数
+    """
+    formats = config["label_formats"]
+    written = list()
+
+    if "labelme" in formats:
+        written.append(os.path.join(output_dir, label_file_name(image_name, "labelme")))
+        dump_annotation(annotation, written[-1], compact=config["compact_json"])
+
+    if "yolo" in formats:
+        written.append(os.path.join(output_dir, label_file_name(image_name, "yolo")))
+        write_yolo_labels(written[-1], annotation, config["label_classes"])
+
+    return sum(os.path.getsize(path) for path in written)
+
+
+def _clip_polygon(points: List[List[float]], x0: float, y0: float, x1: float, y1: float) -> List[List[float]]:
+    # Sutherland-Hodgman 算法，依次用矩形的四条边裁剪多边形
+    edges = ((0, x0, True), (0, x1, False), (1, y0, True), (1, y1, False))
+    for axis, bound, lower in edges:
+        if not points:
+            break
+        clipped = list()
+        for i, current in enumerate(points):
+            previous = points[i - 1]
+            current_inside = current[axis] >= bound if lower else current[axis] <= bound
+            previous_inside = previous[axis] >= bound if lower else previous[axis] <= bound
+            if current_inside != previous_inside:
+                t = (bound - previous[axis]) / (current[axis] - previous[axis])
+                crossing = [previous[0] + t * (current[0] - previous[0]), previous[1] + t * (current[1] - previous[1])]
+                crossing[axis] = bound
+                clipped.append(crossing)
+            if current_inside:
+                clipped.append(current)
+        points = clipped
+    # 去掉多边形经过矩形角点时产生的重复顶点
+    return [point for i, point in enumerate(points) if point != points[i - 1]] if len(points) > 1 else points
+
+
+def _polygon_area(points: List[List[float]]) -> float:
+    return abs(sum(points[i - 1][0] * points[i][1] - points[i][0] * points[i - 1][1] for i in range(len(points)))) / 2
+
+
+def clip_annotation(annotation: Dict, x0: int, y0: int, width: int, height: int, image_name: str = None, min_visible: float = 0.0) -> Dict:
+    """
+    将 Labelme 标注裁剪到图像中的一个窗口内，坐标平移为窗口坐标，用于分块或裁剪输出。
+
+    矩形框与多边形按窗口边界裁剪，其他类型的目标只保留完全位于窗口内的；裁剪后可见面积占原面积的比例小于
+    min_visible 的目标被丢弃。
+
+    :param annotation: Labelme 标注内容
+    :param x0: 窗口左上角 x 坐标
+    :param y0: 窗口左上角 y 坐标
+    :param width: 窗口宽度
+    :param height: 窗口高度
+    :param image_name: 窗口图像的文件名（可选），写入 imagePath
+    :param min_visible: 目标保留所需的最小可见面积比例（0-1）
+    :return: 返回窗口的 Labelme 标注内容
+    """
+    x1, y1 = x0 + width, y0 + height
+    shapes = list()
+    for shape in annotation["shapes"]:
+        points = [[float(x), float(y)] for x, y in shape["points"]]
+        shape_type = shape.get("shape_type", "polygon")
+
+        if shape_type == "rectangle" and len(points) == 2:
+            (left, top), (right, bottom) = np.min(points, axis=0), np.max(points, axis=0)
+            area = (right - left) * (bottom - top)
+            left, top, right, bottom = max(left, x0), max(top, y0), min(right, x1), min(bottom, y1)
+            if right <= left or bottom <= top:
+                continue
+            visible = (right - left) * (bottom - top)
+            clipped = [[left, top], [right, bottom]]
+        elif shape_type == "polygon" and len(points) >= 3:
+            area = _polygon_area(points)
+            clipped = _clip_polygon(points, x0, y0, x1, y1)
+            if len(clipped) < 3:
+                continue
+            visible = _polygon_area(clipped)
+        else:
+            if not all(x0 <= x <= x1 and y0 <= y <= y1 for x, y in points):
+                continue
+            area = visible = 1.0
+            clipped = points
+
+        if area > 0 and visible / area < min_visible:
+            continue
+
+        shapes.append(dict(shape, points=[[_window_coordinate(x - x0), _window_coordinate(y - y0)] for x, y in clipped]))
+
+    return dict(annotation, shapes=shapes, imagePath=image_name if image_name is not None else annotation.get("imagePath"),
+                imageData=None, imageHeight=int(height), imageWidth=int(width))
+
+
+def _window_coordinate(value: float):
+    # 整数坐标保持为整数，裁剪得到的交点保留两位小数
+    return int(value) if float(value).is_integer() else round(float(value), 2)
+
+
+def coco_annotation(annotation: Dict) -> Dict:
+    """
+    提取写出 COCO 标注所需的内容（图像尺寸与目标），随任务结果发回主进程。
+    """
+    return {"imageWidth": annotation["imageWidth"], "imageHeight": annotation["imageHeight"],
+            "shapes": [{"label": shape["label"], "points": shape["points"], "shape_type": shape.get("shape_type", "polygon")}
+                       for shape in annotation["shapes"]]}
+
+
+def open_coco_writer(output_root: str, split: str, config) -> Optional[CocoStreamWriter]:
+    """
+    为数据集划分创建 COCO 标注文件 {output_root}/annotations/instances_{split}.json 的流式写出器。
+
+    :return: 返回 CocoStreamWriter，label_formats 不包含 coco 时返回 None
+    """
+    if "coco" not in config["label_formats"]:
+        return None
+    return CocoStreamWriter(os.path.join(output_root, "annotations", "instances_{}.json".format(split)), coco_categories(config["label_classes"]))
@@ -0,0 +1,198 @@
+import os
+import json
+import sqlite3
+from collections import Counter, namedtuple
+from typing import Dict, Optional, Tuple
+
+from format_trans.image_size import image_size
+from format_trans.annotation_io import load_annotation
+
+
+# 清单中记录的单个文件信息，width/height 仅对图像文件有效，annotation 为 Labelme 标注摘要（仅 json 文件）
+FileRecord = namedtuple("FileRecord", ["path", "size", "mtime_ns", "width", "height", "annotation"])
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.gif'}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    root TEXT NOT NULL,
+    path TEXT NOT NULL,
+    dir TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    annotation TEXT,
+    PRIMARY KEY (root, path)
+);
+CREATE INDEX IF NOT EXISTS files_dir ON files (root, dir);
+CREATE TABLE IF NOT EXISTS dirs (
+    root TEXT NOT NULL,
+    path TEXT NOT NULL,
+    parent TEXT,
+    mtime_ns INTEGER NOT NULL,
+    PRIMARY KEY (root, path)
+);
+"""
+
+
+def summarize_annotation(json_path: str) -> Dict:
+    """
+    读取 Labelme 标注文件并生成摘要：图像尺寸、各类别目标数量以及是否含有 '__mask__' 区域。
+
+    :param json_path: Labelme 标注文件路径
+    :return: 返回标注摘要字典
+    """
+    data = load_annotation(json_path)
+
+    labels = Counter(shape['label'] for shape in data.get('shapes', []))
+
+    return {
+        "imageWidth": data.get("imageWidth"),
+        "imageHeight": data.get("imageHeight"),
+        "imagePath": data.get("imagePath"),
+        "labels": dict(labels),
+        "has_mask": '__mask__' in labels,
+    }
+
+
+def probe_image_size(image_path: str) -> Tuple[Optional[int], Optional[int]]:
+    """
+    获取图像的宽和高（只读取文件头），读取失败时返回 (None, None)。
+    """
+    try:
+        return image_size(image_path)
+    except (OSError, ValueError):
+        return None, None
+
+
+class FileManifest:
+    """
+    持久化在 SQLite 中的文件清单，记录文件名、大小、修改时间、图像尺寸以及标注摘要。
+
+    每次扫描只对大小或修改时间发生变化的文件重新读取尺寸与标注，其余信息直接来自清单；
+    同一次运行中对同一文件夹的重复扫描直接返回内存中的结果。
+    """
+
+    def __init__(self, db_path: str, trust_dir_mtime: bool = False):
+        """
+        :param db_path: 清单数据库文件路径
+        :param trust_dir_mtime: 为 True 时，修改时间未变化的文件夹直接使用清单内容而不再逐个获取文件状态，
+                                适合网络存储上的大数据集；但原地覆盖写入的文件（不改变文件夹修改时间）将不会被发现
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.connection = sqlite3.connect(db_path)
+        self.connection.executescript(_SCHEMA)
+        self.trust_dir_mtime = trust_dir_mtime
+        self._scanned = {}
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def scan(self, folder: str, recursive: bool = False) -> Dict[str, FileRecord]:
+        """
+        扫描文件夹并增量更新清单。
+
+        :param folder: 待扫描的文件夹
+        :param recursive: 是否递归扫描子文件夹
+        :return: 返回 相对路径 -> FileRecord 的字典
+        """
+        root = os.path.abspath(folder)
+        key = (root, recursive)
+        if key in self._scanned:
+            return self._scanned[key]
+
+        records = {}
+        stack = [""]
+        with self.connection:
+            while stack:
+                rel_dir = stack.pop()
+                subdirs = self._scan_dir(root, rel_dir, records)
+                if recursive:
+                    stack.extend(subdirs)
+
+        self._scanned[key] = records
+
+        return records
+
+    def _scan_dir(self, root: str, rel_dir: str, records: Dict[str, FileRecord]):
+        abs_dir = os.path.join(root, rel_dir)
+        dir_mtime = os.stat(abs_dir).st_mtime_ns
+        cursor = self.connection.cursor()
+
+        row = cursor.execute("SELECT mtime_ns FROM dirs WHERE root = ? AND path = ?", (root, rel_dir)).fetchone()
+        cached = {r[0]: FileRecord(*r) for r in cursor.execute(
+            "SELECT path, size, mtime_ns, width, height, annotation FROM files WHERE root = ? AND dir = ?", (root, rel_dir))}
+
+        if self.trust_dir_mtime and row is not None and row[0] == dir_mtime:
+            records.update(cached)
+            return [r[0] for r in cursor.execute("SELECT path FROM dirs WHERE root = ? AND parent = ?", (root, rel_dir))]
+
+        subdirs = list()
+        seen = set()
+        for entry in os.scandir(abs_dir):
+            rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+            if entry.is_dir():
+                subdirs.append(rel_path)
+                continue
+            if not entry.is_file():
+                continue
+
+            seen.add(rel_path)
+            stat = entry.stat()
+            record = cached.get(rel_path)
+            if record is None or record.size != stat.st_size or record.mtime_ns != stat.st_mtime_ns:
+                record = self._probe(entry.path, rel_path, stat)
+                cursor.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                               (root, rel_path, rel_dir, record.size, record.mtime_ns, record.width, record.height, record.annotation))
+            records[rel_path] = record
+
+        # 删除已不存在的文件与子文件夹
+        cursor.executemany("DELETE FROM files WHERE root = ? AND path = ?", [(root, path) for path in cached if path not in seen])
+        stale_dirs = [(root, r[0]) for r in cursor.execute("SELECT path FROM dirs WHERE root = ? AND parent = ?", (root, rel_dir)) if r[0] not in subdirs]
+        cursor.executemany("DELETE FROM dirs WHERE root = ? AND path = ?", stale_dirs)
+        # 按前缀比较子文件夹路径，不使用 LIKE（文件夹名称中的 _、% 会被当作通配符）
+        cursor.executemany("DELETE FROM files WHERE root = ? AND (dir = ? OR substr(dir, 1, ?) = ?)",
+                           [(root, path, len(os.path.join(path, "")), os.path.join(path, "")) for _, path in stale_dirs])
+
+        cursor.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?)", (root, rel_dir, None if not rel_dir else os.path.dirname(rel_dir), dir_mtime))
+
+        return subdirs
+
+    def _probe(self, abs_path: str, rel_path: str, stat) -> FileRecord:
+        extension = os.path.splitext(rel_path)[1].lower()
+        width = height = annotation = None
+
+        if extension == '.json':
+            try:
+                summary = summarize_annotation(abs_path)
+                annotation = json.dumps(summary, ensure_ascii=False)
+                width, height = summary["imageWidth"], summary["imageHeight"]
+            except (ValueError, KeyError, TypeError):
+                pass
+        elif extension in IMAGE_EXTENSIONS:
+            # 有同名标注文件时直接使用标注中的图像尺寸，避免解码图像
+            json_path = os.path.splitext(abs_path)[0] + '.json'
+            if os.path.isfile(json_path):
+                try:
+                    summary = summarize_annotation(json_path)
+                    width, height = summary["imageWidth"], summary["imageHeight"]
+                except (ValueError, KeyError, TypeError):
+                    pass
+            if width is None or height is None:
+                width, height = probe_image_size(abs_path)
+
+        return FileRecord(rel_path, stat.st_size, stat.st_mtime_ns, width, height, annotation)
+
+
+def annotation_summary(record: FileRecord) -> Optional[Dict]:
+    """
+    解析 FileRecord 中的标注摘要，非标注文件返回 None。
+    """
+    return json.loads(record.annotation) if record.annotation else None
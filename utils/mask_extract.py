@@ -0,0 +1,174 @@
+import os
+from collections import Counter
+from multiprocessing import Pool
+from typing import Dict, List, Optional
+
+import numpy as np
+import cv2
+from tqdm import tqdm
+
+from format_trans.annotation_io import load_annotation
+
+
+# '__mask__' 区域掩码图的保存格式：png 为 1 位深度的黑白 PNG，npz 为按位压缩后的 numpy 数组
+MASK_FORMATS = ("png", "npz")
+
+
+def region_mask_polygons(annotations: Dict) -> List[np.ndarray]:
+    """
+    :return: 返回 Labelme 标注中 '__mask__' 类别多边形的顶点数组列表
+    """
+    return [np.array(shape['points'], dtype=np.int32) for shape in annotations['shapes'] if shape['label'] == '__mask__']
+
+
+def _boxes_overlap(polygons: List[np.ndarray]) -> bool:
+    # 判断多边形的外接矩形之间是否存在重叠
+    boxes = np.array([np.concatenate([points.min(axis=0), points.max(axis=0)]) for points in polygons])
+    overlap_x = (boxes[:, None, 0] <= boxes[None, :, 2]) & (boxes[None, :, 0] <= boxes[:, None, 2])
+    overlap_y = (boxes[:, None, 1] <= boxes[None, :, 3]) & (boxes[None, :, 1] <= boxes[:, None, 3])
+    overlap = overlap_x & overlap_y
+    np.fill_diagonal(overlap, False)
+    return bool(overlap.any())
+
+
+def rasterize_region_mask(polygons: List[np.ndarray], image_height: int, image_width: int) -> np.ndarray:
+    """
+    绘制 '__mask__' 区域掩码图（多边形内为 255，其余为 0）。
+
+    多边形互不重叠时一次 cv2.fillPoly 绘制全部多边形；cv2.fillPoly 对一次传入的多个多边形按奇偶规则填充，
+    重叠部分会被挖空，因此外接矩形存在重叠时逐个绘制。
+
+    :param polygons: 多边形顶点数组列表，见 region_mask_polygons
+    :param image_height: 图像高度
+    :param image_width: 图像宽度
+    :return: 返回 uint8 类型的掩码图
+    """
+    mask_region = np.zeros((image_height, image_width), dtype=np.uint8)
+    if len(polygons) > 1 and _boxes_overlap(polygons):
+        for points in polygons:
+            cv2.fillPoly(mask_region, [points], 255)
+    elif polygons:
+        cv2.fillPoly(mask_region, polygons, 255)
+    return mask_region
+
+
+def mask_file_path(mask_dir: str, labelme_file_path: str, mask_format: str = "png") -> str:
+    """
+    :return: 返回标注文件对应的掩码图路径，例如 "img1.json" -> "{mask_dir}/img1_mask.png"
+    """
+    stem = os.path.splitext(os.path.basename(labelme_file_path))[0]
+    return os.path.join(mask_dir, stem + '_mask.' + mask_format)
+
+
+def save_region_mask(mask_region: np.ndarray, path: str):
+    """
+    按文件扩展名（.png 或 .npz）保存掩码图，先写入临时文件再替换。
+    """
+    tmp_path = "{}.{}.tmp{}".format(os.path.splitext(path)[0], os.getpid(), os.path.splitext(path)[1])
+    if path.endswith('.npz'):
+        np.savez_compressed(tmp_path, mask=np.packbits(mask_region > 0), shape=np.array(mask_region.shape, dtype=np.int64))
+    else:
+        success, buffer = cv2.imencode('.png', mask_region, [cv2.IMWRITE_PNG_BILEVEL, 1])
+        if not success:
+            raise ValueError("Failed to encode mask {}".format(path))
+        buffer.tofile(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_region_mask(path: str) -> Optional[np.ndarray]:
+    """
+    读取 save_region_mask 保存的掩码图。
+
+    :return: 返回 0/255 的 uint8 掩码图，文件无法读取时返回 None
+    """
+    try:
+        if path.endswith('.npz'):
+            with np.load(path) as data:
+                height, width = (int(value) for value in data["shape"])
+                mask_region = np.unpackbits(data["mask"], count=height * width).reshape(height, width)
+                mask_region *= 255
+                return mask_region
+        mask_region = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        if mask_region is None:
+            return None
+        mask_region[mask_region > 0] = 255
+        return mask_region
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def find_region_mask(mask_dir: str, labelme_file_path: str, image_height: int, image_width: int) -> Optional[np.ndarray]:
+    """
+    在 mask_dir 中查找标注文件对应的预先生成的 '__mask__' 区域掩码图。
+
+    :return: 返回 0/255 的 uint8 掩码图；不存在、早于标注文件（标注已修改）或尺寸不符时返回 None
+    """
+    json_mtime = os.stat(labelme_file_path).st_mtime_ns
+    for mask_format in MASK_FORMATS:
+        path = mask_file_path(mask_dir, labelme_file_path, mask_format)
+        try:
+            if os.stat(path).st_mtime_ns < json_mtime:
+                continue
+        except OSError:
+            continue
+        mask_region = load_region_mask(path)
+        if mask_region is not None and mask_region.shape == (image_height, image_width):
+            return mask_region
+    return None
+
+
+def extract_mask(labelme_file_path: str, mask_dir: str, mask_format: str = "png", overwrite: bool = False) -> str:
+    """
+    根据 Labelme 标注中的 '__mask__' 多边形生成单张图像的区域掩码图，图像尺寸取自标注中的 imageHeight、imageWidth。
+
+    :param labelme_file_path: Labelme 标注文件路径
+    :param mask_dir: 掩码图输出文件夹
+    :param mask_format: 保存格式，见 MASK_FORMATS
+    :param overwrite: 是否重新生成已是最新的掩码图
+    :return: 返回处理结果："written" 已生成、"skipped" 已是最新
+    """
+    path = mask_file_path(mask_dir, labelme_file_path, mask_format)
+    if not overwrite and os.path.exists(path) and os.stat(path).st_mtime_ns >= os.stat(labelme_file_path).st_mtime_ns:
+        return "skipped"
+
+    annotations = load_annotation(labelme_file_path)
+    mask_region = rasterize_region_mask(region_mask_polygons(annotations), annotations['imageHeight'], annotations['imageWidth'])
+    save_region_mask(mask_region, path)
+
+    return "written"
+
+
+def _extract_mask_job(job):
+    labelme_file_path, mask_dir, mask_format, overwrite = job
+    try:
+        return extract_mask(labelme_file_path, mask_dir, mask_format, overwrite)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        tqdm.write("Failed to extract mask from {}: {}".format(labelme_file_path, e))
+        return "failed"
+
+
+def extract_masks(label_dir: str, mask_dir: str, mask_format: str = "png", workers: int = None, overwrite: bool = False) -> Counter:
+    """
+    使用进程池为文件夹中的所有 Labelme 标注文件生成 '__mask__' 区域掩码图。
+
+    :param label_dir: 标注文件夹
+    :param mask_dir: 掩码图输出文件夹
+    :param mask_format: 保存格式，见 MASK_FORMATS
+    :param workers: 进程数量，默认为 CPU 核数，为 0 时在当前进程中执行
+    :param overwrite: 是否重新生成已是最新的掩码图
+    :return: 返回各处理结果（written、skipped、failed）的数量
+    """
+    if mask_format not in MASK_FORMATS:
+        raise ValueError("Unknown mask format: {}, expected one of {}".format(mask_format, ", ".join(MASK_FORMATS)))
+
+    os.makedirs(mask_dir, exist_ok=True)
+    jobs = [(os.path.join(label_dir, name), mask_dir, mask_format, overwrite)
+            for name in sorted(os.listdir(label_dir)) if name.endswith('.json')]
+
+    if workers == 0:
+        results = map(_extract_mask_job, jobs)
+        return Counter(tqdm(results, total=len(jobs), desc="Extracting masks"))
+
+    with Pool(workers) as pool:
+        results = pool.imap_unordered(_extract_mask_job, jobs, chunksize=16)
+        return Counter(tqdm(results, total=len(jobs), desc="Extracting masks"))
@@ -0,0 +1,203 @@
+import os
+import time
+import contextlib
+from collections import Counter
+from typing import Dict, Optional
+
+from format_trans.annotation_io import dumps
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+
+# 融合任务的处理阶段，按执行顺序排列：读取原始图像、加载样本、解析标注并生成可粘贴区域、选择位置、合成样本、编码图像、写出文件
+STAGES = ("decode", "load_samples", "free_space", "placement", "composite", "encode", "write")
+
+# 支持的性能分析器，见 profile_session
+PROFILERS = ("cprofile", "pyinstrument")
+
+
+class TaskMetrics:
+    """
+    单个融合任务的分阶段耗时（秒）与计数（放置尝试次数、缓存命中次数、写出字节数等），以及因放不下而放弃的样本文件名。
+    """
+
+    def __init__(self):
+        self.stages = dict()
+        self.counters = Counter()
+        self.dropped_samples = list()
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """
+        统计 with 语句块的耗时，累加到 name 阶段，语句块抛出异常时同样计入。
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] += n
+
+    def to_dict(self) -> Dict:
+        return {"stages": dict(self.stages), "counters": dict(self.counters)}
+
+
+def _ratio(numerator: float, denominator: float) -> str:
+    return "{:.1f}%".format(numerator / denominator * 100) if denominator else "-"
+
+
+class RunLog:
+    """
+    融合任务执行结果的 JSON Lines 运行记录与汇总：每个任务一行，记录状态、分阶段耗时与计数；
+    每个数据集划分结束时追加一行汇总，并可输出汇总表。
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        :param path: 运行记录文件路径（可选），为空时只汇总不写出；文件已存在时追加写入
+        """
+        self.file = open(path, 'ab') if path else None
+        self.splits = dict()
+
+    def _split(self, split: str) -> Dict:
+        return self.splits.setdefault(split, {"status": Counter(), "stage_seconds": Counter(), "stage_max": Counter(),
+                                              "stage_tasks": Counter(), "counters": Counter(), "elapsed": 0.0})
+
+    def _write(self, record: Dict):
+        if self.file is not None:
+            self.file.write(dumps(record, compact=True) + b"\n")
+            self.file.flush()
+
+    def add(self, split: str, result: Dict):
+        """
+        记录一次任务尝试的执行结果。
+
+        :param split: 数据集划分
+        :param result: run_fusion_tasks 输出的执行结果
+        """
+        metrics = result.get("metrics") or {"stages": {}, "counters": {}}
+        totals = self._split(split)
+        totals["status"][result["status"]] += 1
+        totals["elapsed"] += result["elapsed"]
+        for stage, seconds in metrics["stages"].items():
+            totals["stage_seconds"][stage] += seconds
+            totals["stage_tasks"][stage] += 1
+            totals["stage_max"][stage] = max(totals["stage_max"][stage], seconds)
+        totals["counters"].update(metrics["counters"])
+
+        self._write({"type": "task", "split": split, "index": result["index"], "attempt": result["attempt"],
+                     "fused_image_name": result["fused_image_name"], "status": result["status"], "elapsed": result["elapsed"],
+                     "stages": metrics["stages"], "counters": metrics["counters"], "dropped_samples": result.get("dropped_samples") or [],
+                     "peak_rss_mb": result.get("peak_rss_mb"), "time": time.time()})
+
+    def summary(self, split: str) -> Dict:
+        """
+        :return: 返回数据集划分的汇总：各状态任务数量、各阶段总耗时与最大耗时（秒）、计数合计
+        """
+        totals = self._split(split)
+        return {"status": dict(totals["status"]), "elapsed": totals["elapsed"],
+                "stages": {stage: {"total": totals["stage_seconds"][stage], "tasks": totals["stage_tasks"][stage],
+                                   "max": totals["stage_max"][stage]} for stage in self._stage_names(totals)},
+                "counters": dict(totals["counters"])}
+
+    def write_summary(self, split: str):
+        """
+        追加数据集划分的汇总记录。
+        """
+        self._write(dict(self.summary(split), type="summary", split=split, time=time.time()))
+
+    @staticmethod
+    def _stage_names(totals: Dict):
+        return [stage for stage in STAGES if stage in totals["stage_seconds"]] + \
+               sorted(stage for stage in totals["stage_seconds"] if stage not in STAGES)
+
+    def summary_table(self, split: str, desc: str = None) -> str:
+        """
+        :return: 返回数据集划分的汇总表：各阶段耗时、放置成功率、缓存命中率与写出字节数
+        """
+        totals = self._split(split)
+        status, counters = totals["status"], totals["counters"]
+        stage_total = sum(totals["stage_seconds"].values())
+
+        lines = ["{}: {} tasks ({})".format(desc or split, sum(status.values()),
+                                            ", ".join("{} {}".format(name, count) for name, count in sorted(status.items())))]
+        lines.append("{:<14}{:>12}{:>12}{:>12}{:>8}".format("stage", "total(s)", "mean(ms)", "max(ms)", "share"))
+        for stage in self._stage_names(totals):
+            seconds = totals["stage_seconds"][stage]
+            lines.append("{:<14}{:>12.2f}{:>12.1f}{:>12.1f}{:>8}".format(
+                stage, seconds, seconds / totals["stage_tasks"][stage] * 1000, totals["stage_max"][stage] * 1000, _ratio(seconds, stage_total)))
+
+        attempts = counters["placement_attempts"]
+        lines.append("placement: {} attempts, {} placed ({}), {} dropped, {} coarse candidates rejected, {} exact solves".format(
+            attempts, counters["placed"], _ratio(counters["placed"], attempts), counters["dropped"],
+            counters["coarse_rejections"], counters["exact_solves"]))
+
+        mask_lookups = counters["mask_cache_hits"] + counters["mask_cache_misses"]
+        sample_lookups = counters["shared_sample_hits"] + counters["sample_cache_hits"] + counters["sample_cache_misses"]
+        lines.append("mask cache: {} hit rate ({} lookups, {} disk hits); sample cache: {} hit rate ({} lookups, {} shared)".format(
+            _ratio(counters["mask_cache_hits"], mask_lookups), mask_lookups, counters["mask_disk_hits"],
+            _ratio(counters["shared_sample_hits"] + counters["sample_cache_hits"], sample_lookups), sample_lookups,
+            counters["shared_sample_hits"]))
+
+        written = counters["bytes_written"]
+        lines.append("written: {:.1f} MB ({:.1f} KB per image)".format(
+            written / (1024 * 1024), written / 1024 / status["ok"] if status["ok"] else 0.0))
+        return "\n".join(lines)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+@contextlib.contextmanager
+def profile_session(profiler: Optional[str], path: str):
+    """
+    对 with 语句块进行性能分析，结束时写出分析结果。
+
+    :param profiler: 性能分析器，见 PROFILERS；为空时不进行分析。cprofile 写出 {path}.prof（可用 snakeviz 等工具查看），
+                     pyinstrument（需另行安装）写出 {path}.txt 与 {path}.html
+    :param path: 分析结果文件路径（不含扩展名），所在文件夹不存在时自动创建
+    """
+    if not profiler:
+        yield
+        return
+
+    if profiler not in PROFILERS:
+        raise ValueError("Unknown profiler: {}, expected one of {}".format(profiler, ", ".join(PROFILERS)))
+    if profiler == "pyinstrument" and pyinstrument is None:
+        raise ImportError("pyinstrument is not installed, run `pip install pyinstrument` or set profiler to cprofile")
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    if profiler == "cprofile":
+        import cProfile
+        session = cProfile.Profile()
+        session.enable()
+        try:
+            yield
+        finally:
+            session.disable()
+            session.dump_stats(path + ".prof")
+    else:
+        session = pyinstrument.Profiler()
+        session.start()
+        try:
+            yield
+        finally:
+            session.stop()
+            with open(path + ".txt", 'w', encoding='utf-8') as f:
+                f.write(session.output_text())
+            with open(path + ".html", 'w', encoding='utf-8') as f:
+                f.write(session.output_html())
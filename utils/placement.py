@@ -0,0 +1,417 @@
+import os
+import copy
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import cv2
+
+from format_trans.annotation_io import load_annotation
+from utils.cache import ByteLRUCache
+from utils.mask_extract import MASK_FORMATS, find_region_mask, mask_file_path, rasterize_region_mask, region_mask_polygons
+
+
+# 多个样本的放置方式：greedy 按样本顺序逐个随机放置（见 FreeSpace.place），packed 按面积从大到小一次性规划（见 FreeSpace.plan）
+PLACEMENT_MODES = ("greedy", "packed")
+
+
+def build_free_space_mask(annotations: Dict, image_height: int, image_width: int, region_mask: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    根据 Labelme 标注生成可粘贴区域掩码图（255 为可粘贴，0 为不可粘贴）。
+
+    若存在 '__mask__' 类别，则仅 '__mask__' 多边形区域可粘贴；否则整幅图像可粘贴。
+    非 '__mask__' 类别目标的最小外接矩形区域始终不可粘贴，避免覆盖既有目标。
+
+    :param annotations: Labelme 标注内容
+    :param image_height: 原始图像高度
+    :param image_width: 原始图像宽度
+    :param region_mask: 预先生成的 '__mask__' 区域掩码图（可选，见 utils.mask_extract），存在时不再绘制 '__mask__' 多边形，会被原地修改
+    :return: 返回 uint8 类型的掩码图
+    """
+    mask_polygons = region_mask_polygons(annotations)
+
+    # 如果存在 '__mask__' 类别，则将掩码图像初始化为全 0，只将 '__mask__' 区域设置为 255
+    if mask_polygons:
+        mask_region = region_mask if region_mask is not None else rasterize_region_mask(mask_polygons, image_height, image_width)
+    else:
+        mask_region = np.full((image_height, image_width), 255, dtype=np.uint8)
+
+    # 根据非 '__mask__' 类别目标的最小外接矩形框更新掩码图，将这些区域置为 0
+    for shape in annotations['shapes']:
+        if shape['label'] != '__mask__':
+            points = np.array(shape['points'], dtype=np.int32)
+            xmin, ymin = np.maximum(np.min(points, axis=0), 0)
+            xmax, ymax = np.max(points, axis=0)
+            mask_region[ymin:ymax, xmin:xmax] = 0
+
+    return mask_region
+
+
+def compute_integral_image(mask_region: np.ndarray) -> np.ndarray:
+    """
+    计算掩码图的积分图（summed-area table），积分图中每个元素为其左上方可粘贴像素的个数。
+
+    :param mask_region: 掩码图，非 0 为可粘贴
+    :return: 返回形状为 (H+1, W+1) 的 int32 积分图
+    """
+    return cv2.integral((mask_region > 0).view(np.uint8), sdepth=cv2.CV_32S)
+
+
+def find_feasible_positions(integral: np.ndarray, sample_height: int, sample_width: int) -> Optional[np.ndarray]:
+    """
+    一次性向量化计算样本图像所有可行的左上角粘贴位置。
+
+    对每个候选左上角 (y, x)，利用积分图在 O(1) 内求出 sample_height x sample_width 窗口内可粘贴像素个数，
+    当且仅当个数等于窗口面积时该位置可行。
+
+    :param integral: compute_integral_image 得到的积分图
+    :param sample_height: 样本图像高度
+    :param sample_width: 样本图像宽度
+    :return: 返回形状为 (H-h+1, W-w+1) 的布尔数组，样本大于图像时返回 None
+    """
+    image_height, image_width = integral.shape[0] - 1, integral.shape[1] - 1
+    if sample_height <= 0 or sample_width <= 0 or sample_height > image_height or sample_width > image_width:
+        return None
+
+    window_sum = integral[sample_height:, sample_width:] - integral[:-sample_height, sample_width:]
+    window_sum -= integral[sample_height:, :-sample_width]
+    window_sum += integral[:-sample_height, :-sample_width]
+
+    return window_sum == sample_height * sample_width
+
+
+def choose_position(feasible: Optional[np.ndarray], rng: Optional[np.random.Generator] = None) -> Optional[Tuple[int, int]]:
+    """
+    在所有可行位置中均匀随机选择一个左上角位置。
+
+    先按行统计可行位置个数，再定位第 k 个可行位置，避免生成 (N, 2) 的坐标数组。
+
+    :param feasible: find_feasible_positions 得到的布尔数组
+    :param rng: numpy 随机数生成器（可选），默认使用 np.random 全局状态
+    :return: 返回 (y_offset, x_offset)，没有可行位置时返回 None
+    """
+    if feasible is None:
+        return None
+
+    row_counts = np.count_nonzero(feasible, axis=1)
+    cumulative_counts = np.cumsum(row_counts)
+    total = int(cumulative_counts[-1]) if cumulative_counts.size else 0
+    if total == 0:
+        return None
+
+    k = int(rng.integers(total)) if rng is not None else np.random.randint(total)
+    y_offset = int(np.searchsorted(cumulative_counts, k, side='right'))
+    k -= int(cumulative_counts[y_offset - 1]) if y_offset > 0 else 0
+    x_offset = int(np.flatnonzero(feasible[y_offset])[k])
+
+    return y_offset, x_offset
+
+
+def corner_positions(feasible: Optional[np.ndarray]) -> Optional[np.ndarray]:
+    """
+    保留可行位置中上方与左方相邻位置均不可行的位置，即样本的上边与左边紧贴障碍、已放置的样本或图像边界，
+    与空闲矩形装箱中的角点放置相同，依次放置的样本紧密排列，留下的可粘贴区域更完整。
+    存在可行位置时至少保留最上方一行中最左侧的位置。
+
+    :param feasible: find_feasible_positions 得到的布尔数组
+    :return: 返回同形状的布尔数组
+    """
+    if feasible is None:
+        return None
+    corners = feasible.copy()
+    corners[1:] &= ~feasible[:-1]
+    corners[:, 1:] &= ~feasible[:, :-1]
+    return corners
+
+
+def unpack_mask(packed_mask: np.ndarray, image_height: int, image_width: int) -> np.ndarray:
+    """
+    将 np.packbits 按位压缩的掩码图还原为 0/255 的 uint8 掩码图。
+    """
+    mask_region = np.unpackbits(packed_mask, count=image_height * image_width).reshape(image_height, image_width)
+    mask_region *= 255
+    return mask_region
+
+
+def build_coarse_grid(mask_region: np.ndarray, cell: int) -> np.ndarray:
+    """
+    将掩码图按 cell x cell 的网格下采样为粗网格占用图：只有整个网格单元都可粘贴时该单元才为 1。
+    图像边缘不足一个完整单元的部分记为不可粘贴。
+
+    :param mask_region: 掩码图，非 0 为可粘贴
+    :param cell: 网格单元边长（像素）
+    :return: 返回形状为 (ceil(H/cell), ceil(W/cell)) 的 uint8 粗网格占用图
+    """
+    image_height, image_width = mask_region.shape
+    full_rows, full_cols = image_height // cell, image_width // cell
+
+    grid = np.zeros((-(-image_height // cell), -(-image_width // cell)), dtype=np.uint8)
+    blocks = mask_region[:full_rows * cell, :full_cols * cell].reshape(full_rows, cell, full_cols, cell)
+    grid[:full_rows, :full_cols] = blocks.min(axis=(1, 3)) > 0
+
+    return grid
+
+
+def _random_integer(n: int, rng: Optional[np.random.Generator] = None) -> int:
+    return int(rng.integers(n)) if rng is not None else np.random.randint(n)
+
+
+class FreeSpace:
+    """
+    单幅原始图像的可粘贴区域，由全分辨率掩码图和粗网格占用图组成。
+
+    放置样本时优先在粗网格上计算可行位置：样本覆盖的所有网格单元都完全可粘贴时，单元内任意偏移都必然可行，
+    因此只需在很小的粗网格积分图上求解，再在全分辨率掩码图上校验选中的窗口；粗网格上没有可行位置时
+    （例如可粘贴区域狭窄），退回到全分辨率积分图上精确求解。
+    """
+
+    def __init__(self, mask_region: np.ndarray, cell: int = 8, coarse: Optional[np.ndarray] = None):
+        """
+        :param mask_region: 全分辨率掩码图，会被原地更新
+        :param cell: 粗网格单元边长（像素），小于等于 1 时只使用全分辨率精确求解
+        :param coarse: 与 mask_region 对应的粗网格占用图（可选），为空时根据 mask_region 计算
+        """
+        self.mask_region = mask_region
+        self.cell = cell if cell and cell > 1 else 0
+        if self.cell:
+            self.coarse = coarse if coarse is not None else build_coarse_grid(mask_region, self.cell)
+        else:
+            self.coarse = None
+        # 粗网格上选中但未通过全分辨率校验的候选位置数量，以及退回全分辨率精确求解的次数
+        self.coarse_rejections = 0
+        self.exact_solves = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self.mask_region.nbytes + (self.coarse.nbytes if self.coarse is not None else 0)
+
+    def place(self, sample_height: int, sample_width: int, rng: Optional[np.random.Generator] = None) -> Optional[Tuple[int, int]]:
+        """
+        为样本图像随机选择一个完全位于可粘贴区域内的位置，并将该区域标记为已占用。
+
+        :param sample_height: 样本图像高度
+        :param sample_width: 样本图像宽度
+        :param rng: numpy 随机数生成器（可选）
+        :return: 返回 (y_offset, x_offset)，无法放置时返回 None
+        """
+        position = self._place_coarse(sample_height, sample_width, rng) if self.cell else None
+        if position is None:
+            self.exact_solves += 1
+            integral = compute_integral_image(self.mask_region)
+            position = choose_position(find_feasible_positions(integral, sample_height, sample_width), rng)
+
+        if position is not None:
+            self.occupy(position[0], position[1], sample_height, sample_width)
+
+        return position
+
+    def plan(self, sample_sizes: List[Tuple[int, int]], rng: Optional[np.random.Generator] = None) -> List[Optional[Tuple[int, int]]]:
+        """
+        为多个样本图像一次性规划互不重叠的粘贴位置，规划完成后将所有选中区域标记为已占用。
+
+        样本按面积从大到小依次放置，并在角点位置（见 corner_positions）中随机选择，大样本紧贴边界先占位、小样本填充剩余空隙；
+        可粘贴区域放不下全部样本时，再按面积从小到大规划一次，取放置样本更多的方案。
+        粗网格与全分辨率积分图均只计算一次，已规划的样本不写回掩码图，而是在可行位置图上排除与其重叠的左上角，
+        避免每放置一个样本都重新计算积分图。
+
+        :param sample_sizes: 各样本图像的 (高度, 宽度)
+        :param rng: numpy 随机数生成器（可选）
+        :return: 按 sample_sizes 的顺序返回各样本的 (y_offset, x_offset)，无法放置的样本为 None
+        """
+        integrals = {"coarse": compute_integral_image(self.coarse) if self.cell else None, "exact": None}
+        order = sorted(range(len(sample_sizes)), key=lambda i: -sample_sizes[i][0] * sample_sizes[i][1])
+
+        positions = self._plan_order(sample_sizes, order, rng, integrals)
+        if None in positions and len(positions) > 1:
+            smallest_first = self._plan_order(sample_sizes, order[::-1], rng, integrals)
+            if sum(position is not None for position in smallest_first) > sum(position is not None for position in positions):
+                positions = smallest_first
+
+        for position, (sample_height, sample_width) in zip(positions, sample_sizes):
+            if position is not None:
+                self.occupy(position[0], position[1], sample_height, sample_width)
+
+        return positions
+
+    def _plan_order(self, sample_sizes: List[Tuple[int, int]], order: List[int], rng: Optional[np.random.Generator],
+                    integrals: Dict[str, Optional[np.ndarray]]) -> List[Optional[Tuple[int, int]]]:
+        # 按 order 的顺序依次规划，不修改掩码图；全分辨率积分图在首次需要时计算并保存在 integrals 中
+        positions = [None] * len(sample_sizes)
+        planned = list()
+
+        for i in order:
+            sample_height, sample_width = sample_sizes[i]
+
+            position = self._place_coarse(sample_height, sample_width, rng, integrals["coarse"], planned, corners=True) if self.cell else None
+            if position is None:
+                self.exact_solves += 1
+                if integrals["exact"] is None:
+                    integrals["exact"] = compute_integral_image(self.mask_region)
+                feasible = find_feasible_positions(integrals["exact"], sample_height, sample_width)
+                if feasible is not None:
+                    # 排除与已规划样本重叠的左上角
+                    for y_offset, x_offset, height, width in planned:
+                        feasible[max(y_offset - sample_height + 1, 0):y_offset + height, max(x_offset - sample_width + 1, 0):x_offset + width] = False
+                position = choose_position(corner_positions(feasible), rng)
+
+            if position is not None:
+                positions[i] = position
+                planned.append((position[0], position[1], sample_height, sample_width))
+
+        return positions
+
+    def _place_coarse(self, sample_height: int, sample_width: int, rng: Optional[np.random.Generator] = None,
+                      coarse_integral: Optional[np.ndarray] = None, planned: List[Tuple[int, int, int, int]] = (),
+                      corners: bool = False) -> Optional[Tuple[int, int]]:
+        cell = self.cell
+
+        # 单元内偏移最大为 cell - 1，样本最多跨越的单元数
+        cells_high = (sample_height + cell - 2) // cell + 1
+        cells_wide = (sample_width + cell - 2) // cell + 1
+
+        if coarse_integral is None:
+            coarse_integral = compute_integral_image(self.coarse)
+        feasible = find_feasible_positions(coarse_integral, cells_high, cells_wide)
+        if feasible is not None:
+            # 排除与已规划样本所覆盖的网格单元重叠的单元位置（同 occupy 对粗网格的标记）
+            for y_offset, x_offset, height, width in planned:
+                feasible[max(y_offset // cell - cells_high + 1, 0):(y_offset + height - 1) // cell + 1,
+                         max(x_offset // cell - cells_wide + 1, 0):(x_offset + width - 1) // cell + 1] = False
+
+        if corners:
+            # 角点位置上样本紧贴网格单元边界放置，不再随机偏移
+            cell_position = choose_position(corner_positions(feasible), rng)
+            if cell_position is None:
+                return None
+            y_offset, x_offset = cell_position[0] * cell, cell_position[1] * cell
+        else:
+            cell_position = choose_position(feasible, rng)
+            if cell_position is None:
+                return None
+            y_offset = cell_position[0] * cell + _random_integer(cell, rng)
+            x_offset = cell_position[1] * cell + _random_integer(cell, rng)
+
+        # 在全分辨率掩码图上校验选中的窗口
+        window = self.mask_region[y_offset:y_offset + sample_height, x_offset:x_offset + sample_width]
+        if window.shape != (sample_height, sample_width) or not window.all():
+            self.coarse_rejections += 1
+            return None
+
+        return y_offset, x_offset
+
+    def occupy(self, y_offset: int, x_offset: int, sample_height: int, sample_width: int):
+        """
+        将指定窗口标记为已占用，避免后续样本粘贴在同一位置。
+        """
+        self.mask_region[y_offset:y_offset + sample_height, x_offset:x_offset + sample_width] = 0
+        if self.cell:
+            cell = self.cell
+            self.coarse[y_offset // cell:(y_offset + sample_height - 1) // cell + 1, x_offset // cell:(x_offset + sample_width - 1) // cell + 1] = 0
+
+
+class FreeSpaceMaskCache:
+    """
+    原始图像可粘贴区域掩码图的缓存。
+
+    内存中按字节预算进行 LRU 淘汰，缓存解析后的标注内容、按位压缩的掩码图及其粗网格占用图，同一原始图像被多次选中时
+    无需重新解析 Labelme 标注和绘制多边形；可选地将按位压缩的掩码图保存为 .npz 文件，供后续运行复用。
+    标注文件或预先生成的掩码图的修改时间、大小变化后缓存自动失效，不同 mask_dir 的磁盘缓存互不复用。
+    """
+
+    def __init__(self, max_bytes: int, cache_dir: Optional[str] = None, cell: int = 8, mask_dir: Optional[str] = None):
+        """
+        :param max_bytes: 内存缓存的字节预算
+        :param cache_dir: 磁盘缓存文件夹（可选），为空时不使用磁盘缓存
+        :param cell: 粗网格单元边长（像素），见 FreeSpace
+        :param mask_dir: 预先生成的 '__mask__' 区域掩码图文件夹（可选，见 utils.mask_extract）
+        """
+        self.memory = ByteLRUCache(max_bytes, sizeof=lambda entry: entry[1].nbytes + (entry[2].nbytes if entry[2] is not None else 0))
+        self.cache_dir = cache_dir
+        self.cell = cell
+        self.mask_dir = mask_dir
+        # 内存缓存未命中、从磁盘缓存读取到掩码图的次数
+        self.disk_hits = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, labelme_file_path: str, image_height: int, image_width: int) -> Tuple[Dict, FreeSpace]:
+        """
+        获取原始图像的标注内容与可粘贴区域。
+
+        :param labelme_file_path: Labelme 标注文件路径
+        :param image_height: 原始图像高度
+        :param image_width: 原始图像宽度
+        :return: 返回 (标注内容副本, 可粘贴区域)，可粘贴区域可被调用方任意修改
+        """
+        stat = os.stat(labelme_file_path)
+        key = (os.path.abspath(labelme_file_path), stat.st_mtime_ns, stat.st_size, image_height, image_width) + \
+              self._region_mask_stat(labelme_file_path)
+
+        entry = self.memory.get(key)
+        if entry is None:
+            annotations = load_annotation(labelme_file_path)
+
+            packed_mask = self._load_from_disk(key)
+            if packed_mask is None:
+                region_mask = find_region_mask(self.mask_dir, labelme_file_path, image_height, image_width) if self.mask_dir else None
+                mask_region = build_free_space_mask(annotations, image_height, image_width, region_mask)
+                packed_mask = np.packbits(mask_region > 0)
+                self._save_to_disk(key, packed_mask)
+            else:
+                self.disk_hits += 1
+                mask_region = unpack_mask(packed_mask, image_height, image_width)
+
+            coarse = build_coarse_grid(mask_region, self.cell) if self.cell and self.cell > 1 else None
+            entry = (annotations, packed_mask, coarse)
+            self.memory.put(key, entry)
+            free_space = FreeSpace(mask_region, self.cell, coarse.copy() if coarse is not None else None)
+        else:
+            annotations, packed_mask, coarse = entry
+            free_space = FreeSpace(unpack_mask(packed_mask, image_height, image_width), self.cell, coarse.copy() if coarse is not None else None)
+
+        return copy.deepcopy(annotations), free_space
+
+    def _region_mask_stat(self, labelme_file_path: str) -> Tuple[int, ...]:
+        # 预先生成的掩码图（各格式）的修改时间与大小，文件不存在时为 0，掩码图重新生成或删除后缓存失效
+        if not self.mask_dir:
+            return ()
+
+        mask_stat = list()
+        for mask_format in MASK_FORMATS:
+            try:
+                stat = os.stat(mask_file_path(self.mask_dir, labelme_file_path, mask_format))
+                mask_stat.extend((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                mask_stat.extend((0, 0))
+        return tuple(mask_stat)
+
+    def _disk_path(self, key) -> str:
+        # 文件名由标注文件路径与 mask_dir 决定，使用不同 mask_dir 的运行不会读取彼此的缓存
+        source = key[0] if not self.mask_dir else key[0] + "\0" + os.path.abspath(self.mask_dir)
+        return os.path.join(self.cache_dir, hashlib.sha1(source.encode("utf-8")).hexdigest() + ".npz")
+
+    def _load_from_disk(self, key) -> Optional[np.ndarray]:
+        if not self.cache_dir:
+            return None
+
+        path = self._disk_path(key)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with np.load(path) as data:
+                if tuple(data["source"]) != key[1:]:
+                    return None
+                return data["mask"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _save_to_disk(self, key, packed_mask: np.ndarray):
+        if not self.cache_dir:
+            return
+
+        # 先写入临时文件再替换，避免多个工作进程同时写入时读到不完整的文件
+        path = self._disk_path(key)
+        tmp_path = "{}.{}.tmp.npz".format(path[:-4], os.getpid())
+        np.savez_compressed(tmp_path, mask=packed_mask, source=np.array(key[1:], dtype=np.int64))
+        os.replace(tmp_path, path)
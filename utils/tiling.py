@@ -0,0 +1,427 @@
+import os
+import copy
+import time
+import shutil
+import hashlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import cv2
+
+from format_trans.annotation_io import load_annotation
+from utils.cache import ByteLRUCache
+from utils.composite import load_sample_image, composite_sample
+from utils.fusion import check_deadline, place_samples
+from utils.labels import clip_annotation, write_image_labels
+from utils.mask_extract import rasterize_region_mask, region_mask_polygons
+from utils.metrics import TaskMetrics
+from utils.placement import FreeSpace, build_coarse_grid, _random_integer
+from utils.writer import encode_image
+
+
+# 分块处理模式的输出方式：tiles 只输出包含粘贴样本的分块图像及其裁剪后的标注，memmap 输出内存映射的整幅图像（.npy）与整幅标注
+TILE_OUTPUTS = ("tiles", "memmap")
+
+# 分块图像文件名附加在融合图像名称后的 "_{行}_{列}" 后缀（正则表达式），见 tile_file_name 与 utils.utils.OutputNamer
+TILE_NAME_SUFFIX = r"_\d+_\d+"
+
+# 未完成的解码缓存临时文件在该时间（秒）内不会被清理，避免删除其他工作进程正在写入的文件
+_TMP_GRACE_SECONDS = 600
+
+# 合成时在样本 ROI 四周额外读取的像素，poisson 融合会修改 ROI 外 2 个像素内的区域
+_COMPOSITE_PAD = 2
+
+
+def check_tile_options(config):
+    """
+    检查分块处理模式的配置，不支持时抛出 ValueError。
+    """
+    if not config["tile_size"]:
+        return
+    if config["tile_output"] not in TILE_OUTPUTS:
+        raise ValueError("Unknown tile output: {}, expected one of {}".format(config["tile_output"], ", ".join(TILE_OUTPUTS)))
+    if not config["placement_grid"] or config["placement_grid"] <= 1:
+        raise ValueError("Tiled processing places samples on the coarse grid, placement_grid must be greater than 1")
+
+
+def prune_image_cache(cache_dir: str, max_bytes: int, keep: str = None):
+    """
+    按最近使用时间（文件修改时间，见 open_image_memmap）删除最久未使用的解码缓存，直到总大小不超过 max_bytes。
+    已被其他进程映射的文件删除后映射仍然有效；无法删除（例如 Windows 下正在映射）的文件跳过。
+
+    :param keep: 不删除的缓存文件路径（例如刚写入的文件）
+    """
+    now = time.time()
+    entries = list()
+    for entry in os.scandir(cache_dir):
+        if not entry.name.endswith(".npy"):
+            continue
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        if ".tmp." in entry.name and now - stat.st_mtime < _TMP_GRACE_SECONDS:
+            # 正在写入的临时文件只计入大小，不删除；工作进程被强制结束后残留的临时文件超时后与缓存一起清理
+            max_bytes -= stat.st_size
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if keep is not None and os.path.abspath(path) == os.path.abspath(keep):
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+
+def open_image_memmap(image_path: str, cache_dir: Optional[str] = None, max_cache_bytes: int = 0) -> np.ndarray:
+    """
+    以内存映射方式打开原始图像，后续只按窗口读取，常驻内存与图像尺寸无关。
+
+    没有按窗口解码的图像读取库可用，图像在首次使用时仍需完整解码一次（此时需要容纳整幅图像的内存，
+    例如 20000x20000 的三通道图像约 1.2GB），保存为 cache_dir 下的未压缩 .npy 文件，之后直接映射；
+    原始图像的修改时间或大小变化后重新解码。
+
+    :param image_path: 原始图像路径
+    :param cache_dir: 解码结果的缓存文件夹（可选），为空时解码到内存中
+    :param max_cache_bytes: 缓存文件夹的大小上限（字节），写入新的缓存后删除最久未使用的缓存，为 0 时不限制
+    :return: 返回只读的 (H, W[, C]) uint8 数组
+    """
+    if not cache_dir:
+        image = cv2.imdecode(np.fromfile(image_path, dtype=np.uint8), -1)
+        if image is None:
+            raise ValueError("Failed to read image {}".format(image_path))
+        return image
+
+    stat = os.stat(image_path)
+    key = "{}:{}:{}".format(os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size)
+    path = os.path.join(cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".npy")
+
+    try:
+        image = np.load(path, mmap_mode='r')
+    except FileNotFoundError:
+        image = None
+    if image is not None:
+        # 更新修改时间作为最近使用时间（访问时间在多数文件系统上不可靠）
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return image
+
+    os.makedirs(cache_dir, exist_ok=True)
+    image = cv2.imdecode(np.fromfile(image_path, dtype=np.uint8), -1)
+    if image is None:
+        raise ValueError("Failed to read image {}".format(image_path))
+    # 先写入临时文件再替换，避免多个工作进程同时解码同一图像时读到不完整的文件
+    tmp_path = "{}.{}.tmp.npy".format(path[:-4], os.getpid())
+    np.save(tmp_path, image)
+    os.replace(tmp_path, path)
+    try:
+        mapped = np.load(path, mmap_mode='r')
+    except FileNotFoundError:
+        # 刚写入的缓存已被其他工作进程按大小上限删除，直接使用解码结果
+        return image
+    del image
+    if max_cache_bytes:
+        prune_image_cache(cache_dir, max_cache_bytes, keep=path)
+    return mapped
+
+
+def tile_windows(image_height: int, image_width: int, tile_size: int) -> List[Tuple[int, int, int, int]]:
+    """
+    :return: 返回按行排列的分块窗口 (y0, x0, 高度, 宽度)，图像右侧与下侧的分块可能小于 tile_size
+    """
+    return [(y0, x0, min(tile_size, image_height - y0), min(tile_size, image_width - x0))
+            for y0 in range(0, image_height, tile_size) for x0 in range(0, image_width, tile_size)]
+
+
+def _object_boxes(annotations: Dict) -> List[Tuple[int, int, int, int]]:
+    # 非 '__mask__' 类别目标的最小外接矩形 (xmin, ymin, xmax, ymax)，与 build_free_space_mask 相同
+    boxes = list()
+    for shape in annotations['shapes']:
+        if shape['label'] != '__mask__':
+            points = np.array(shape['points'], dtype=np.int32)
+            xmin, ymin = np.maximum(np.min(points, axis=0), 0)
+            xmax, ymax = np.max(points, axis=0)
+            boxes.append((int(xmin), int(ymin), int(xmax), int(ymax)))
+    return boxes
+
+
+def build_tiled_coarse_grid(annotations: Dict, image_height: int, image_width: int, cell: int, tile_size: int) -> np.ndarray:
+    """
+    逐块绘制可粘贴区域掩码图并下采样为粗网格占用图（见 utils.placement.build_coarse_grid），不生成整幅掩码图。
+
+    :param annotations: Labelme 标注内容
+    :param image_height: 原始图像高度
+    :param image_width: 原始图像宽度
+    :param cell: 粗网格单元边长（像素）
+    :param tile_size: 绘制掩码图的分块边长（像素），按 cell 的整数倍对齐
+    :return: 返回与整幅掩码图 build_coarse_grid 结果相同的粗网格占用图
+    """
+    polygons = region_mask_polygons(annotations)
+    boxes = _object_boxes(annotations)
+    step = max(tile_size // cell, 1) * cell
+
+    grid = np.zeros((-(-image_height // cell), -(-image_width // cell)), dtype=np.uint8)
+    for y0, x0, height, width in tile_windows(image_height, image_width, step):
+        if polygons:
+            offset = np.array([x0, y0], dtype=np.int32)
+            mask_region = rasterize_region_mask([points - offset for points in polygons], height, width)
+        else:
+            mask_region = np.full((height, width), 255, dtype=np.uint8)
+        for xmin, ymin, xmax, ymax in boxes:
+            mask_region[max(ymin - y0, 0):max(ymax - y0, 0), max(xmin - x0, 0):max(xmax - x0, 0)] = 0
+        grid[y0 // cell:y0 // cell + -(-height // cell), x0 // cell:x0 // cell + -(-width // cell)] = build_coarse_grid(mask_region, cell)
+
+    return grid
+
+
+class TiledFreeSpace:
+    """
+    只由粗网格占用图表示的可粘贴区域：以网格单元为单位在粗网格上放置样本（复用 FreeSpace 的 place 与 plan），
+    样本覆盖的网格单元都完全可粘贴，因此无需全分辨率掩码图；可粘贴区域中不足一个网格单元的狭窄部分不会被使用。
+    """
+
+    def __init__(self, coarse: np.ndarray, cell: int):
+        """
+        :param coarse: 粗网格占用图，会被原地更新
+        :param cell: 粗网格单元边长（像素）
+        """
+        self.cell = cell
+        self.space = FreeSpace(coarse, cell=0)
+
+    @property
+    def coarse_rejections(self) -> int:
+        return self.space.coarse_rejections
+
+    @property
+    def exact_solves(self) -> int:
+        return 0
+
+    def _cells(self, size: int) -> int:
+        return -(-size // self.cell)
+
+    def _to_pixels(self, cell_position: Optional[Tuple[int, int]], sample_height: int, sample_width: int,
+                   rng: Optional[np.random.Generator] = None, jitter: bool = True) -> Optional[Tuple[int, int]]:
+        # 样本在所占网格单元内的剩余空间中随机偏移
+        if cell_position is None:
+            return None
+        y_offset, x_offset = cell_position[0] * self.cell, cell_position[1] * self.cell
+        if jitter:
+            y_offset += _random_integer(self._cells(sample_height) * self.cell - sample_height + 1, rng)
+            x_offset += _random_integer(self._cells(sample_width) * self.cell - sample_width + 1, rng)
+        return y_offset, x_offset
+
+    def place(self, sample_height: int, sample_width: int, rng: Optional[np.random.Generator] = None) -> Optional[Tuple[int, int]]:
+        """
+        见 FreeSpace.place。
+        """
+        cell_position = self.space.place(self._cells(sample_height), self._cells(sample_width), rng)
+        return self._to_pixels(cell_position, sample_height, sample_width, rng)
+
+    def plan(self, sample_sizes: List[Tuple[int, int]], rng: Optional[np.random.Generator] = None) -> List[Optional[Tuple[int, int]]]:
+        """
+        见 FreeSpace.plan，样本紧贴所占网格单元的左上角放置。
+        """
+        cell_positions = self.space.plan([(self._cells(height), self._cells(width)) for height, width in sample_sizes], rng)
+        return [self._to_pixels(cell_position, height, width, jitter=False) for cell_position, (height, width) in zip(cell_positions, sample_sizes)]
+
+
+class TiledFreeSpaceCache:
+    """
+    分块处理模式下原始图像标注与粗网格占用图的缓存，按字节预算进行 LRU 淘汰，标注文件的修改时间或大小变化后自动失效。
+    """
+
+    def __init__(self, max_bytes: int, cell: int = 8, tile_size: int = 2048):
+        """
+        :param max_bytes: 缓存的字节预算
+        :param cell: 粗网格单元边长（像素）
+        :param tile_size: 绘制掩码图的分块边长（像素）
+        """
+        self.memory = ByteLRUCache(max_bytes, sizeof=lambda entry: entry[1].nbytes)
+        self.cell = cell
+        self.tile_size = tile_size
+
+    def get(self, labelme_file_path: str, image_height: int, image_width: int) -> Tuple[Dict, TiledFreeSpace]:
+        """
+        :return: 返回 (标注内容副本, 可粘贴区域)，可粘贴区域可被调用方任意修改
+        """
+        stat = os.stat(labelme_file_path)
+        key = (os.path.abspath(labelme_file_path), stat.st_mtime_ns, stat.st_size, image_height, image_width)
+
+        entry = self.memory.get(key)
+        if entry is None:
+            annotations = load_annotation(labelme_file_path)
+            entry = (annotations, build_tiled_coarse_grid(annotations, image_height, image_width, self.cell, self.tile_size))
+            self.memory.put(key, entry)
+
+        annotations, coarse = entry
+        return copy.deepcopy(annotations), TiledFreeSpace(coarse.copy(), self.cell)
+
+
+class TiledCanvas:
+    """
+    分块处理模式下的融合图像：原始图像以只读内存映射保存，合成结果以样本附近的小块补丁保存，
+    读取窗口时将与窗口相交的补丁按合成顺序覆盖到原始图像上。
+    """
+
+    def __init__(self, base: np.ndarray):
+        """
+        :param base: 原始图像，见 open_image_memmap
+        """
+        self.base = base
+        self.patches = list()
+        self.regions = list()
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self.base.shape
+
+    def read(self, y0: int, x0: int, height: int, width: int) -> np.ndarray:
+        """
+        :return: 返回融合图像中窗口 (y0, x0, 高度, 宽度) 的副本
+        """
+        window = np.array(self.base[y0:y0 + height, x0:x0 + width])
+        for patch_y, patch_x, patch in self.patches:
+            top, left = max(y0, patch_y), max(x0, patch_x)
+            bottom, right = min(y0 + height, patch_y + patch.shape[0]), min(x0 + width, patch_x + patch.shape[1])
+            if bottom > top and right > left:
+                window[top - y0:bottom - y0, left - x0:right - x0] = patch[top - patch_y:bottom - patch_y, left - patch_x:right - patch_x]
+        return window
+
+    def composite(self, sample_image: np.ndarray, sample_alpha: Optional[np.ndarray], y_offset: int, x_offset: int,
+                  blend_mode: str = "mask", feather_radius: int = 3):
+        """
+        在样本附近的窗口上合成样本（见 utils.composite.composite_sample），结果与在整幅图像上合成相同。
+        """
+        sample_height, sample_width = sample_image.shape[:2]
+        image_height, image_width = self.base.shape[:2]
+        y0, x0 = max(y_offset - _COMPOSITE_PAD, 0), max(x_offset - _COMPOSITE_PAD, 0)
+        y1 = min(y_offset + sample_height + _COMPOSITE_PAD, image_height)
+        x1 = min(x_offset + sample_width + _COMPOSITE_PAD, image_width)
+
+        window = self.read(y0, x0, y1 - y0, x1 - x0)
+        composite_sample(window, sample_image, sample_alpha, y_offset - y0, x_offset - x0, blend_mode, feather_radius)
+        self.patches.append((y0, x0, window))
+        self.regions.append((y_offset, x_offset, sample_height, sample_width))
+
+    def write_to(self, target: np.ndarray):
+        """
+        将补丁按合成顺序写入与原始图像同尺寸的数组（例如原始图像副本的内存映射）。
+        """
+        for patch_y, patch_x, patch in self.patches:
+            target[patch_y:patch_y + patch.shape[0], patch_x:patch_x + patch.shape[1]] = patch
+
+
+def paste_samples_on_tiled_image(image_path: str, sample_images_path: List[str], blend_mode: str = "mask", feather_radius: int = 3,
+                                 rng: np.random.Generator = None, deadline: float = None, free_space_cache: TiledFreeSpaceCache = None,
+                                 image_cache_dir: str = None, image_cache_bytes: int = 0, sample_loader: Callable[[str], Tuple[np.ndarray, np.ndarray]] = None,
+                                 metrics: TaskMetrics = None, placement_mode: str = "greedy") -> Tuple[TiledCanvas, Dict]:
+    """
+    分块处理模式下的 utils.fusion.paste_samples_on_image：原始图像以内存映射方式打开，可粘贴区域只保存粗网格占用图，
+    只在样本附近的窗口上合成，内存占用与原始图像尺寸基本无关，适用于超大的正射影像。
+
+    :param free_space_cache: 标注与粗网格占用图的缓存（可选），默认使用 8 像素网格单元、2048 像素分块且不缓存
+    :param image_cache_dir: 原始图像解码结果的缓存文件夹，见 open_image_memmap
+    :param image_cache_bytes: 解码结果缓存文件夹的大小上限（字节），为 0 时不限制
+    :return: 返回融合图像（TiledCanvas）和更新后的标注文件内容，其他参数见 paste_samples_on_image
+    """
+    metrics = TaskMetrics() if metrics is None else metrics
+    free_space_cache = TiledFreeSpaceCache(0) if free_space_cache is None else free_space_cache
+
+    with metrics.stage("decode"):
+        canvas = TiledCanvas(open_image_memmap(image_path, image_cache_dir, image_cache_bytes))
+    image_height, image_width = canvas.shape[:2]
+
+    sample_loader = load_sample_image if sample_loader is None else sample_loader
+    with metrics.stage("load_samples"):
+        sample_images = [sample_loader(sample_path) for sample_path in sample_images_path]
+    check_deadline(deadline)
+
+    labelme_file_path = os.path.splitext(image_path)[0] + '.json'
+    with metrics.stage("free_space"):
+        updated_annotations, free_space = free_space_cache.get(labelme_file_path, image_height, image_width)
+    updated_annotations["imageData"] = None
+    check_deadline(deadline)
+
+    place_samples(free_space, sample_images, sample_images_path, updated_annotations,
+                  lambda sample_image, sample_alpha, y_offset, x_offset: canvas.composite(
+                      sample_image, sample_alpha, y_offset, x_offset, blend_mode, feather_radius),
+                  rng=rng, deadline=deadline, metrics=metrics, placement_mode=placement_mode)
+
+    return canvas, updated_annotations
+
+
+def tile_file_name(image_name: str, row: int, col: int) -> str:
+    """
+    :return: 返回分块图像的文件名，例如 ("X1_0001.jpg", 2, 3) -> "X1_0001_2_3.jpg"
+    """
+    stem, extension = os.path.splitext(image_name)
+    return "{}_{}_{}{}".format(stem, row, col, extension)
+
+
+def tile_output_names(image_name: str, image_height: int, image_width: int, tile_size: int) -> List[str]:
+    """
+    :return: 返回融合图像所有可能写出的分块图像文件名（实际只写出包含粘贴样本的分块），用于清理未完成任务的输出
+    """
+    return [tile_file_name(image_name, y0 // tile_size, x0 // tile_size) for y0, x0, _, _ in tile_windows(image_height, image_width, tile_size)]
+
+
+def write_tiled_outputs(canvas: TiledCanvas, annotation: Dict, output_dir: str, image_name: str, config,
+                        metrics: TaskMetrics = None) -> List[Tuple[str, Dict]]:
+    """
+    按 tile_output 写出分块处理模式的融合结果：
+
+    tiles 只写出与粘贴样本相交的 tile_size 分块（文件名见 tile_file_name），标注按分块裁剪（见 utils.labels.clip_annotation）；
+    memmap 将原始图像的解码结果复制为 {image_name}（.npy），再将合成补丁写入其内存映射，标注为整幅图像的标注。
+
+    :param metrics: 任务指标（可选），记录编码、写出耗时与写出的字节数
+    :return: 返回写出的 (图像文件名, 标注内容) 列表
+    """
+    metrics = TaskMetrics() if metrics is None else metrics
+
+    if config["tile_output"] == "memmap":
+        path = os.path.join(output_dir, image_name)
+        with metrics.stage("write"):
+            copied = False
+            if isinstance(canvas.base, np.memmap):
+                try:
+                    shutil.copyfile(canvas.base.filename, path)
+                    copied = True
+                except FileNotFoundError:
+                    # 解码缓存已被其他工作进程按大小上限删除，从仍然有效的映射写出
+                    pass
+            if not copied:
+                np.save(path, canvas.base)
+            target = np.load(path, mmap_mode='r+')
+            canvas.write_to(target)
+            target.flush()
+            del target
+            label_bytes = write_image_labels(output_dir, image_name, annotation, config)
+        metrics.count("bytes_written", os.path.getsize(path) + label_bytes)
+        return [(image_name, annotation)]
+
+    tile_size = config["tile_size"]
+    image_height, image_width = canvas.shape[:2]
+    outputs = list()
+    for y0, x0, height, width in tile_windows(image_height, image_width, tile_size):
+        if not any(y < y0 + height and y + h > y0 and x < x0 + width and x + w > x0 for y, x, h, w in canvas.regions):
+            continue
+
+        tile_name = tile_file_name(image_name, y0 // tile_size, x0 // tile_size)
+        tile_annotation = clip_annotation(annotation, x0, y0, width, height, tile_name, config["clip_min_visible"])
+        with metrics.stage("encode"):
+            buffer = encode_image(canvas.read(y0, x0, height, width), config["image_format"], config["image_quality"], config["png_compression"])
+        with metrics.stage("write"):
+            buffer.tofile(os.path.join(output_dir, tile_name))
+            label_bytes = write_image_labels(output_dir, tile_name, tile_annotation, config)
+        metrics.count("bytes_written", buffer.nbytes + label_bytes)
+        outputs.append((tile_name, tile_annotation))
+
+    return outputs
@@ -1,56 +1,133 @@
 import os
-import json
+import re
 from typing import List, Tuple, Dict
 
 import csv
+import sys
 
-def count_images_with_substring(folder_path, substring):
-    # 获取文件夹中所有文件
-    all_files = os.listdir(folder_path)
+from format_trans.annotation_io import load_annotation, dump_annotation
 
-    # 筛选出包含指定字符串的文件，并统计数量
-    count = sum(1 for file in all_files if substring in file)
+try:
+    import resource
+except ImportError:  # Windows 下没有 resource 模块
+    resource = None
 
-    return count
+def peak_rss_mb():
+    """
+    获取当前进程的峰值常驻内存（MB），不支持的平台返回 None。
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 下单位为 KB，macOS 下单位为字节
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
 
-def write_image_info_to_csv(image_info_list, output_csv):
+class OutputNamer:
     """
-    将图像信息写入CSV文件，其中包含增强图像名称、融合样本数量、融合样本文件名称和融合样本增强方式。
+    为融合图像分配 "X{序号}_{原始图像文件名}" 形式的名称，同一原始图像的序号依次递增。
+
+    序号保存在内存中，只在创建时读取一次输出文件夹（续跑时从已有文件的最大序号之后继续编号），
+    不再为每张融合图像重新统计文件夹中的文件。序号按原始图像去掉扩展名后的名称计数，更换保存格式后续跑也不会重名。
+    """
+
+    def __init__(self, output_dir: str = None, suffix: str = None):
+        """
+        :param output_dir: 融合图像输出文件夹（可选），存在时以其中已有融合图像的最大序号为起点
+        :param suffix: 一个融合任务输出多个文件（分块、切片）时附加在融合图像名称后的后缀的正则表达式（可选），
+                       例如 r"_\d+_\d+"，见 reserve
+        """
+        self.counts = {}
+        self.suffix = re.compile("(.+)" + suffix + "$") if suffix else None
+        if output_dir is not None and os.path.isdir(output_dir):
+            for file_name in os.listdir(output_dir):
+                if not file_name.endswith(".json"):
+                    self.reserve(file_name)
+
+    def reserve(self, fused_image_name: str):
+        """
+        登记已分配的融合图像名称（例如运行日志中尚未写出的任务），之后不会再分配相同的序号。
+        设置了 suffix 时，名称以后缀结尾的文件（例如分块图像 "X2_frame1_0_1.jpg"）同时登记到去掉后缀的原始图像（"frame1"）；
+        无法区分后缀与原始图像名称本身的一部分，因此两者都登记，只可能跳过序号而不会重名。
+        """
+        match = re.match(r"X(\d+)_(.+)$", fused_image_name)
+        if match is not None:
+            image_names = [os.path.splitext(match.group(2))[0]]
+            suffix_match = self.suffix.match(image_names[0]) if self.suffix is not None else None
+            if suffix_match is not None:
+                image_names.append(suffix_match.group(1))
+            for image_name in image_names:
+                self.counts[image_name] = max(self.counts.get(image_name, 0), int(match.group(1)))
+
+    def next(self, image_file: str, extension: str = None) -> str:
+        """
+        分配原始图像的下一个融合图像名称。
+
+        :param image_file: 原始图像文件名
+        :param extension: 融合图像的文件扩展名（可选），例如 ".png"，默认沿用原始图像的扩展名
+        :return: 返回融合图像文件名，例如 "X3_0001.jpg"
+        """
+        image_name, image_extension = os.path.splitext(image_file)
+        count = self.counts.get(image_name, 0) + 1
+        self.counts[image_name] = count
+        return f"X{count}_{image_name}{image_extension if extension is None else extension}"
+
 
-    :param image_info_list: 输入的列表，包含原始图像名称和对应的抠图文件名称。
-    :param output_csv: 输出的CSV文件名称，默认为'image_info.csv'。
+class TaskResultsCSV:
     """
-    # 创建用于记录原始图像名称出现次数的字典
-    image_count = {}
+    逐条写入融合任务执行结果的CSV文件，每写入一行立即刷新，运行过程中即可查看已完成的任务。
+    """
+
+    HEADER = ['增强图像名称', '融合样本数量', '融合样本文件名称', '融合样本增强方式', '任务状态', '耗时(秒)', '计算耗时(秒)', '写出耗时(秒)', '进程峰值内存(MB)',
+              '未放置样本文件名称']
+
+    def __init__(self, output_csv):
+        """
+        :param output_csv: 输出的CSV文件名称
+        """
+        self.file = open(output_csv, mode='w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(self.HEADER)
+        self.file.flush()
+
+    def write(self, result):
+        """
+        写入一次任务尝试的执行结果。
+
+        :param result: run_fusion_tasks 输出的执行结果
+        """
+        samples = result["sample_files"]
+        sample_file_names = ', '.join(samples)
+        enhancement_methods = ', '.join([sample.split('_')[-1].replace('.png', '') for sample in samples])
 
-    # 打开CSV文件进行写入
-    with open(output_csv, mode='w', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        # 写入CSV文件头
-        writer.writerow(['增强图像名称', '融合样本数量', '融合样本文件名称', '融合样本增强方式'])
+        self.writer.writerow([result["fused_image_name"], len(samples), sample_file_names, enhancement_methods,
+                              result["status"], "{:.2f}".format(result["elapsed"]),
+                              "{:.2f}".format(result["compute_seconds"]) if result.get("compute_seconds") is not None else "",
+                              "{:.2f}".format(result["write_seconds"]) if result.get("write_seconds") is not None else "",
+                              "{:.0f}".format(result["peak_rss_mb"]) if result.get("peak_rss_mb") is not None else "",
+                              ', '.join(result.get("dropped_samples") or [])])
+        self.file.flush()
 
-        # 遍历输入的图像信息列表
-        for image_info in image_info_list:
-            for original_image, samples in image_info.items():
-                # 获取原始图像的序号
-                count = image_count.get(original_image, 0) + 1
-                image_count[original_image] = count
-                enhanced_image_name = f"X{count}_{original_image}"
+    def close(self):
+        self.file.close()
 
-                # 获取融合样本数量
-                sample_count = len(samples)
+    def __enter__(self):
+        return self
 
-                # 获取每个样本文件名称及其增强方式
-                sample_file_names = ', '.join(samples)
-                enhancement_methods = ', '.join([sample.split('_')[-1].replace('.png', '') for sample in samples])
+    def __exit__(self, *exc_info):
+        self.close()
 
-                # 写入CSV文件行
-                writer.writerow([enhanced_image_name, sample_count, sample_file_names, enhancement_methods])
 
-def remove_mask_annotations(input_json_path, output_json_path):
+def remove_mask_annotations(input_json_path, output_json_path=None, compact=False):
+    """
+    去掉 Labelme 标注中类别为 '__mask__' 的区域。
+
+    :param input_json_path: 原始标注文件路径
+    :param output_json_path: 输出标注文件路径（可选），为空时只返回结果不写出
+    :param compact: 是否以紧凑格式写出
+    :return: 返回去掉 '__mask__' 区域后的标注内容
+    """
     # 读取原始的json文件
-    with open(input_json_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    data = load_annotation(input_json_path)
     
     # 保留不为'__mask__'的标注
     filtered_shapes = [shape for shape in data['shapes'] if shape['label'] != '__mask__']
@@ -59,5 +136,7 @@ def remove_mask_annotations(input_json_path, output_json_path):
     data['shapes'] = filtered_shapes
     
     # 将新的数据写入到新的json文件
-    with open(output_json_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
\ No newline at end of file
+    if output_json_path is not None:
+        dump_annotation(data, output_json_path, compact=compact)
+
+    return data
\ No newline at end of file
@@ -0,0 +1,84 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+import cv2
+import numpy as np
+
+
+# 融合图像支持的保存格式 -> 文件扩展名
+IMAGE_FORMATS = {"jpg": ".jpg", "png": ".png", "webp": ".webp"}
+
+
+def encode_image(image: np.ndarray, image_format: str = "jpg", quality: int = 95, png_compression: int = 1) -> np.ndarray:
+    """
+    按指定格式编码图像。
+
+    :param image: BGR 图像
+    :param image_format: 保存格式，见 IMAGE_FORMATS
+    :param quality: jpg、webp 格式的保存质量（1-100）
+    :param png_compression: png 格式的压缩级别（0-9）
+    :return: 返回编码后的字节数组，可直接 tofile 写出
+    """
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError("Unknown image format: {}, expected one of {}".format(image_format, ", ".join(IMAGE_FORMATS)))
+
+    if image_format == "jpg":
+        params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+    elif image_format == "webp":
+        params = [cv2.IMWRITE_WEBP_QUALITY, int(quality)]
+    else:
+        params = [cv2.IMWRITE_PNG_COMPRESSION, int(png_compression)]
+
+    success, buffer = cv2.imencode(IMAGE_FORMATS[image_format], image, params)
+    if not success:
+        raise ValueError("Failed to encode image as {}".format(image_format))
+
+    return buffer
+
+
+class AsyncWriter:
+    """
+    后台写出线程池：图像编码与文件写出在后台线程中执行，计算线程提交后即可继续处理下一个任务。
+
+    等待写出的任务数量不超过 queue_size，写出跟不上计算时提交会阻塞，避免待写出的图像占满内存。
+    """
+
+    def __init__(self, threads: int = 2, queue_size: int = 4):
+        """
+        :param threads: 写出线程数量，为 0 时在调用线程中同步写出
+        :param queue_size: 等待写出（包括正在写出）的任务数量上限
+        """
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="writer") if threads > 0 else None
+        self.slots = threading.BoundedSemaphore(max(queue_size, 1))
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """
+        提交写出任务，队列已满时阻塞等待。
+
+        :return: 返回写出任务的 Future
+        """
+        if self.executor is None:
+            future = Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        self.slots.acquire()
+        try:
+            future = self.executor.submit(fn, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+
+        return future
+
+    def close(self):
+        """
+        等待所有写出任务完成并结束写出线程。
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)